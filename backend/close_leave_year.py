@@ -0,0 +1,51 @@
+"""Year-end leave closing: carry unused leave into the next leave year.
+
+Writes an opening balance for every employee and leave type of `year + 1`,
+capped by each policy's carry_forward_cap. Progress is checkpointed, so an
+interrupted run picks up where it stopped when started again.
+
+    python close_leave_year.py 2025
+    python close_leave_year.py 2025 --restart   # recompute, e.g. after a policy change
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+# server reads its settings (LEAVE_YEAR_CLOSE_BATCH, ...) at import time
+load_dotenv(ROOT_DIR / '.env')
+
+import server  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Close a leave year and write next year's opening balances")
+    parser.add_argument("year", type=int)
+    parser.add_argument("--mongo-url", default=None, help="defaults to MONGO_URL")
+    parser.add_argument("--db-name", default=None, help="defaults to DB_NAME")
+    parser.add_argument("--batch-size", type=int, default=server.LEAVE_YEAR_CLOSE_BATCH)
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    client = AsyncIOMotorClient(args.mongo_url or os.environ['MONGO_URL'])
+    server.db = client[args.db_name or os.environ['DB_NAME']]
+    try:
+        started = time.perf_counter()
+        await server.ensure_indexes()
+        state = await server.close_leave_year(args.year, args.batch_size, args.restart)
+        print(f"Leave year {args.year} {state['status']}: {state['processed']:,} employees "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
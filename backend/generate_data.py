@@ -0,0 +1,381 @@
+"""Synthetic HRMS data generator for load and scale testing.
+
+Produces departments, a deep reporting hierarchy, payroll structures with
+varied salary_types, multi-year payslips, leave policies and assignments,
+holidays and leave requests. Output is fully determined by --seed and the size
+profile, so benchmarks and profiling runs can share one dataset. Documents are
+streamed in batches and written with concurrent unordered insert_many calls.
+
+    python generate_data.py --profile large --seed 7 --drop
+    python generate_data.py --employees 2500 --years 2 --db-name hrms_profiling --drop
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+
+ROOT_DIR = Path(__file__).parent
+
+COLLECTIONS = [
+    "departments", "employees", "payroll_structures", "payroll", "payslips", "payslip_archive", "print_formats",
+    "leave_policies", "employee_policy_assignments", "leave_requests", "leave_balances", "leave_year_closings",
+    "holidays", "users", "tombstones", "jobs", "idempotency_keys", "cache_versions",
+]
+
+# Payslips are generated up to this month so the same seed always yields the same data
+LAST_MONTH = date(2025, 12, 1)
+
+EARNINGS = ["Basic Salary", "HRA", "Conveyance", "Special Allowance", "Medical Allowance", "Bonus"]
+DEDUCTIONS = ["Provident Fund", "Professional Tax", "TDS", "Health Insurance"]
+LEAVE_TYPES = ["Casual Leave", "Sick Leave", "Earned Leave", "Maternity Leave", "Paternity Leave"]
+DEPARTMENTS = ["Engineering", "Sales", "Marketing", "Finance", "Human Resources", "Operations",
+               "Support", "Legal", "Product", "Design", "Data", "Security", "Facilities", "Procurement"]
+FIRST_NAMES = ["Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Meera", "Arjun", "Kavya", "Rahul", "Isha",
+               "Sanjay", "Neha", "Karan", "Divya", "Amit", "Pooja", "Nikhil", "Sneha", "Rajesh", "Anjali"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Reddy", "Nair", "Gupta", "Singh", "Kumar", "Das", "Menon",
+              "Rao", "Joshi", "Shah", "Verma", "Pillai", "Chopra", "Bose", "Kapoor", "Mehta", "Bhat"]
+HOLIDAYS = [("01-26", "Republic Day"), ("03-14", "Holi"), ("04-14", "Ambedkar Jayanti"), ("05-01", "Labour Day"),
+            ("08-15", "Independence Day"), ("10-02", "Gandhi Jayanti"), ("10-20", "Diwali"), ("12-25", "Christmas")]
+
+PAYSLIP_TEMPLATE = """<h1>Payslip — {{ month }}</h1>
+<p>{{ employee_name }} ({{ employee_id }}) · {{ department }}</p>
+<table>{% for st in salary_types %}<tr><td>{{ st.type }}</td><td>{{ st.category }}</td><td>{{ st.amount }}</td></tr>{% endfor %}</table>
+<p>Net pay: {{ net_pay }}</p>"""
+
+
+@dataclass(frozen=True)
+class SizeProfile:
+    employees: int
+    years: int
+    hierarchy_depth: int
+    departments: int
+    structures: int
+    policies: int
+    leave_requests_per_year: int
+    payslip_months: int = None  # cap on payslip history; defaults to the full `years`
+
+
+PROFILES = {
+    "tiny": SizeProfile(employees=50, years=1, hierarchy_depth=3, departments=4, structures=3, policies=2,
+                        leave_requests_per_year=2),
+    "small": SizeProfile(employees=1_000, years=1, hierarchy_depth=6, departments=8, structures=10, policies=3,
+                         leave_requests_per_year=4),
+    "medium": SizeProfile(employees=10_000, years=3, hierarchy_depth=8, departments=12, structures=25,
+                          policies=4, leave_requests_per_year=4),
+    "large": SizeProfile(employees=100_000, years=5, hierarchy_depth=10, departments=14, structures=50,
+                         policies=5, leave_requests_per_year=4),
+}
+
+
+class Generator:
+    """Deterministic document factory; every id and value comes from one seeded RNG"""
+
+    def __init__(self, profile: SizeProfile, seed: int):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.created_at = "2020-01-01T00:00:00+00:00"
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def months(self):
+        first = date(LAST_MONTH.year - self.profile.years + 1, 1, 1)
+        if self.profile.payslip_months:
+            back = LAST_MONTH.year * 12 + LAST_MONTH.month - self.profile.payslip_months
+            first = max(first, date(back // 12, back % 12 + 1, 1))
+        month = first
+        while month <= LAST_MONTH:
+            yield month
+            month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    # ---- reference data ----
+
+    def departments(self):
+        return [{"id": self.new_id(), "name": DEPARTMENTS[i % len(DEPARTMENTS)] + ("" if i < len(DEPARTMENTS) else f" {i}"),
+                 "description": None, "created_at": self.created_at}
+                for i in range(self.profile.departments)]
+
+    def print_formats(self):
+        return [{"id": self.new_id(), "name": name, "template_html": PAYSLIP_TEMPLATE, "is_default": i == 0,
+                 "created_at": self.created_at}
+                for i, name in enumerate(["Standard Payslip", "Detailed Payslip"])]
+
+    def payroll_structures(self, print_formats):
+        structures = []
+        for i in range(self.profile.structures):
+            grade = 1 + i % 10
+            basic = float(round(15000 * grade * self.rng.uniform(0.9, 1.2), -2))
+            salary_types = [{"type": "Basic Salary", "amount": basic, "category": "earnings"}]
+            for name in self.rng.sample(EARNINGS[1:], self.rng.randint(1, len(EARNINGS) - 1)):
+                salary_types.append({"type": name, "amount": float(round(basic * self.rng.uniform(0.05, 0.5), -1)),
+                                     "category": "earnings"})
+            for name in self.rng.sample(DEDUCTIONS, self.rng.randint(1, len(DEDUCTIONS))):
+                salary_types.append({"type": name, "amount": float(round(basic * self.rng.uniform(0.01, 0.12), -1)),
+                                     "category": "deductions"})
+            earnings = sum(s["amount"] for s in salary_types if s["category"] == "earnings")
+            deductions = sum(s["amount"] for s in salary_types if s["category"] == "deductions")
+            structures.append({
+                "id": self.new_id(), "name": f"Grade {grade} — Band {i // 10 + 1}", "salary_types": salary_types,
+                "net_salary": earnings - deductions, "employee_count": 0,
+                "print_format_id": self.rng.choice(print_formats)["id"], "created_at": self.created_at,
+            })
+        return structures
+
+    def leave_policies(self):
+        policies = []
+        for i in range(self.profile.policies):
+            # Every policy has casual and sick leave, plus a random selection of the rest
+            types = LEAVE_TYPES[:2] + self.rng.sample(LEAVE_TYPES[2:], self.rng.randint(0, len(LEAVE_TYPES) - 2))
+            policies.append({
+                "id": self.new_id(), "name": f"Leave Policy {i + 1}",
+                "leave_types": [{"type": t, "days": self.rng.choice([6, 8, 10, 12, 15, 18])} for t in types],
+                "description": None, "created_at": self.created_at,
+            })
+        return policies
+
+    def holidays(self):
+        return [{"id": self.new_id(), "date": f"{year}-{day}", "name": name, "created_at": self.created_at}
+                for year in range(LAST_MONTH.year - self.profile.years + 1, LAST_MONTH.year + 2)
+                for day, name in HOLIDAYS]
+
+    # ---- people ----
+
+    def employees(self, departments):
+        """Employees in hierarchy order; employee i reports to (i - 1) // branching"""
+        n = self.profile.employees
+        branching = max(2, math.ceil(n ** (1 / self.profile.hierarchy_depth)))
+        first_year = LAST_MONTH.year - self.profile.years - 2
+        employees = []
+        for i in range(n):
+            manager = employees[(i - 1) // branching] if i else None
+            # Teams mostly stay in their manager's department
+            if manager and self.rng.random() < 0.85:
+                department_id = manager["department_id"]
+            else:
+                department_id = self.rng.choice(departments)["id"]
+            joining = date(first_year, 1, 1) + timedelta(days=self.rng.randrange(365 * (self.profile.years + 2)))
+            name = f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+            employees.append({
+                "id": self.new_id(),
+                "employee_id": f"EMP{i:08d}",
+                "name": name,
+                "email": f"{name.lower().replace(' ', '.')}.{i}@example.com",
+                "department_id": department_id,
+                "department": None,
+                "joining_date": joining.isoformat(),
+                "reporting_manager_id": manager["id"] if manager else None,
+                "ancestors": manager["ancestors"] + [manager["id"]] if manager else [],
+                "invited": False,
+                "user_id": None,
+                "created_at": f"{joining.isoformat()}T09:00:00+00:00",
+            })
+        return employees
+
+    def payroll(self, employees, structures):
+        return [{"id": self.new_id(), "employee_id": e["id"], "payroll_structure_id": self.rng.choice(structures)["id"],
+                 "created_at": e["created_at"]} for e in employees]
+
+    def assignments(self, employees, policies):
+        return [{"id": self.new_id(), "employee_id": e["id"], "leave_policy_id": self.rng.choice(policies)["id"],
+                 "created_at": e["created_at"]} for e in employees]
+
+    # ---- transactional data (streamed) ----
+
+    def payslips(self, employees, payroll, structures, departments):
+        structure_by_id = {s["id"]: s for s in structures}
+        department_names = {d["id"]: d["name"] for d in departments}
+        structure_of = {p["employee_id"]: structure_by_id[p["payroll_structure_id"]] for p in payroll}
+        for month in self.months():
+            month_key = month.strftime("%Y-%m")
+            next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            generated_at = f"{(next_month - timedelta(days=1)).isoformat()}T00:00:00+00:00"
+            for employee in employees:
+                if employee["joining_date"] >= next_month.isoformat():
+                    continue
+                salary_types = structure_of[employee["id"]]["salary_types"]
+                basic = sum(s["amount"] for s in salary_types if s["category"] == "earnings" and "basic" in s["type"].lower())
+                allowances = sum(s["amount"] for s in salary_types if s["category"] == "earnings") - basic
+                deductions = sum(s["amount"] for s in salary_types if s["category"] == "deductions")
+                snapshot = {
+                    "name": employee["name"], "employee_id": employee["employee_id"], "email": employee["email"],
+                    "department": department_names.get(employee["department_id"], "N/A"),
+                }
+                yield {
+                    "id": self.new_id(), "employee_id": employee["id"], "month": month_key,
+                    "basic_salary": basic, "allowances": allowances, "deductions": deductions,
+                    "net_pay": basic + allowances - deductions, "salary_types": salary_types,
+                    "employee_snapshot": snapshot,
+                    "print_format_id": structure_of[employee["id"]]["print_format_id"],
+                    "generated_at": generated_at,
+                }
+
+    def leave_requests(self, employees, assignments, policies, holidays):
+        policy_by_id = {p["id"]: p for p in policies}
+        policy_of = {a["employee_id"]: policy_by_id[a["leave_policy_id"]] for a in assignments}
+        holiday_dates = {h["date"] for h in holidays}
+        first_year = LAST_MONTH.year - self.profile.years + 1
+        today = date(LAST_MONTH.year, 12, 1)
+        for employee in employees:
+            leave_types = [lt["type"] for lt in policy_of[employee["id"]]["leave_types"]]
+            for year in range(first_year, LAST_MONTH.year + 1):
+                for _ in range(self.profile.leave_requests_per_year):
+                    start = date(year, 1, 1) + timedelta(days=self.rng.randrange(360))
+                    while start.weekday() >= 5 or start.isoformat() in holiday_dates:
+                        start += timedelta(days=1)
+                    end = start
+                    for _ in range(self.rng.choice([0, 0, 0, 1, 1, 2, 4])):
+                        candidate = end + timedelta(days=1)
+                        if candidate.weekday() >= 5 or candidate.isoformat() in holiday_dates:
+                            break
+                        end = candidate
+                    if start >= today:
+                        status = "pending"
+                    else:
+                        status = self.rng.choices(["approved", "rejected", "pending"], weights=[85, 10, 5])[0]
+                    yield {
+                        "id": self.new_id(), "employee_id": employee["id"],
+                        "leave_type": self.rng.choice(leave_types),
+                        "start_date": start.isoformat(), "end_date": end.isoformat(),
+                        "reason": "Generated", "status": status,
+                        "created_at": f"{(start - timedelta(days=self.rng.randrange(1, 30))).isoformat()}T09:00:00+00:00",
+                    }
+
+
+class BulkWriter:
+    """Batches documents per collection and keeps a bounded number of insert_many calls in flight"""
+
+    def __init__(self, database, batch_size: int, concurrency: int):
+        self.database = database
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = set()
+        self.counts = {}
+
+    async def _insert(self, collection, batch):
+        try:
+            await self.database[collection].insert_many(batch, ordered=False)
+            self.counts[collection] = self.counts.get(collection, 0) + len(batch)
+        finally:
+            self.semaphore.release()
+
+    async def _flush(self, collection, batch):
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._insert(collection, batch))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def write(self, collection, docs):
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                await self._flush(collection, batch)
+                batch = []
+        if batch:
+            await self._flush(collection, batch)
+
+    async def close(self):
+        if self.pending:
+            await asyncio.gather(*self.pending)
+
+
+async def generate(database, profile: SizeProfile, seed: int = 42, batch_size: int = 5000, concurrency: int = 4,
+                   admin_password: str = None, log=print):
+    """Write a full dataset into `database` and return sample ids for benchmarks and scripts"""
+    gen = Generator(profile, seed)
+    writer = BulkWriter(database, batch_size, concurrency)
+    started = time.perf_counter()
+
+    departments = gen.departments()
+    print_formats = gen.print_formats()
+    structures = gen.payroll_structures(print_formats)
+    policies = gen.leave_policies()
+    holidays = gen.holidays()
+    employees = gen.employees(departments)
+    payroll = gen.payroll(employees, structures)
+    assignments = gen.assignments(employees, policies)
+
+    for collection, docs in [
+        ("departments", departments), ("print_formats", print_formats), ("payroll_structures", structures),
+        ("leave_policies", policies), ("holidays", holidays), ("employees", employees), ("payroll", payroll),
+        ("employee_policy_assignments", assignments),
+    ]:
+        await writer.write(collection, docs)
+    await writer.write("payslips", gen.payslips(employees, payroll, structures, departments))
+    await writer.write("leave_requests", gen.leave_requests(employees, assignments, policies, holidays))
+    if admin_password:
+        hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(admin_password)
+        await writer.write("users", [{"id": gen.new_id(), "email": "admin@example.com", "full_name": "Admin",
+                                      "role": "admin", "hashed_password": hashed, "created_at": gen.created_at}])
+    await writer.close()
+
+    elapsed = time.perf_counter() - started
+    for collection, count in writer.counts.items():
+        log(f"  {collection:<30} {count:>10,}")
+    log(f"Generated {sum(writer.counts.values()):,} documents in {elapsed:.1f}s")
+
+    # A rank-and-file employee with a full payslip history, for scripts that act as "an employee"
+    first_month = next(gen.months()).isoformat()
+    sample = next((e for e in reversed(employees) if e["joining_date"] < first_month), employees[-1])
+    return {
+        "counts": writer.counts,
+        "department_id": departments[0]["id"],
+        "format_id": print_formats[0]["id"],
+        "structure_id": structures[0]["id"],
+        "policy_id": policies[0]["id"],
+        "manager_id": employees[0]["id"],
+        "employee": {k: v for k, v in sample.items() if k != "_id"},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic HRMS dataset")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--employees", type=int, help="override the profile's headcount")
+    parser.add_argument("--years", type=int, help="override the profile's payslip/leave history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default=None, help="defaults to MONGO_URL")
+    parser.add_argument("--db-name", default=None, help="defaults to DB_NAME")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many calls in flight")
+    parser.add_argument("--admin-password", help="also create admin@example.com with this password")
+    parser.add_argument("--drop", action="store_true", help="clear the HRMS collections first")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv(ROOT_DIR / '.env')
+    profile = PROFILES[args.profile]
+    if args.employees:
+        profile = replace(profile, employees=args.employees)
+    if args.years:
+        profile = replace(profile, years=args.years)
+
+    client = AsyncIOMotorClient(args.mongo_url or os.environ['MONGO_URL'])
+    database = client[args.db_name or os.environ['DB_NAME']]
+    try:
+        if args.drop:
+            for collection in COLLECTIONS:
+                await database[collection].drop()
+        elif await database.employees.estimated_document_count():
+            raise SystemExit("Target database already has employees; pass --drop to replace them")
+        print(f"Generating profile {args.profile} ({profile.employees:,} employees, {profile.years} years) "
+              f"with seed {args.seed} into {database.name}")
+        await generate(database, profile, args.seed, args.batch_size, args.concurrency, args.admin_password)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
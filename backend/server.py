@@ -1,30 +1,277 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from uuid import uuid4
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import time
+import asyncio
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
+import json
 import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, suppress
+from contextvars import ContextVar
+from functools import lru_cache
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Literal
+from typing import Annotated, Callable, Dict, List, Optional, Literal, Set, Tuple, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import io
-from jinja2 import Environment, BaseLoader, TemplateError
+import tempfile
+from jinja2 import BaseLoader, TemplateError
+from jinja2.sandbox import SandboxedEnvironment, safe_range
+from openpyxl import Workbook
+from pymongo import ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.routing import Match
+
+try:
+    import brotli
+except ImportError:  # Native extension; without it responses fall back to gzip
+    brotli = None
 # from weasyprint import HTML, CSS
 
 ROOT_DIR = Path(__file__).parent
+# Before any module-level setting below reads the environment; never overrides real variables
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logger = logging.getLogger(__name__)
+
+# ============= METRICS =============
+# Labels use route templates ("/api/employees/{employee_id}") and collection names,
+# never raw paths or ids, so series cardinality stays bounded.
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status code",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by collection and command",
+    ["collection", "command"],
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections", "Open connections in the MongoDB pool",
+    ["address"], multiprocess_mode="livesum",
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out_connections", "Connections currently checked out of the MongoDB pool",
+    ["address"], multiprocess_mode="livesum",
+)
+
+# ============= PER-REQUEST DB STATS =============
+
+DB_QUERY_WARN_THRESHOLD = int(os.environ.get("DB_QUERY_WARN_THRESHOLD", "25"))
+
+class DBRequestStats:
+    """Mongo command count and total time for the request being handled.
+
+    Commands of one request can finish on several executor threads at once, so
+    updates go through `record` under a lock.
+    """
+
+    __slots__ = ("queries", "seconds", "_lock")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+
+# Motor runs pymongo on executor threads with a copy of the caller's context, so the
+# command listener sees the stats object the middleware installed for this request.
+db_request_stats: ContextVar[Optional[DBRequestStats]] = ContextVar("db_request_stats", default=None)
+
+def record_db_command(seconds: float):
+    """Attribute one Mongo command to the current request, if any"""
+    stats = db_request_stats.get()
+    if stats is not None:
+        stats.record(seconds)
+
+class DBQueryCounterMiddleware:
+    """Adds X-DB-Queries / Server-Timing headers and warns about query-heavy requests"""
+
+    def __init__(self, app, warn_threshold: int = DB_QUERY_WARN_THRESHOLD):
+        self.app = app
+        self.warn_threshold = warn_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = DBRequestStats()
+        token = db_request_stats.set(stats)
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.seconds * 1000:.1f};desc="{stats.queries} queries"'.encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db_request_stats.reset(token)
+            if stats.queries > self.warn_threshold:
+                logging.warning(
+                    f"{scope['method']} {scope['path']} issued {stats.queries} DB queries "
+                    f"({stats.seconds * 1000:.1f} ms), threshold is {self.warn_threshold}"
+                )
+
+def _address_label(address) -> str:
+    return f"{address[0]}:{address[1]}" if address else "unknown"
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _key(event):
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self._collections[self._key(event)] = target if isinstance(target, str) else "-"
+
+    def _collection(self, event) -> str:
+        return self._collections.pop(self._key(event), "-")
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.labels(self._collection(event), event.command_name).observe(seconds)
+        record_db_command(seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1_000_000
+        collection = self._collection(event)
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(seconds)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+        record_db_command(seconds)
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks open and checked-out connections per server address"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(_address_label(event.address)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(_address_label(event.address)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(_address_label(event.address)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(_address_label(event.address)).dec()
+
+class PrometheusMiddleware:
+    """ASGI middleware recording latency, status and in-flight counts per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_template(scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        route = self._route_template(scope)
+        status_code = 500
+        
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            in_flight.dec()
+
+# MongoDB connection, opened by the app lifespan (after any worker fork)
+client: Optional[AsyncIOMotorClient] = None
+db = None
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -34,9 +281,159 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15  # 15 minutes - short-lived access token
 REFRESH_TOKEN_EXPIRE_DAYS = 30  # 30 days - long-lived refresh token
 
-# Create the main app
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+# ============= RESPONSE COMPRESSION =============
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "500"))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def _accepted_encodings(scope) -> Set[str]:
+    for name, value in scope["headers"]:
+        if name == b"accept-encoding":
+            return {part.split(";")[0].strip() for part in value.decode("latin-1").lower().split(",")}
+    return set()
+
+class CompressionMiddleware:
+    """Brotli- or gzip-compresses buffered JSON and text responses the client accepts.
+
+    Streamed responses (reports, downloads) and small bodies pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = _accepted_encodings(scope)
+        encoding = "br" if brotli is not None and "br" in accepted else "gzip" if "gzip" in accepted else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            headers = {name.lower(): value for name, value in start.get("headers", [])}
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or b"content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not headers.get(b"content-type", b"").decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                start = None
+                await send(message)
+                return
+            if encoding == "br":
+                body = brotli.compress(body, quality=4)
+            else:
+                body = gzip.compress(body, compresslevel=6)
+            response_headers = [(name, value) for name, value in start["headers"] if name.lower() != b"content-length"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start, "headers": response_headers})
+            start = None
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+# ============= READ ROUTING =============
+# Endpoints map, by name or by the route class they belong to, to a read preference
+# with an optional max staleness. Repository reads made while serving them use it;
+# writes and unmapped endpoints use the client default (the primary). A user who
+# wrote recently is pinned to the primary to read their own writes.
+
+READ_ROUTE_CLASSES: Dict[str, Set[str]] = {
+    "listing": {
+        "list_employees", "list_payslips", "list_leave_requests", "list_departments_with_count",
+        "list_employee_policy_assignments", "get_employee_org_tree",
+    },
+    "report": {"payroll_register_report", "get_leave_calendar"},
+    "export": set(),
+}
+DEFAULT_READ_ROUTING = "listing=secondaryPreferred:90,report=secondaryPreferred:90,export=secondaryPreferred:90"
+READ_YOUR_WRITES_WINDOW = float(os.environ.get("READ_YOUR_WRITES_WINDOW", "90"))
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def parse_read_routing(spec: str) -> dict:
+    """Parse comma-separated `name=mode[:max_staleness_seconds]` entries"""
+    routing = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        name, _, value = entry.partition("=")
+        mode, _, staleness = value.strip().partition(":")
+        if mode not in READ_PREFERENCE_MODES:
+            raise ValueError(f"Unknown read preference '{mode}' for '{name}' in READ_ROUTING")
+        if mode == "primary":
+            routing[name.strip()] = Primary()
+            continue
+        max_staleness = int(staleness) if staleness else -1
+        if max_staleness != -1 and max_staleness < 90:
+            raise ValueError(f"Max staleness for '{name}' must be at least 90 seconds")
+        routing[name.strip()] = READ_PREFERENCE_MODES[mode](max_staleness=max_staleness)
+    return routing
+
+class ReadRouting:
+    """Resolves an endpoint to its read preference; endpoint entries beat route class entries"""
+
+    def __init__(self, spec: str = "", defaults: str = DEFAULT_READ_ROUTING):
+        self.routes = {**parse_read_routing(defaults), **parse_read_routing(spec)}
+        self.max_staleness = max((p.max_staleness for p in self.routes.values()), default=-1)
+
+    def for_endpoint(self, name: Optional[str]):
+        if name in self.routes:
+            return self.routes[name]
+        for route_class, endpoints in READ_ROUTE_CLASSES.items():
+            if name in endpoints and route_class in self.routes:
+                return self.routes[route_class]
+        return None
+
+read_routing = ReadRouting(os.environ.get("READ_ROUTING", ""))
+route_read_preference: ContextVar = ContextVar("route_read_preference", default=None)
+
+async def apply_read_routing(request: Request):
+    endpoint = request.scope.get("endpoint")
+    route_read_preference.set(read_routing.for_endpoint(getattr(endpoint, "__name__", None)))
+
+def read_your_writes_window() -> timedelta:
+    """How long a write may take to reach every routed read: never shorter than the longest max staleness"""
+    return timedelta(seconds=max(READ_YOUR_WRITES_WINDOW, read_routing.max_staleness))
+
+def write_stamp_age(user: dict) -> Optional[timedelta]:
+    last_write_at = user.get("last_write_at")
+    if not last_write_at:
+        return None
+    return datetime.now(timezone.utc) - datetime.fromisoformat(last_write_at)
+
+def needs_write_stamp(user: dict) -> bool:
+    """Re-stamp `last_write_at` at most once per window, not on every write"""
+    age = write_stamp_age(user)
+    return age is None or age >= read_your_writes_window()
+
+def wrote_recently(user: dict) -> bool:
+    # The latest write can be up to one window newer than its stamp, so pin for two
+    age = write_stamp_age(user)
+    return age is not None and age < 2 * read_your_writes_window()
+
+api_router = APIRouter(prefix="/api", dependencies=[Depends(apply_read_routing)])
 
 # ============= MODELS =============
 
@@ -92,10 +489,32 @@ class Employee(BaseModel):
     department: Optional[str] = None  # Keep for backward compatibility
     joining_date: str
     reporting_manager_id: Optional[str] = None
+    ancestors: List[str] = []  # Reporting chain, top of the organisation first, direct manager last
     invited: bool = False
     user_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class EmployeeSummary(BaseModel):
+    """Employee row holding only the projected columns (`view=summary` or `fields=`)"""
+    id: str
+    employee_id: Optional[str] = None
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    department_id: Optional[str] = None
+    department: Optional[str] = None
+    joining_date: Optional[str] = None
+    reporting_manager_id: Optional[str] = None
+    ancestors: Optional[List[str]] = None
+    invited: Optional[bool] = None
+    user_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+EMPLOYEE_SUMMARY_FIELDS = ("employee_id", "name", "email", "department_id")
+
+# Full rows validate as Employee; projected ones fall through to EmployeeSummary.
+# Routes using these set response_model_exclude_unset so unrequested columns stay out.
+EmployeeRows = List[Annotated[Union[Employee, EmployeeSummary], Field(union_mode="left_to_right")]]
+
 class EmployeeCreate(BaseModel):
     name: str
     email: EmailStr
@@ -143,6 +562,13 @@ class PayrollCreate(BaseModel):
     employee_id: str
     payroll_structure_id: str
 
+class EmployeeSnapshot(BaseModel):
+    """The employee as of payslip generation; later renames and moves don't change it"""
+    name: str
+    employee_id: str
+    email: str
+    department: str
+
 class Payslip(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -153,8 +579,29 @@ class Payslip(BaseModel):
     deductions: float
     net_pay: float
     salary_types: List[SalaryType] = []  # Store individual salary types from payroll structure
+    employee_snapshot: Optional[EmployeeSnapshot] = None  # None on payslips generated before snapshots
+    print_format_id: Optional[str] = None  # Resolved at generation; None renders the built-in layout
     generated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class PayslipSummary(BaseModel):
+    """Payslip row holding only the projected columns (`view=summary` or `fields=`)"""
+    id: str
+    employee_id: Optional[str] = None
+    month: Optional[str] = None
+    basic_salary: Optional[float] = None
+    allowances: Optional[float] = None
+    deductions: Optional[float] = None
+    net_pay: Optional[float] = None
+    salary_types: Optional[List[SalaryType]] = None
+    employee_snapshot: Optional[EmployeeSnapshot] = None
+    print_format_id: Optional[str] = None
+    generated_at: Optional[datetime] = None
+
+# Totals without the per-component breakdown
+PAYSLIP_SUMMARY_FIELDS = ("employee_id", "month", "basic_salary", "allowances", "deductions", "net_pay", "generated_at")
+
+PayslipRows = List[Annotated[Union[Payslip, PayslipSummary], Field(union_mode="left_to_right")]]
+
 class PayslipCreate(BaseModel):
     employee_id: str
     month: str
@@ -175,6 +622,7 @@ class PrintFormatCreate(BaseModel):
 class LeaveType(BaseModel):
     type: str  # e.g., "Casual Leave"
     days: int  # e.g., 12
+    carry_forward_cap: int = 0  # Most unused days carried into the next leave year
 
 class LeavePolicy(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -220,11 +668,59 @@ class LeaveRequestCreate(BaseModel):
 class LeaveRequestUpdate(BaseModel):
     status: Literal["approved", "rejected"]
 
+class LeaveRequestStatusChange(BaseModel):
+    id: str
+    status: Literal["approved", "rejected"]
+
+class LeaveRequestBulkUpdate(BaseModel):
+    """Either `ids` with one `status` for all of them, or per-request `updates`"""
+    ids: List[str] = Field(default=[], max_length=1000)
+    status: Optional[Literal["approved", "rejected"]] = None
+    updates: List[LeaveRequestStatusChange] = Field(default=[], max_length=1000)
+
+class LeaveRequestBulkOutcome(BaseModel):
+    id: str
+    outcome: Literal["updated", "unchanged", "conflict", "not_found"]
+    status: Optional[str] = None  # Status after the call; None when not found
+
+class LeaveRequestBulkResult(BaseModel):
+    updated: int
+    results: List[LeaveRequestBulkOutcome]
+
 class LeaveBalance(BaseModel):
     leave_type: str
     allocated_days: int
     used_days: int
     remaining_days: int
+    carried_forward_days: int = 0  # Included in allocated_days
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    type: str
+    params: dict = {}
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int = 0
+    done: int = 0  # Progress, in the job's own units
+    total: Optional[int] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+class LeaveCalendarAbsence(BaseModel):
+    employee_id: str
+    employee_name: str
+    leave_request_id: str
+    leave_type: str
+    status: Literal["pending", "approved"]
+
+class LeaveCalendarDay(BaseModel):
+    date: str  # Format: YYYY-MM-DD
+    weekend: bool
+    holiday: Optional[str] = None  # Holiday name
+    absences: List[LeaveCalendarAbsence] = []
 
 class Holiday(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -259,7 +755,7 @@ def create_refresh_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -273,9 +769,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await repos.users.get(user_id)
     if user is None:
         raise credentials_exception
+    
+    # Read-your-writes: remember when this user last wrote, and keep their reads on
+    # the primary until secondaries are guaranteed to have caught up
+    preference = route_read_preference.get()
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        if needs_write_stamp(user):
+            await repos.users.record_write(user_id)
+    elif preference is not None and preference.mode != Primary().mode and wrote_recently(user):
+        route_read_preference.set(None)
     return User(**user)
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
@@ -286,12 +791,1494 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+# ============= QUERY HELPERS =============
+
+def build_projection(model, summary_fields: Tuple[str, ...], view: str, fields: Optional[str]) -> Optional[dict]:
+    """Map `view=summary` / `fields=a,b` to a Mongo projection.
+
+    Returns None for the full view so callers keep their existing code path.
+    Unknown field names are rejected; `id` is always included.
+    """
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in model.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    elif view == "summary":
+        requested = list(summary_fields)
+    else:
+        return None
+    return {"_id": 0, "id": 1, **{f: 1 for f in requested}}
+
+# ============= CACHE INVALIDATION =============
+
+CACHE_INVALIDATION_MODE = os.environ.get("CACHE_INVALIDATION_MODE", "auto")
+CACHE_POLL_INTERVAL = float(os.environ.get("CACHE_POLL_INTERVAL", "1"))
+
+# Server error code for "$changeStream is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations_total", "In-process cache invalidations by collection and origin",
+    ["collection", "origin"],
+)
+
+class InvalidationBus:
+    """Tells every worker when a collection its in-process caches depend on changes.
+
+    Writers bump a per-collection counter in `cache_versions`. Each worker follows the
+    counters through a change stream, or by polling when change streams are unavailable
+    (standalone mongod), and calls the callbacks subscribed to that collection. A bump
+    the worker made itself is skipped, since the write already cleared its caches.
+    """
+
+    def __init__(self, mode: str = CACHE_INVALIDATION_MODE, poll_interval: float = CACHE_POLL_INTERVAL):
+        if mode not in ("auto", "change_stream", "poll"):
+            raise ValueError(f"Unknown CACHE_INVALIDATION_MODE '{mode}'")
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.worker_id = uuid4().hex
+        self.feed: Optional[str] = None
+        self._subscribers: Dict[str, list] = defaultdict(list)
+        self._versions: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, collections, callback):
+        """Call `callback(collection)` whenever another worker writes one of `collections`"""
+        for name in collections:
+            self._subscribers[name].append(callback)
+
+    async def versions(self, collections: List[str]) -> Dict[str, int]:
+        """Current write version of each collection, 0 if it was never written.
+
+        Read from the database, not this worker's view, so every worker agrees;
+        a version newer than the local one clears the local caches first.
+        """
+        found = dict.fromkeys(collections, 0)
+        async for doc in db.cache_versions.find({"_id": {"$in": list(collections)}}):
+            self._apply(doc["_id"], doc.get("version", 0), doc.get("origin"))
+            found[doc["_id"]] = doc.get("version", 0)
+        return found
+
+    async def publish(self, collection: str):
+        if collection not in self._subscribers:
+            return
+        doc = await db.cache_versions.find_one_and_update(
+            {"_id": collection},
+            {"$inc": {"version": 1}, "$set": {"origin": self.worker_id}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if self._versions.get(collection, 0) == doc["version"] - 1:
+            self._versions[collection] = doc["version"]
+
+    def _apply(self, collection: str, version: int, origin: Optional[str]):
+        known = self._versions.get(collection)
+        if known == version:
+            return
+        self._versions[collection] = version
+        if origin == self.worker_id and known == version - 1:
+            return  # Exactly one bump since we last looked, and it was ours
+        CACHE_INVALIDATIONS.labels(collection, "remote").inc()
+        for callback in self._subscribers.get(collection, ()):
+            try:
+                callback(collection)
+            except Exception:
+                logging.exception(f"Cache invalidation callback failed for {collection}")
+
+    async def _sync(self):
+        async for doc in db.cache_versions.find({}):
+            self._apply(doc["_id"], doc.get("version", 0), doc.get("origin"))
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        async with db.cache_versions.watch(pipeline, full_document="updateLookup") as stream:
+            self.feed = "change_stream"
+            # Catch up on anything written before the stream opened
+            await self._sync()
+            async for change in stream:
+                doc = change.get("fullDocument")
+                if doc:
+                    self._apply(doc["_id"], doc.get("version", 0), doc.get("origin"))
+
+    async def _poll(self):
+        self.feed = "poll"
+        while True:
+            await self._sync()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self):
+        use_change_stream = self.mode != "poll"
+        while True:
+            try:
+                if use_change_stream:
+                    await self._follow_change_stream()
+                else:
+                    await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if exc.code == CHANGE_STREAMS_UNSUPPORTED and self.mode == "auto":
+                    logging.info("Change streams unavailable; polling cache_versions for invalidations")
+                    use_change_stream = False
+                    continue
+                logging.exception("Cache invalidation feed failed; retrying")
+                await asyncio.sleep(5)
+            except Exception:
+                logging.exception("Cache invalidation feed failed; retrying")
+                await asyncio.sleep(5)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+invalidation_bus = InvalidationBus()
+
+# ============= REPOSITORIES =============
+# Handlers reach MongoDB only through `repos`. Each repository owns the filters and
+# projections for its collection, batches lookups by id within a request and, for
+# the small reference collections, serves reads from a process-local cache.
+
+REFERENCE_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", "3600"))
+
+REPOSITORY_CACHE_LOOKUPS = Counter(
+    "repository_cache_lookups_total", "Reference cache lookups by collection and result",
+    ["collection", "result"],
+)
+
+def _copy(value):
+    """Shallow-copy documents so callers can't mutate cached or shared results"""
+    if isinstance(value, list):
+        return [dict(doc) for doc in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+class ReadThroughCache:
+    """TTL cache for query results, cleared by the owning repository on every write.
+
+    Writes made by other workers arrive through the invalidation bus; the TTL only
+    bounds staleness if that feed is down. Every clear bumps `generation`, and `set`
+    drops values read under an older one so a fetch in flight across a write can't
+    put its pre-write result back.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: Dict[tuple, Tuple[float, object, datetime]] = {}
+
+    def get(self, key: tuple) -> Tuple[bool, object]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, _copy(entry[1])
+
+    def filled_at(self, key: tuple) -> Optional[datetime]:
+        """When the read that filled `key` started"""
+        entry = self._entries.get(key)
+        return entry[2] if entry else None
+
+    def set(self, key: tuple, value, generation: Optional[int] = None, filled_at: Optional[datetime] = None):
+        """Store `value` unless the cache was cleared since `generation` was read"""
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, _copy(value), filled_at or datetime.now(timezone.utc))
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+class BatchLoader:
+    """Coalesces the `load` calls made during one request into a single `$in` query.
+
+    Keys requested before the event loop next gets control are fetched together.
+    Results, misses included, are memoized until the request ends or the owning
+    repository writes.
+    """
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._queue: List[Tuple[str, asyncio.Future]] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key: str) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            if not self._queue:
+                loop.call_soon(self._dispatch)
+            self._queue.append((key, future))
+        return future
+
+    async def load_many(self, keys) -> Dict[str, dict]:
+        keys = list(dict.fromkeys(keys))
+        docs = await asyncio.gather(*(asyncio.shield(self.load(key)) for key in keys))
+        return {key: doc for key, doc in zip(keys, docs) if doc is not None}
+
+    def clear(self):
+        self._futures.clear()
+
+    def _dispatch(self):
+        batch, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            docs = await self._fetch([key for key, _ in batch])
+        except Exception as exc:
+            for key, future in batch:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for key, future in batch:
+            if not future.done():
+                future.set_result(docs.get(key))
+
+request_loaders: ContextVar[Optional[Dict[str, BatchLoader]]] = ContextVar("request_loaders", default=None)
+
+@contextmanager
+def loader_scope():
+    """Give the enclosed code its own batch loaders (one scope per HTTP request)"""
+    token = request_loaders.set({})
+    try:
+        yield
+    finally:
+        request_loaders.reset(token)
+
+class LoaderScopeMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with loader_scope():
+            await self.app(scope, receive, send)
+
+class Repository:
+    """Queries for one collection.
+
+    `get` and `get_many` go through the request's batch loader, so concurrent
+    lookups by id share one query. Repositories given a cache serve reads through
+    it; every write clears both the cache and the loader and is announced on the
+    invalidation bus.
+
+    Synced repositories also stamp `updated_at` on every write and leave a
+    tombstone for every delete, so clients can pull deltas with `?since=`.
+    """
+
+    collection_name = ""
+    default_sort: Optional[List[Tuple[str, int]]] = None
+    routed = True
+    synced = False
+    tombstone_fields: Tuple[str, ...] = ()  # Copied onto tombstones so deltas can be scoped like the data
+
+    def __init__(self, cache: Optional[ReadThroughCache] = None, bus: Optional[InvalidationBus] = None):
+        self.cache = cache
+        self.bus = bus
+
+    @property
+    def collection(self):
+        return db[self.collection_name]
+
+    @property
+    def _reads(self):
+        """Collection handle for reads, honouring the current route's read preference.
+
+        Cached repositories always read the primary, so a lagging secondary can't
+        refill the cache with data older than the write that just cleared it.
+        """
+        preference = route_read_preference.get()
+        if preference is None or not self.routed or self.cache is not None:
+            return self.collection
+        return self.collection.with_options(read_preference=preference)
+
+    async def _cached(self, key: tuple, fetch):
+        value, _read_at = await self._cached_as_of(key, fetch)
+        return value
+
+    async def _cached_as_of(self, key: tuple, fetch) -> Tuple[object, Optional[datetime]]:
+        """`_cached`, plus when the primary read behind the value started; None when uncached"""
+        if self.cache is None:
+            return await fetch(), None
+        hit, value = self.cache.get(key)
+        REPOSITORY_CACHE_LOOKUPS.labels(self.collection_name, "hit" if hit else "miss").inc()
+        if hit:
+            return value, self.cache.filled_at(key)
+        generation = self.cache.generation
+        read_at = datetime.now(timezone.utc)
+        value = await fetch()
+        self.cache.set(key, value, generation, read_at)
+        return value, read_at
+
+    async def _find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self._reads.find_one(query, projection or {"_id": 0})
+
+    async def _find(
+        self, query: dict, projection: Optional[dict] = None, sort=None, limit: Optional[int] = 1000, skip: int = 0
+    ) -> List[dict]:
+        cursor = self._reads.find(query, projection or {"_id": 0})
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(limit)
+
+    async def _exists(self, query: dict) -> bool:
+        return await self._reads.find_one(query, {"_id": 1}) is not None
+
+    def _loader(self) -> Optional[BatchLoader]:
+        loaders = request_loaders.get()
+        if loaders is None:
+            return None
+        loader = loaders.get(self.collection_name)
+        if loader is None:
+            loader = loaders[self.collection_name] = BatchLoader(self._fetch_by_ids)
+        return loader
+
+    async def _fetch_by_ids(self, ids: List[str]) -> Dict[str, dict]:
+        found = {}
+        missing = []
+        for doc_id in ids:
+            hit, doc = self.cache.get(("id", doc_id)) if self.cache else (False, None)
+            if hit:
+                found[doc_id] = doc
+            else:
+                missing.append(doc_id)
+        if self.cache:
+            REPOSITORY_CACHE_LOOKUPS.labels(self.collection_name, "hit").inc(len(found))
+            REPOSITORY_CACHE_LOOKUPS.labels(self.collection_name, "miss").inc(len(missing))
+        if missing:
+            generation = self.cache.generation if self.cache else None
+            query = {"id": missing[0]} if len(missing) == 1 else {"id": {"$in": missing}}
+            docs = await self._find(query, limit=None)
+            by_id = {doc["id"]: doc for doc in docs}
+            for doc_id in missing:
+                if self.cache:
+                    self.cache.set(("id", doc_id), by_id.get(doc_id), generation)
+                if doc_id in by_id:
+                    found[doc_id] = by_id[doc_id]
+        return found
+
+    async def get(self, doc_id: str) -> Optional[dict]:
+        loader = self._loader()
+        if loader is None:
+            return (await self._fetch_by_ids([doc_id])).get(doc_id)
+        return _copy(await asyncio.shield(loader.load(doc_id)))
+
+    async def get_many(self, ids) -> Dict[str, dict]:
+        """Documents keyed by id; unknown ids are left out"""
+        loader = self._loader()
+        if loader is None:
+            return await self._fetch_by_ids(list(dict.fromkeys(ids)))
+        return {doc_id: _copy(doc) for doc_id, doc in (await loader.load_many(ids)).items()}
+
+    async def list_all(self) -> List[dict]:
+        return (await self.list_all_as_of())[0]
+
+    async def list_all_as_of(self) -> Tuple[List[dict], Optional[datetime]]:
+        """`list_all`, plus when it was read if it came through the cache (see `_cached_as_of`)"""
+        return await self._cached_as_of(("all",), lambda: self._find({}, sort=self.default_sort))
+
+    async def _changed(self):
+        if self.cache is not None:
+            self.cache.clear()
+        single_flight.forget(self.collection_name)
+        loaders = request_loaders.get()
+        if loaders and self.collection_name in loaders:
+            loaders[self.collection_name].clear()
+        if self.bus is not None:
+            await self.bus.publish(self.collection_name)
+
+    def _touched(self, fields: dict) -> dict:
+        """`fields` plus a fresh `updated_at` when the collection is synced"""
+        if not self.synced:
+            return fields
+        return {**fields, "updated_at": datetime.now(timezone.utc)}
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(self._touched(doc))
+        await self._changed()
+
+    async def insert_many(self, docs: List[dict]):
+        if docs:
+            await self.collection.insert_many([self._touched(doc) for doc in docs])
+            await self._changed()
+
+    async def update(self, doc_id: str, fields: dict) -> bool:
+        """`$set` fields on one document; False when it doesn't exist"""
+        result = await self.collection.update_one({"id": doc_id}, {"$set": self._touched(fields)})
+        await self._changed()
+        return result.matched_count > 0
+
+    async def delete(self, doc_id: str) -> bool:
+        if not self.synced:
+            result = await self.collection.delete_one({"id": doc_id})
+            await self._changed()
+            return result.deleted_count > 0
+        doc = await self.collection.find_one_and_delete({"id": doc_id}, {"_id": 0})
+        if doc is None:
+            return False
+        await db.tombstones.insert_one({
+            "collection": self.collection_name, "id": doc_id, "deleted_at": datetime.now(timezone.utc),
+            **{field: doc.get(field) for field in self.tombstone_fields},
+        })
+        await self._changed()
+        return True
+
+    async def changed_since(self, since: datetime, query: Optional[dict] = None) -> List[dict]:
+        """Documents written at or after `since`, oldest change first"""
+        return await self._find({**(query or {}), "updated_at": {"$gte": since}}, sort=[("updated_at", 1)], limit=None)
+
+    async def deleted_since(self, since: datetime, query: Optional[dict] = None) -> List[str]:
+        cursor = db.tombstones.find(
+            {**(query or {}), "collection": self.collection_name, "deleted_at": {"$gte": since}}, {"_id": 0, "id": 1}
+        )
+        return [doc["id"] async for doc in cursor]
+
+class UserRepository(Repository):
+    collection_name = "users"
+    routed = False  # Auth and read-your-writes decisions need current data
+
+    async def record_write(self, user_id: str):
+        await self.collection.update_one(
+            {"id": user_id}, {"$set": {"last_write_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        await self._changed()
+
+    async def by_email(self, email: str) -> Optional[dict]:
+        return await self._find_one({"email": email})
+
+class EmployeeRepository(Repository):
+    collection_name = "employees"
+    synced = True
+
+    async def by_email(self, email: str) -> Optional[dict]:
+        return await self._find_one({"email": email})
+
+    async def by_user_id(self, user_id: str) -> Optional[dict]:
+        return await self._find_one({"user_id": user_id})
+
+    async def for_user(self, user: User) -> Optional[dict]:
+        """The employee profile of `user`, linked by email on first use"""
+        employee = await self.by_user_id(user.id)
+        if not employee:
+            employee = await self.by_email(user.email)
+            if employee:
+                await self.update(employee["id"], {"user_id": user.id})
+        return employee
+
+    async def link_user(self, email: str, user_id: str):
+        await self.collection.update_one({"email": email}, {"$set": self._touched({"user_id": user_id})})
+        await self._changed()
+
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        """Every employee, uncapped: the list is the baseline delta sync builds on"""
+        return await self._find({}, projection, limit=None)
+
+    def iter_all(self, projection: dict):
+        return self._reads.find({}, projection)
+
+    async def under(self, manager_id: str) -> List[dict]:
+        """Everyone in the manager's reporting line, at any depth"""
+        return await self._find({"ancestors": manager_id}, limit=None)
+
+    async def ids_under(self, manager_id: str) -> List[str]:
+        # Resolved from the (ancestors, id) index without loading employee documents
+        return await self._reads.distinct("id", {"ancestors": manager_id})
+
+    async def count_reports(self, manager_id: str) -> Tuple[int, int]:
+        """(direct reports, everyone under the manager)"""
+        direct = await self._reads.count_documents({"reporting_manager_id": manager_id})
+        total = await self._reads.count_documents({"ancestors": manager_id})
+        return direct, total
+
+    async def move_subtree(self, employee_id: str, ancestors: List[str]):
+        """Re-root everyone under `employee_id` after its own chain became `ancestors`.
+
+        One read of the subtree's chains and one unordered bulk write, whatever its depth.
+        """
+        cursor = self.collection.find({"ancestors": employee_id}, {"_id": 0, "id": 1, "ancestors": 1})
+        writes = [
+            UpdateOne({"id": doc["id"]}, {"$set": self._touched({
+                "ancestors": ancestors + doc["ancestors"][doc["ancestors"].index(employee_id):]
+            })})
+            async for doc in cursor
+        ]
+        if writes:
+            await self.collection.bulk_write(writes, ordered=False)
+            await self._changed()
+
+    async def backfill_ancestors(self) -> int:
+        """Fill in `ancestors` on employees stored before it was maintained; returns how many were written"""
+        if not await self.collection.count_documents({"ancestors": {"$exists": False}}, limit=1):
+            return 0
+        managers = {
+            doc["id"]: doc.get("reporting_manager_id")
+            async for doc in self.collection.find({}, {"_id": 0, "id": 1, "reporting_manager_id": 1})
+        }
+        writes = []
+        for employee_id in managers:
+            chain = []
+            manager_id = managers[employee_id]
+            while manager_id in managers and manager_id != employee_id and manager_id not in chain:
+                chain.append(manager_id)  # Stops at unknown managers and reporting cycles
+                manager_id = managers[manager_id]
+            writes.append(UpdateOne({"id": employee_id}, {"$set": self._touched({"ancestors": chain[::-1]})}))
+        await self.collection.bulk_write(writes, ordered=False)
+        await self._changed()
+        return len(writes)
+
+    async def ids_in_department(self, department_id: str) -> List[str]:
+        # Resolved from the (department_id, id) index without loading employee documents
+        return await self._reads.distinct("id", {"department_id": department_id})
+
+    async def count_in_department(self, department_id: str) -> int:
+        return await self._reads.count_documents({"department_id": department_id})
+
+    async def counts_by_department(self) -> Dict[str, int]:
+        counts = await self._reads.aggregate([
+            {"$group": {"_id": "$department_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {c["_id"]: c["count"] for c in counts}
+
+class DepartmentRepository(Repository):
+    collection_name = "departments"
+
+class PayrollRepository(Repository):
+    collection_name = "payroll"
+
+    async def for_employee(self, employee_id: str) -> Optional[dict]:
+        return await self._find_one({"employee_id": employee_id})
+
+    async def set_structure(self, employee_id: str, structure_id: str):
+        await self.collection.update_one(
+            {"employee_id": employee_id},
+            {"$set": {"payroll_structure_id": structure_id}}
+        )
+        await self._changed()
+
+    async def structure_in_use(self, structure_id: str) -> bool:
+        return await self._exists({"payroll_structure_id": structure_id})
+
+    async def counts_by_structure(self) -> Dict[str, int]:
+        counts = await self._reads.aggregate([
+            {"$group": {"_id": "$payroll_structure_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {c["_id"]: c["count"] for c in counts}
+
+    async def delete_for_employee(self, employee_id: str):
+        await self.collection.delete_one({"employee_id": employee_id})
+        await self._changed()
+
+class PayrollStructureRepository(Repository):
+    collection_name = "payroll_structures"
+
+class PayslipMonthQueries:
+    """Payroll register queries for repositories that hold payslips for a month.
+
+    `_month_stages` yields that month's payslips as flat documents; the stages
+    after it are shared.
+    """
+
+    def _month_stages(self, month: str) -> List[dict]:
+        return [{"$match": {"month": month}}]
+
+    async def components_for_month(self, month: str) -> List[Tuple[str, Optional[str]]]:
+        """Distinct (category, component) pairs on the month's payslips; None marks payslips without a breakdown"""
+        components = await self._reads.aggregate([
+            *self._month_stages(month),
+            {"$unwind": {"path": "$salary_types", "preserveNullAndEmptyArrays": True}},
+            {"$group": {"_id": {
+                "category": {"$ifNull": ["$salary_types.category", "earnings"]},
+                "component": "$salary_types.type",
+            }}},
+        ]).to_list(None)
+        return [(c["_id"]["category"], c["_id"].get("component")) for c in components]
+
+    def register_for_month(self, month: str):
+        """Cursor over the month's payslips joined to employee and department name,
+        sorted by department then employee so subtotals can be taken while streaming"""
+        return self._reads.aggregate([
+            *self._month_stages(month),
+            {"$lookup": {"from": "employees", "localField": "employee_id", "foreignField": "id", "as": "employee"}},
+            {"$unwind": {"path": "$employee", "preserveNullAndEmptyArrays": True}},
+            {"$lookup": {"from": "departments", "localField": "employee.department_id", "foreignField": "id",
+                         "as": "department"}},
+            {"$project": {
+                "_id": 0, "employee_id": 1, "basic_salary": 1, "allowances": 1, "deductions": 1, "salary_types": 1,
+                "code": "$employee.employee_id", "name": "$employee.name",
+                "department": {"$ifNull": [{"$arrayElemAt": ["$department.name", 0]}, "Unassigned"]},
+            }},
+            {"$sort": {"department": 1, "name": 1, "employee_id": 1}},
+        ], allowDiskUse=True, batchSize=500)
+
+class PayslipRepository(PayslipMonthQueries, Repository):
+    collection_name = "payslips"
+
+    async def list(
+        self, employee_ids=None, projection: Optional[dict] = None,
+        from_month: Optional[str] = None, to_month: Optional[str] = None,
+    ) -> List[dict]:
+        """Newest month first, optionally for one employee id or a list of them and a month range"""
+        if isinstance(employee_ids, str):
+            query = {"employee_id": employee_ids}
+        elif employee_ids is not None:
+            query = {"employee_id": {"$in": list(employee_ids)}}
+        else:
+            query = {}
+        if from_month:
+            query["month"] = {"$gte": from_month}
+        if to_month:
+            query.setdefault("month", {})["$lte"] = to_month
+        return await self._find(query, projection, sort=[("month", -1)])
+
+    async def count_before(self, month: str) -> int:
+        return await self.collection.count_documents({"month": {"$lt": month}})
+
+    async def before(self, month: str, limit: int) -> List[dict]:
+        return await self.collection.find({"month": {"$lt": month}}, {"_id": 0}).to_list(limit)
+
+    async def delete_ids(self, payslip_ids: List[str]):
+        await self.collection.delete_many({"id": {"$in": payslip_ids}})
+        await self._changed()
+
+    async def delete_for_employee(self, employee_id: str):
+        await self.collection.delete_many({"employee_id": employee_id})
+        await self._changed()
+
+class PayslipArchiveRepository(PayslipMonthQueries, Repository):
+    """Payslips past the hot horizon, one bucket per employee and year.
+
+    Bucketed payslips drop `employee_id`, which the bucket holds; the methods here
+    put it back so callers see the same documents as in `payslips`.
+    """
+
+    collection_name = "payslip_archive"
+
+    def _month_stages(self, month: str) -> List[dict]:
+        return [
+            {"$match": {"year": int(month[:4]), "payslips.month": month}},
+            {"$unwind": "$payslips"},
+            {"$match": {"payslips.month": month}},
+            {"$project": {"_id": 0, "employee_id": 1, **{
+                field: f"$payslips.{field}" for field in ("basic_salary", "allowances", "deductions", "salary_types")
+            }}},
+        ]
+
+    @staticmethod
+    def _unpack(bucket: dict, from_month: Optional[str] = None, to_month: Optional[str] = None) -> List[dict]:
+        return [
+            {**payslip, "employee_id": bucket["employee_id"]}
+            for payslip in bucket.get("payslips", [])
+            if (from_month is None or payslip["month"] >= from_month) and (to_month is None or payslip["month"] <= to_month)
+        ]
+
+    async def archive(self, payslips: List[dict]):
+        """Add payslips to their buckets in one bulk write; archiving a payslip again changes nothing"""
+        buckets = defaultdict(list)
+        for payslip in payslips:
+            compact = {k: v for k, v in payslip.items() if k not in ("_id", "employee_id")}
+            buckets[(payslip["employee_id"], int(payslip["month"][:4]))].append(compact)
+        if buckets:
+            await self.collection.bulk_write([
+                UpdateOne({"employee_id": employee_id, "year": year},
+                          {"$addToSet": {"payslips": {"$each": items}}}, upsert=True)
+                for (employee_id, year), items in buckets.items()
+            ], ordered=False)
+            await self._changed()
+
+    async def list(self, employee_ids=None, from_month: Optional[str] = None, to_month: Optional[str] = None) -> List[dict]:
+        """Archived payslips in the month range; only the buckets of the years it covers are read"""
+        if isinstance(employee_ids, str):
+            query = {"employee_id": employee_ids}
+        elif employee_ids is not None:
+            query = {"employee_id": {"$in": list(employee_ids)}}
+        else:
+            query = {}
+        if from_month:
+            query["year"] = {"$gte": int(from_month[:4])}
+        if to_month:
+            query.setdefault("year", {})["$lte"] = int(to_month[:4])
+        buckets = await self._find(query, limit=None)
+        return [payslip for bucket in buckets for payslip in self._unpack(bucket, from_month, to_month)]
+
+    async def get_payslip(self, payslip_id: str) -> Optional[dict]:
+        bucket = await self._find_one({"payslips.id": payslip_id})
+        if not bucket:
+            return None
+        return next((p for p in self._unpack(bucket) if p["id"] == payslip_id), None)
+
+    async def has(self, employee_id: str, month: str) -> bool:
+        return await self._exists({"employee_id": employee_id, "year": int(month[:4]), "payslips.month": month})
+
+    async def delete_payslip(self, payslip_id: str) -> bool:
+        result = await self.collection.update_one({"payslips.id": payslip_id}, {"$pull": {"payslips": {"id": payslip_id}}})
+        await self._changed()
+        return result.modified_count > 0
+
+    async def delete_for_employee(self, employee_id: str):
+        await self.collection.delete_many({"employee_id": employee_id})
+        await self._changed()
+
+class LeavePolicyRepository(Repository):
+    collection_name = "leave_policies"
+
+class PolicyAssignmentRepository(Repository):
+    collection_name = "employee_policy_assignments"
+
+    async def for_employee(self, employee_id: str) -> Optional[dict]:
+        return await self._find_one({"employee_id": employee_id})
+
+    async def for_employees(self, employee_ids: List[str]) -> List[dict]:
+        return await self._find({"employee_id": {"$in": employee_ids}}, sort=[("employee_id", 1)], limit=None)
+
+    async def set_policy(self, employee_id: str, policy_id: str):
+        await self.collection.update_one(
+            {"employee_id": employee_id},
+            {"$set": {"leave_policy_id": policy_id}}
+        )
+        await self._changed()
+
+    async def policy_in_use(self, policy_id: str) -> bool:
+        return await self._exists({"leave_policy_id": policy_id})
+
+    async def count(self) -> int:
+        return await self._reads.count_documents({})
+
+    async def page_after(self, employee_id: Optional[str], limit: int) -> List[dict]:
+        """The next `limit` assignments in employee_id order, for keyset-paginated batch jobs"""
+        query = {"employee_id": {"$gt": employee_id}} if employee_id else {}
+        return await self._find(query, sort=[("employee_id", 1)], limit=limit)
+
+class LeaveRequestRepository(Repository):
+    collection_name = "leave_requests"
+    synced = True
+    tombstone_fields = ("employee_id",)
+
+    async def search(
+        self,
+        status: Optional[str] = None,
+        leave_type: Optional[str] = None,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        employee_ids=None,
+        skip: int = 0,
+        limit: int = 1000,
+    ) -> List[dict]:
+        """Newest first. `employee_ids` is one id or a list; dates select requests overlapping the window."""
+        query = {}
+        if status:
+            query["status"] = status
+        if leave_type:
+            query["leave_type"] = leave_type
+        if from_date:
+            query["end_date"] = {"$gte": from_date}
+        if to_date:
+            query["start_date"] = {"$lte": to_date}
+        if isinstance(employee_ids, str):
+            query["employee_id"] = employee_ids
+        elif employee_ids is not None:
+            query["employee_id"] = {"$in": list(employee_ids)}
+        return await self._find(query, sort=[("created_at", -1)], limit=limit, skip=skip)
+
+    async def overlapping(
+        self, from_date: str, to_date: str, statuses: List[str], employee_ids: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Requests in `statuses` overlapping the window, served by the (status, start_date, end_date) index"""
+        query = {"status": {"$in": statuses}, "start_date": {"$lte": to_date}, "end_date": {"$gte": from_date}}
+        if employee_ids is not None:
+            query["employee_id"] = {"$in": employee_ids}
+        return await self._find(
+            query,
+            {"_id": 0, "id": 1, "employee_id": 1, "leave_type": 1, "status": 1, "start_date": 1, "end_date": 1},
+            limit=None,
+        )
+
+    async def set_status(self, request_id: str, status: str) -> Optional[dict]:
+        """Set one request's status and return the updated document, or None if it doesn't exist"""
+        updated = await self.collection.find_one_and_update(
+            {"id": request_id}, {"$set": self._touched({"status": status})},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+        await self._changed()
+        return updated
+
+    async def statuses(self, request_ids: List[str]) -> Dict[str, dict]:
+        """id -> status, employee and start date; what a status change needs to check and follow up on"""
+        docs = await self._find(
+            {"id": {"$in": request_ids}},
+            {"_id": 0, "id": 1, "status": 1, "employee_id": 1, "start_date": 1},
+            limit=None,
+        )
+        return {doc["id"]: doc for doc in docs}
+
+    async def set_statuses(self, changes: Dict[str, Tuple[str, str]]) -> Set[str]:
+        """Apply id -> (status read, new status) changes in one write; returns the ids that had moved on.
+
+        Each update only matches while the request still has the status the
+        caller read, so of two approvers racing on one request only one wins,
+        even when both set the same status. The updates stamp a per-call
+        `status_change_id`, so after a partial match the ids this call changed
+        can be told apart from the ones another caller got to first.
+        Uses update_many when every change is the same transition, else bulk_write.
+        """
+        if not changes:
+            return set()
+        change_id = str(uuid4())
+        transitions = set(changes.values())
+        if len(transitions) == 1:
+            expected, status = transitions.pop()
+            result = await self.collection.update_many(
+                {"id": {"$in": list(changes)}, "status": expected},
+                {"$set": self._touched({"status": status, "status_change_id": change_id})},
+            )
+        else:
+            result = await self.collection.bulk_write([
+                UpdateOne(
+                    {"id": request_id, "status": expected},
+                    {"$set": self._touched({"status": status, "status_change_id": change_id})},
+                )
+                for request_id, (expected, status) in changes.items()
+            ], ordered=False)
+        await self._changed()
+        if result.modified_count == len(changes):
+            return set()
+        docs = await self.collection.find(
+            {"id": {"$in": list(changes)}, "status_change_id": change_id}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        return set(changes) - {doc["id"] for doc in docs}
+
+    async def approved_for_employee(self, employee_id: str, from_date: str, to_date: str) -> List[dict]:
+        """Approved requests starting inside the window (a leave year)"""
+        return await self._find(
+            {"employee_id": employee_id, "status": "approved", "start_date": {"$gte": from_date, "$lte": to_date}},
+            {"_id": 0, "leave_type": 1, "start_date": 1, "end_date": 1},
+            limit=None,
+        )
+
+    async def approved_days_by_type(
+        self, employee_ids: List[str], from_date: str, to_date: str
+    ) -> Dict[Tuple[str, str], int]:
+        """Approved leave days per (employee_id, leave_type) for requests starting inside the window"""
+        groups = await self._reads.aggregate([
+            {"$match": {
+                "employee_id": {"$in": employee_ids}, "status": "approved",
+                "start_date": {"$gte": from_date, "$lte": to_date},
+            }},
+            {"$group": {
+                "_id": {"employee_id": "$employee_id", "leave_type": "$leave_type"},
+                "requests": {"$push": {"start_date": "$start_date", "end_date": "$end_date"}},
+            }},
+        ]).to_list(None)
+        return {
+            (g["_id"]["employee_id"], g["_id"]["leave_type"]): sum(leave_days(r) for r in g["requests"])
+            for g in groups
+        }
+
+class LeaveBalanceRepository(Repository):
+    """Opening balances per (employee_id, year, leave_type), written by the year-end closing"""
+    collection_name = "leave_balances"
+
+    async def carried_forward(self, employee_ids: List[str], year: int) -> Dict[Tuple[str, str], int]:
+        docs = await self._find(
+            {"employee_id": {"$in": employee_ids}, "year": year},
+            {"_id": 0, "employee_id": 1, "leave_type": 1, "carried_forward_days": 1},
+            limit=None,
+        )
+        return {(d["employee_id"], d["leave_type"]): d["carried_forward_days"] for d in docs}
+
+    async def write_openings(self, openings: List[dict]):
+        """Upsert openings by (employee_id, year, leave_type), so writing the same batch twice is harmless"""
+        if not openings:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"employee_id": o["employee_id"], "year": o["year"], "leave_type": o["leave_type"]},
+                {"$set": {**o, "updated_at": now}, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True,
+            )
+            for o in openings
+        ], ordered=False)
+        await self._changed()
+
+class LeaveYearClosingRepository(Repository):
+    """Progress of each year-end closing: status plus the last employee_id written"""
+    collection_name = "leave_year_closings"
+    routed = False
+
+    async def start(self, year: int, restart: bool = False) -> dict:
+        fresh = {"status": "running", "last_employee_id": None, "processed": 0,
+                 "started_at": datetime.now(timezone.utc).isoformat(), "completed_at": None}
+        update = {"$set": fresh} if restart else {"$setOnInsert": fresh}
+        return await self.collection.find_one_and_update(
+            {"year": year}, update, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    async def since(self, year: int) -> Dict[int, dict]:
+        """Closings of `year` and later, by year"""
+        return {c["year"]: c for c in await self._find({"year": {"$gte": year}}, limit=None)}
+
+    async def checkpoint(self, year: int, last_employee_id: str, processed: int):
+        await self.collection.update_one(
+            {"year": year}, {"$set": {"last_employee_id": last_employee_id}, "$inc": {"processed": processed}}
+        )
+
+    async def complete(self, year: int) -> dict:
+        return await self.collection.find_one_and_update(
+            {"year": year},
+            {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+class JobRepository(Repository):
+    """Persistent jobs. Lease updates only match while the caller still holds the lease."""
+    collection_name = "jobs"
+    routed = False
+
+    @staticmethod
+    def dedupe_key(params: dict) -> str:
+        return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+    async def active(self, job_type: str, params: dict) -> Optional[dict]:
+        return await self._find_one(
+            {"type": job_type, "dedupe_key": self.dedupe_key(params), "status": {"$in": ["queued", "running"]}}
+        )
+
+    async def claim(self, owner: str, lease_seconds: float) -> Optional[dict]:
+        """Lease the oldest runnable job: queued and due, or running on a lease that has expired"""
+        now = datetime.now(timezone.utc)
+        lease = {
+            "status": "running", "lease_owner": owner, "updated_at": now.isoformat(),
+            "lease_expires_at": (now + timedelta(seconds=lease_seconds)).isoformat(),
+        }
+        job = await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now.isoformat()}},
+                {"status": "running", "lease_expires_at": {"$lt": now.isoformat()}},
+            ]},
+            {"$set": lease, "$inc": {"attempts": 1}},
+            projection={"_id": 0}, sort=[("created_at", 1)],
+        )
+        if job is not None:
+            job.update(lease, attempts=job["attempts"] + 1)
+        return job
+
+    async def update_leased(self, job_id: str, owner: str, fields: dict, lease_seconds: Optional[float] = None) -> bool:
+        """Apply `fields`, extending the lease when `lease_seconds` is given; False once the lease is lost"""
+        now = datetime.now(timezone.utc)
+        fields = {**fields, "updated_at": now.isoformat()}
+        if lease_seconds is not None:
+            fields["lease_expires_at"] = (now + timedelta(seconds=lease_seconds)).isoformat()
+        result = await self.collection.update_one(
+            {"id": job_id, "lease_owner": owner, "status": "running"}, {"$set": fields}
+        )
+        return result.matched_count == 1
+
+    async def release(self, job_id: str, owner: str):
+        """Hand a job back to the queue without spending an attempt, e.g. on shutdown"""
+        await self.collection.update_one(
+            {"id": job_id, "lease_owner": owner, "status": "running"},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None},
+             "$inc": {"attempts": -1}},
+        )
+
+class IdempotencyKeyRepository(Repository):
+    """Responses stored per (user_id, Idempotency-Key) while a key is live"""
+    collection_name = "idempotency_keys"
+    routed = False
+
+    async def begin(self, user_id: str, key: str, endpoint: str, request_hash: str) -> Optional[dict]:
+        """Claim the key. Returns None when claimed, else the record already holding it."""
+        now = datetime.now(timezone.utc)
+        record = {"user_id": user_id, "key": key, "endpoint": endpoint, "request_hash": request_hash,
+                  "status": "in_progress", "response": None, "created_at": now}
+        try:
+            await self.collection.insert_one(record)
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a key whose first request died before finishing
+        stale = await self.collection.find_one_and_update(
+            {"user_id": user_id, "key": key, "status": "in_progress",
+             "created_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+            {"$set": {"endpoint": endpoint, "request_hash": request_hash, "created_at": now}},
+        )
+        if stale is not None:
+            return None
+        return await self.collection.find_one({"user_id": user_id, "key": key}, {"_id": 0})
+
+    async def complete(self, user_id: str, key: str, response):
+        await self.collection.update_one(
+            {"user_id": user_id, "key": key}, {"$set": {"status": "completed", "response": response}}
+        )
+
+    async def release(self, user_id: str, key: str):
+        await self.collection.delete_one({"user_id": user_id, "key": key, "status": "in_progress"})
+
+class HolidayRepository(Repository):
+    collection_name = "holidays"
+    default_sort = [("date", 1)]
+    synced = True
+
+    async def by_date(self, date: str) -> Optional[dict]:
+        return await self._cached(("date", date), lambda: self._find_one({"date": date}))
+
+    async def existing_dates(self, dates: List[str]) -> Set[str]:
+        docs = await self._find({"date": {"$in": dates}}, {"_id": 0, "date": 1}, limit=None)
+        return {doc["date"] for doc in docs}
+
+class PrintFormatRepository(Repository):
+    collection_name = "print_formats"
+
+    async def default(self) -> Optional[dict]:
+        return await self._cached(("default",), lambda: self._find_one({"is_default": True}))
+
+    async def clear_default(self):
+        await self.collection.update_many({}, {"$set": {"is_default": False}})
+        await self._changed()
+
+class Repositories:
+    """One repository per collection; reference collections are cached when `cache_ttl` > 0"""
+
+    def __init__(self, cache_ttl: float = REFERENCE_CACHE_TTL, bus: Optional[InvalidationBus] = None):
+        def cache():
+            return ReadThroughCache(cache_ttl) if cache_ttl > 0 else None
+
+        self.users = UserRepository(bus=bus)
+        self.employees = EmployeeRepository(bus=bus)
+        self.departments = DepartmentRepository(cache(), bus)
+        self.payroll = PayrollRepository(bus=bus)
+        self.payroll_structures = PayrollStructureRepository(cache(), bus)
+        self.payslips = PayslipRepository(bus=bus)
+        self.payslip_archive = PayslipArchiveRepository(bus=bus)
+        self.leave_policies = LeavePolicyRepository(cache(), bus)
+        self.policy_assignments = PolicyAssignmentRepository(bus=bus)
+        self.leave_requests = LeaveRequestRepository(bus=bus)
+        self.leave_balances = LeaveBalanceRepository(bus=bus)
+        self.leave_year_closings = LeaveYearClosingRepository(bus=bus)
+        self.jobs = JobRepository(bus=bus)
+        self.idempotency_keys = IdempotencyKeyRepository(bus=bus)
+        self.holidays = HolidayRepository(cache(), bus)
+        self.print_formats = PrintFormatRepository(cache(), bus)
+
+        if bus is not None:
+            # clear() bumps the cache generation, so a fetch in flight here when another
+            # worker writes doesn't store what it read before the write
+            for repo in vars(self).values():
+                if repo.cache is not None:
+                    bus.subscribe([repo.collection_name], lambda _collection, cache=repo.cache: cache.clear())
+
+repos = Repositories(bus=invalidation_bus)
+
+# ============= JOBS =============
+# Work too long for one HTTP request runs as a job: persisted in `jobs`, picked up
+# by any worker's queue, retried on failure and resumed from its last checkpoint.
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = 5  # seconds, doubled per attempt
+
+JOBS_FINISHED = Counter(
+    "jobs_finished_total", "Job attempts by type and outcome (succeeded, failed, retried)",
+    ["type", "outcome"],
+)
+
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+def job_handler(job_type: str):
+    """Register `async def handler(job: JobContext) -> Optional[dict]` for `job_type`"""
+    def register(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+class JobLeaseLost(Exception):
+    """The lease expired and another worker may have taken the job over"""
+
+class JobContext:
+    """A running job as its handler sees it: params, the last checkpoint and a way to save progress"""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.id = job["id"]
+        self.params = job.get("params") or {}
+        self.checkpoint = job.get("checkpoint")
+
+    async def save(self, checkpoint=None, done: Optional[int] = None, total: Optional[int] = None):
+        """Record progress and, if given, a checkpoint a retry resumes from. Also renews the lease."""
+        fields = {}
+        if checkpoint is not None:
+            fields["checkpoint"] = checkpoint
+        if done is not None:
+            fields["done"] = done
+        if total is not None:
+            fields["total"] = total
+        if not await repos.jobs.update_leased(self.id, self.queue.worker_id, fields, self.queue.lease_seconds):
+            raise JobLeaseLost(self.id)
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+
+class JobQueue:
+    """Runs jobs from the `jobs` collection on up to `workers` concurrent asyncio tasks.
+
+    A job is claimed by taking a lease on it, and a heartbeat renews the lease while
+    the handler runs. If the process dies the lease runs out and any worker claims the
+    job again; the handler resumes from its checkpoint. A handler that raises is
+    retried with backoff until `max_attempts` is spent.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_interval: float = JOB_POLL_INTERVAL, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.worker_id = uuid4().hex
+        self._wake: Optional[asyncio.Event] = None  # Set by enqueue so local jobs start without polling
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def enqueue(self, job_type: str, params: Optional[dict] = None, created_by: Optional[str] = None) -> dict:
+        """Queue a job, or return the one with the same type and params that is still queued or running"""
+        params = params or {}
+        existing = await repos.jobs.active(job_type, params)
+        if existing:
+            return existing
+        now = datetime.now(timezone.utc).isoformat()
+        job = {
+            "id": str(uuid.uuid4()), "type": job_type, "params": params,
+            "dedupe_key": repos.jobs.dedupe_key(params), "status": "queued",
+            "attempts": 0, "max_attempts": self.max_attempts, "done": 0, "total": None,
+            "checkpoint": None, "result": None, "error": None, "lease_owner": None, "lease_expires_at": None,
+            "run_after": now, "created_by": created_by, "created_at": now, "updated_at": now, "finished_at": None,
+        }
+        try:
+            await repos.jobs.insert({**job})
+        except DuplicateKeyError:
+            # A concurrent enqueue of the same job won between the check and the insert
+            existing = await repos.jobs.active(job_type, params)
+            if existing is None:
+                raise
+            return existing
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def _finish(self, job: dict, outcome: str, **fields):
+        await repos.jobs.update_leased(job["id"], self.worker_id, {
+            "status": outcome, "lease_expires_at": None,
+            "finished_at": datetime.now(timezone.utc).isoformat(), **fields,
+        })
+        JOBS_FINISHED.labels(job["type"], outcome).inc()
+
+    async def _heartbeat(self, job: dict, work: asyncio.Task, lost: list):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await repos.jobs.update_leased(job["id"], self.worker_id, {}, self.lease_seconds)
+            except Exception:
+                logger.exception(f"Renewing the lease on job {job['id']} failed")
+                continue
+            if not renewed:
+                lost.append(True)
+                work.cancel()
+                return
+
+    async def _execute(self, job: dict):
+        handler = JOB_HANDLERS.get(job["type"])
+        if handler is None:
+            await self._finish(job, "failed", error=f"Unknown job type '{job['type']}'")
+            return
+        if job["attempts"] > job["max_attempts"]:
+            # Claimed again after its lease ran out more often than it may be retried
+            await self._finish(job, "failed", error=job.get("error") or "Worker lost the job too many times")
+            return
+
+        work = asyncio.create_task(handler(JobContext(self, job)))
+        lost = []
+        heartbeat = asyncio.create_task(self._heartbeat(job, work, lost))
+        try:
+            result = await work
+        except asyncio.CancelledError:
+            if not lost:
+                # Shutting down: hand the job to the next worker right away
+                await repos.jobs.release(job["id"], self.worker_id)
+                raise
+            logger.warning(f"Job {job['id']} lost its lease; another worker will finish it")
+        except JobLeaseLost:
+            logger.warning(f"Job {job['id']} lost its lease; another worker will finish it")
+        except Exception as exc:
+            logger.exception(f"Job {job['id']} ({job['type']}) failed on attempt {job['attempts']}")
+            if job["attempts"] < job["max_attempts"]:
+                delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                run_after = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                await repos.jobs.update_leased(job["id"], self.worker_id, {
+                    "status": "queued", "lease_owner": None, "lease_expires_at": None,
+                    "run_after": run_after.isoformat(), "error": str(exc),
+                })
+                JOBS_FINISHED.labels(job["type"], "retried").inc()
+            else:
+                await self._finish(job, "failed", error=str(exc))
+        else:
+            await self._finish(job, "succeeded", result=result, error=None)
+        finally:
+            heartbeat.cancel()
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            await slots.acquire()
+            self._wake.clear()
+            try:
+                job = await repos.jobs.claim(self.worker_id, self.lease_seconds)
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+            if job is None:
+                slots.release()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                continue
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _task: slots.release())
+
+    async def start(self):
+        if self._task is None and self.workers > 0:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._running) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._wake = None
+
+job_queue = JobQueue()
+
+# ============= IDEMPOTENCY =============
+# Clients send an Idempotency-Key header to retry a write without repeating it.
+# The first successful response is stored and replayed for the same key and
+# request body until the key expires. Failed requests free the key again.
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = 60  # An unfinished request older than this is presumed dead
+
+async def run_idempotent(key: Optional[str], user: User, endpoint: str, payload: dict, response: Response, handler):
+    """Await `handler()` at most once per (user, key); repeats get the stored result"""
+    if not key:
+        return await handler()
+    request_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    existing = await repos.idempotency_keys.begin(user.id, key, endpoint, request_hash)
+    if existing is not None:
+        if existing["endpoint"] != endpoint or existing["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if existing["status"] != "completed":
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        response.headers["Idempotent-Replayed"] = "true"
+        return existing["response"]
+    try:
+        result = await handler()
+    except BaseException:
+        await repos.idempotency_keys.release(user.id, key)
+        raise
+    await repos.idempotency_keys.complete(user.id, key, jsonable_encoder(result))
+    return result
+
+# ============= CONDITIONAL GETS =============
+# Read-mostly lists carry an ETag built from the write versions of the collections
+# they are read from, so a client revalidating an unchanged list gets a 304 after
+# one lookup in `cache_versions` and no read of the data itself.
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+def collection_etag(*collections: str, auth: Callable = get_current_user):
+    """Route dependency: sets the ETag, or answers 304 when If-None-Match already has it.
+
+    `auth` is the route's own user dependency, so the check never runs before it.
+    """
+    invalidation_bus.subscribe(collections, lambda collection: single_flight.forget(collection))
+
+    async def check(request: Request, response: Response, user: User = Depends(auth)):
+        request.state.etag_collections = collections
+        versions = await invalidation_bus.versions(list(collections))
+        etag = 'W/"' + ".".join(f"{name}-{versions[name]}" for name in collections) + '"'
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in candidates or etag.removeprefix("W/") in candidates:
+                raise NotModified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+
+    return Depends(check)
+
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
+
+# ============= DELTA SYNC =============
+# Complete lists of synced collections send an X-Sync-Cursor header. Passing it back as
+# `?since=` returns only what changed or was deleted after it, plus the next
+# cursor. Deltas overlap by SYNC_OVERLAP_SECONDS so writes still in flight, or
+# stamped by a worker with a slightly slow clock, are not missed; clients apply
+# them idempotently by id. Deltas always read the primary; a full list read from
+# a secondary hands out a cursor moved back by the secondary's max staleness.
+
+SYNC_OVERLAP = timedelta(seconds=float(os.environ.get("SYNC_OVERLAP_SECONDS", "5")))
+SYNC_TOMBSTONE_TTL = int(os.environ.get("SYNC_TOMBSTONE_TTL", str(30 * 86400)))
+
+SYNC_CURSOR = Query(None, pattern=r"^\d{1,15}$", description="Cursor from a previous list or delta response")
+
+class SyncDelta(BaseModel):
+    changed: List[dict]
+    deleted: List[str]
+    cursor: str
+
+def sync_cursor(moment: datetime) -> str:
+    return str(int(moment.timestamp() * 1000))
+
+def list_cursor() -> str:
+    """Cursor for a full list about to be read under the route's read preference.
+
+    A secondary may be missing up to its max staleness of writes, so the cursor
+    is moved back by that much; with no staleness bound the list is read from
+    the primary instead.
+    """
+    now = datetime.now(timezone.utc)
+    preference = route_read_preference.get()
+    if preference is None or preference.mode == Primary().mode:
+        return sync_cursor(now)
+    if preference.max_staleness == -1:
+        route_read_preference.set(None)
+        return sync_cursor(now)
+    return sync_cursor(now - timedelta(seconds=preference.max_staleness))
+
+async def sync_delta(repo: Repository, cursor: str, scope: Optional[dict] = None) -> JSONResponse:
+    """Changes and deletions in `repo` since `cursor`, restricted to documents matching `scope`.
+
+    Read from the primary: a lagging secondary could leave out writes older than
+    the next cursor, and the client would never see them.
+    """
+    route_read_preference.set(None)
+    now = datetime.now(timezone.utc)
+    since = datetime.fromtimestamp(int(cursor) / 1000, tz=timezone.utc)
+    if since < now - timedelta(seconds=SYNC_TOMBSTONE_TTL):
+        # Tombstones this old have expired, so deletions could be missed
+        raise HTTPException(status_code=410, detail="Sync cursor expired; reload the full list")
+    changed = await repo.changed_since(since - SYNC_OVERLAP, scope)
+    deleted = await repo.deleted_since(since - SYNC_OVERLAP, scope)
+    delta = SyncDelta(changed=changed, deleted=deleted, cursor=sync_cursor(now))
+    return JSONResponse(content=jsonable_encoder(delta))
+
+# ============= REQUEST COALESCING =============
+# Bursts of identical reads of the hot reference lists share one fetch and one
+# serialized body. Requests are identical when route, query string, role and
+# ETag all match; the ETag keeps a request that arrives after a write from
+# joining a fetch that started before it.
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total",
+    "Coalescable requests by route and outcome (leader ran the fetch, shared joined one in flight)",
+    ["route", "outcome"],
+)
+
+class SingleFlight:
+    """Runs one `produce()` per key at a time; concurrent callers with the key await its result.
+
+    Nothing is kept once the flight lands, so this coalesces bursts without caching.
+    The flight runs as its own task, so a leader whose client disconnects doesn't
+    cancel it for the callers sharing it. A write to one of the flight's `collections`
+    calls `forget`, so callers arriving after it start a fresh flight instead of
+    sharing a result read before the write.
+    """
+
+    def __init__(self):
+        self._flights: Dict[tuple, asyncio.Future] = {}
+        self._by_collection: Dict[str, Set[tuple]] = defaultdict(set)
+
+    async def run(self, key: tuple, produce, route: str = "", collections=()):
+        flight = self._flights.get(key)
+        if flight is None:
+            SINGLE_FLIGHT_REQUESTS.labels(route, "leader").inc()
+            flight = self._flights[key] = asyncio.ensure_future(produce())
+            for name in collections:
+                self._by_collection[name].add(key)
+
+            def landed(done):
+                if self._flights.get(key) is done:
+                    del self._flights[key]
+                for name in collections:
+                    self._by_collection[name].discard(key)
+
+            flight.add_done_callback(landed)
+        else:
+            SINGLE_FLIGHT_REQUESTS.labels(route, "shared").inc()
+        return await asyncio.shield(flight)
+
+    def forget(self, collection: str):
+        """Stop handing out flights that read `collection`; callers already waiting still get theirs"""
+        for key in self._by_collection.pop(collection, ()):
+            self._flights.pop(key, None)
+
+single_flight = SingleFlight()
+
+def render_json(content) -> bytes:
+    """Serialize like FastAPI's JSONResponse"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+async def coalesced_json(request: Request, response: Response, user: User, produce) -> Response:
+    """Respond with the JSON bytes from `produce()`, shared with identical requests in flight.
+
+    Headers set by dependencies on `response` (the ETag) are kept, since a
+    returned Response replaces the one FastAPI would have built. `produce` may
+    instead return `(body, headers)` for headers that depend on what it read.
+    """
+    route = request.scope["route"].name
+    key = (route, tuple(sorted(request.query_params.multi_items())), user.role, response.headers.get("etag"))
+    collections = getattr(request.state, "etag_collections", ())
+    body = await single_flight.run(key, produce, route, collections)
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    if isinstance(body, tuple):
+        body, produced = body
+        headers.update(produced)
+    return Response(body, media_type="application/json", headers=headers)
+
 # ============= AUTH ROUTES =============
 
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    existing = await repos.users.by_email(user_data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -305,16 +2292,11 @@ async def register(user_data: UserCreate):
     user_dict["hashed_password"] = get_password_hash(user_data.password)
     user_dict["created_at"] = user_dict["created_at"].isoformat()
     
-    await db.users.insert_one(user_dict)
+    await repos.users.insert(user_dict)
     
     # If user is employee, link to existing employee record if it exists
     if user.role == "employee":
-        employee_record = await db.employees.find_one({"email": user_data.email}, {"_id": 0})
-        if employee_record:
-            await db.employees.update_one(
-                {"email": user_data.email},
-                {"$set": {"user_id": user.id}}
-            )
+        await repos.employees.link_user(user_data.email, user.id)
     
     # Create tokens
     access_token = create_access_token(data={"sub": user.id, "role": user.role})
@@ -323,7 +2305,7 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(credentials: UserLogin):
-    user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+    user_doc = await repos.users.by_email(credentials.email)
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -360,7 +2342,7 @@ async def refresh_token(refresh_token_data: RefreshTokenRequest):
         raise credentials_exception
     
     # Get user
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user_doc = await repos.users.get(user_id)
     if user_doc is None:
         raise credentials_exception
     
@@ -379,92 +2361,297 @@ async def get_me(current_user: User = Depends(get_current_user)):
 # ============= DEPARTMENT ROUTES =============
 @api_router.get("/departments-with-count")
 async def list_departments_with_count(admin: User = Depends(get_admin_user)):
-    departments = await db.departments.find({}, {"_id": 0}).to_list(1000)
+    departments = await repos.departments.list_all()
 
+    count_by_department = await repos.employees.counts_by_department()
     for dept in departments:
-        count = await db.employees.count_documents({"department_id": dept["id"]})
-        dept["employee_count"] = count
+        dept["employee_count"] = count_by_department.get(dept["id"], 0)
+
+    return departments
+
+@api_router.post("/departments", response_model=Department)
+async def create_department(dept_data: DepartmentCreate, admin: User = Depends(get_admin_user)):
+    department = Department(**dept_data.model_dump())
+    dept_dict = department.model_dump()
+    dept_dict["created_at"] = dept_dict["created_at"].isoformat()
+    
+    await repos.departments.insert(dept_dict)
+    return department
+
+@api_router.get("/departments", response_model=List[Department], dependencies=[collection_etag("departments")])
+async def list_departments(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    async def body():
+        departments = await repos.departments.list_all()
+        for dept in departments:
+            if isinstance(dept.get("created_at"), str):
+                dept["created_at"] = datetime.fromisoformat(dept["created_at"])
+        return render_json([Department(**dept) for dept in departments])
+    return await coalesced_json(request, response, current_user, body)
+@api_router.delete("/departments/{department_id}")
+async def delete_department(department_id: str, admin: User = Depends(get_admin_user)):
+    emp_count = await repos.employees.count_in_department(department_id)
+
+    if emp_count > 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot delete department with assigned employees"
+        )
+
+    if not await repos.departments.delete(department_id):
+        raise HTTPException(status_code=404, detail="Department not found")
+
+    return {"message": "Department deleted successfully"}
+
+# ============= EMPLOYEE SEARCH INDEX =============
+
+class EmployeeSearchIndex:
+    """In-memory prefix/substring index over employee name, email and employee_id.
+
+    Prefix lookups bisect a sorted array of (term, id) pairs; substring lookups
+    intersect trigram posting sets. The index is built lazily from the database
+    on the first search and kept current by the employee write handlers.
+    """
+
+    SEARCH_FIELDS = ("name", "email", "employee_id")
+
+    def __init__(self):
+        self._reset()
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def _reset(self):
+        self._terms: List[Tuple[str, str]] = []
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._fields: Dict[str, Tuple[str, ...]] = {}
+        self._names: Dict[str, str] = {}
+        self._ready = False
+
+    def invalidate(self):
+        """Drop the index (another worker changed employees); the next search rebuilds it"""
+        self._generation += 1
+        self._reset()
+
+    @staticmethod
+    def _normalize(value) -> str:
+        return str(value or "").strip().lower()
+
+    def _terms_for(self, fields: Tuple[str, ...]) -> Set[str]:
+        name, email, employee_id = fields
+        terms = {t for t in (name, email, email.split("@")[0], employee_id) if t}
+        terms.update(word for word in name.split() if word)
+        return terms
+
+    @staticmethod
+    def _trigrams_for(value: str) -> Set[str]:
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    def _register(self, employee: dict) -> Set[str]:
+        emp_id = employee["id"]
+        fields = tuple(self._normalize(employee.get(f)) for f in self.SEARCH_FIELDS)
+        self._fields[emp_id] = fields
+        self._names[emp_id] = fields[0]
+        for value in fields:
+            for gram in self._trigrams_for(value):
+                self._trigrams[gram].add(emp_id)
+        return self._terms_for(fields)
+
+    def add(self, employee: dict):
+        """Insert or replace an employee in the index."""
+        emp_id = employee["id"]
+        if emp_id in self._fields:
+            self.remove(emp_id)
+        for term in self._register(employee):
+            bisect.insort(self._terms, (term, emp_id))
+
+    def remove(self, emp_id: str):
+        fields = self._fields.pop(emp_id, None)
+        if fields is None:
+            return
+        self._names.pop(emp_id, None)
+        for term in self._terms_for(fields):
+            pos = bisect.bisect_left(self._terms, (term, emp_id))
+            if pos < len(self._terms) and self._terms[pos] == (term, emp_id):
+                del self._terms[pos]
+        for value in fields:
+            for gram in self._trigrams_for(value):
+                postings = self._trigrams.get(gram)
+                if postings is not None:
+                    postings.discard(emp_id)
+                    if not postings:
+                        del self._trigrams[gram]
+
+    async def ensure_built(self):
+        if self._ready:
+            return
+        async with self._lock:
+            projection = {"_id": 0, "id": 1, **{f: 1 for f in self.SEARCH_FIELDS}}
+            while not self._ready:
+                # Start over if an invalidation lands while the build is in progress
+                generation = self._generation
+                self._reset()
+                terms = []
+                async for employee in repos.employees.iter_all(projection):
+                    terms.extend((term, employee["id"]) for term in self._register(employee))
+                if generation != self._generation:
+                    continue
+                terms.sort()
+                self._terms = terms
+                self._ready = True
+                logging.info(f"Employee search index built with {len(self._fields)} employees")
+
+    def add_if_built(self, employee: dict):
+        if self._ready:
+            self.add(employee)
+        else:
+            # A build in progress may already have read past this employee
+            self._generation += 1
+
+    def remove_if_built(self, emp_id: str):
+        if self._ready:
+            self.remove(emp_id)
+        else:
+            self._generation += 1
 
-    return departments
+    def search(self, query: str, limit: int = 20) -> List[str]:
+        """Return up to `limit` employee ids ranked by match quality.
 
-@api_router.post("/departments", response_model=Department)
-async def create_department(dept_data: DepartmentCreate, admin: User = Depends(get_admin_user)):
-    department = Department(**dept_data.model_dump())
-    dept_dict = department.model_dump()
-    dept_dict["created_at"] = dept_dict["created_at"].isoformat()
-    
-    await db.departments.insert_one(dept_dict)
-    return department
+        Ranking: exact field match, then whole-field prefix, then word prefix,
+        then substring (queries of 3+ characters only, stopping once `limit`
+        results are found). Ties break on name.
+        """
+        q = self._normalize(query)
+        if not q:
+            return []
 
-@api_router.get("/departments", response_model=List[Department])
-async def list_departments(current_user: User = Depends(get_current_user)):
-    departments = await db.departments.find({}, {"_id": 0}).to_list(1000)
-    for dept in departments:
-        if isinstance(dept.get("created_at"), str):
-            dept["created_at"] = datetime.fromisoformat(dept["created_at"])
-    return departments
-@api_router.delete("/departments/{department_id}")
-async def delete_department(department_id: str, admin: User = Depends(get_admin_user)):
-    emp_count = await db.employees.count_documents({"department_id": department_id})
+        scores: Dict[str, int] = {}
+        max_scan = limit * 20
+        pos = bisect.bisect_left(self._terms, (q, ""))
+        scanned = 0
+        while pos < len(self._terms) and scanned < max_scan:
+            term, emp_id = self._terms[pos]
+            if not term.startswith(q):
+                break
+            fields = self._fields[emp_id]
+            if term in fields:
+                score = 3 if term == q else 2
+            else:
+                score = 1
+            if score > scores.get(emp_id, 0):
+                scores[emp_id] = score
+            pos += 1
+            scanned += 1
 
-    if emp_count > 0:
-        raise HTTPException(
-            status_code=400,
-            detail="Cannot delete department with assigned employees"
-        )
+        if len(scores) < limit and len(q) >= 3:
+            postings = sorted(
+                (self._trigrams.get(gram, set()) for gram in self._trigrams_for(q)),
+                key=len,
+            )
+            smallest, others = postings[0], postings[1:]
+            wanted = limit - len(scores)
+            for emp_id in smallest:
+                if emp_id in scores or not all(emp_id in p for p in others):
+                    continue
+                if any(q in value for value in self._fields[emp_id]):
+                    scores[emp_id] = 0
+                    wanted -= 1
+                    if not wanted:
+                        break
 
-    result = await db.departments.delete_one({"id": department_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Department not found")
+        ranked = sorted(scores, key=lambda i: (-scores[i], self._names.get(i, "")))
+        return ranked[:limit]
 
-    return {"message": "Department deleted successfully"}
+employee_search_index = EmployeeSearchIndex()
+invalidation_bus.subscribe(["employees"], lambda _collection: employee_search_index.invalidate())
 
 # ============= EMPLOYEE ROUTES =============
 @api_router.delete("/employees/{employee_id}")
 async def delete_employee(employee_id: str, admin: User = Depends(get_admin_user)):
-    result = await db.employees.delete_one({"id": employee_id})
-    
-    if result.deleted_count == 0:
+    if not await repos.employees.delete(employee_id):
         raise HTTPException(status_code=404, detail="Employee not found")
+    employee_search_index.remove_if_built(employee_id)
     
     # Delete associated payroll record if it exists
     # This ensures the employee_count in payroll structures is updated correctly
-    await db.payroll.delete_one({"employee_id": employee_id})
+    await repos.payroll.delete_for_employee(employee_id)
     
     # Delete all associated payslips
-    await db.payslips.delete_many({"employee_id": employee_id})
+    await repos.payslips.delete_for_employee(employee_id)
+    await repos.payslip_archive.delete_for_employee(employee_id)
     
     return {"message": "Employee deleted successfully"}
 
 @api_router.post("/employees", response_model=Employee)
 async def create_employee(employee_data: EmployeeCreate, admin: User = Depends(get_admin_user)):
     # Check if employee exists
-    existing = await db.employees.find_one({"email": employee_data.email}, {"_id": 0})
+    existing = await repos.employees.by_email(employee_data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Employee with this email already exists")
     
     employee = Employee(**employee_data.model_dump())
+    if employee.reporting_manager_id:
+        manager = await repos.employees.get(employee.reporting_manager_id)
+        if not manager:
+            raise HTTPException(status_code=400, detail="Reporting manager not found")
+        employee.ancestors = manager.get("ancestors", []) + [manager["id"]]
     employee_dict = employee.model_dump()
     employee_dict["created_at"] = employee_dict["created_at"].isoformat()
     
-    await db.employees.insert_one(employee_dict)
+    await repos.employees.insert(employee_dict)
+    employee_search_index.add_if_built(employee_dict)
     
     # Dummy email invitation (Brevo disabled for now)
     logging.info(f"[DUMMY] Email invitation sent to {employee.email}")
     
     return employee
 
-@api_router.get("/employees", response_model=List[Employee])
-async def list_employees(current_user: User = Depends(get_current_user)):
-    employees = await db.employees.find({}, {"_id": 0}).to_list(1000)
+@api_router.get("/employees", response_model=EmployeeRows, response_model_exclude_unset=True)
+async def list_employees(
+    response: Response,
+    view: Literal["full", "summary"] = "full",
+    fields: Optional[str] = None,
+    since: Optional[str] = SYNC_CURSOR,
+    current_user: User = Depends(get_current_user)
+):
+    """All employees, or with `since` a SyncDelta of full documents changed or deleted after that cursor"""
+    if since:
+        return await sync_delta(repos.employees, since)
+    projection = build_projection(Employee, EMPLOYEE_SUMMARY_FIELDS, view, fields)
+    response.headers["X-Sync-Cursor"] = list_cursor()
+    if projection:
+        return await repos.employees.list(projection)
+    
+    employees = await repos.employees.list()
     for emp in employees:
         if isinstance(emp.get("created_at"), str):
             emp["created_at"] = datetime.fromisoformat(emp["created_at"])
     return employees
 
+@api_router.get("/employees/search", response_model=List[Employee])
+async def search_employees(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """Prefix and substring search on name, email and employee_id"""
+    await employee_search_index.ensure_built()
+    ids = employee_search_index.search(q, limit)
+    if not ids:
+        return []
+    
+    by_id = await repos.employees.get_many(ids)
+    results = []
+    for emp_id in ids:
+        emp = by_id.get(emp_id)
+        if not emp:
+            continue
+        if isinstance(emp.get("created_at"), str):
+            emp["created_at"] = datetime.fromisoformat(emp["created_at"])
+        results.append(emp)
+    return results
+
 @api_router.get("/employees/{employee_id}", response_model=Employee)
 async def get_employee(employee_id: str, current_user: User = Depends(get_current_user)):
-    employee = await db.employees.find_one({"id": employee_id}, {"_id": 0})
+    employee = await repos.employees.get(employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     if isinstance(employee.get("created_at"), str):
@@ -473,18 +2660,27 @@ async def get_employee(employee_id: str, current_user: User = Depends(get_curren
 
 @api_router.put("/employees/{employee_id}", response_model=Employee)
 async def update_employee(employee_id: str, employee_data: EmployeeUpdate, admin: User = Depends(get_admin_user)):
-    employee = await db.employees.find_one({"id": employee_id}, {"_id": 0})
+    employee = await repos.employees.get(employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
     update_data = {k: v for k, v in employee_data.model_dump().items() if v is not None}
+    manager_id = update_data.get("reporting_manager_id")
+    moved = manager_id is not None and manager_id != employee.get("reporting_manager_id")
+    if moved:
+        manager = await repos.employees.get(manager_id)
+        if not manager:
+            raise HTTPException(status_code=400, detail="Reporting manager not found")
+        update_data["ancestors"] = manager.get("ancestors", []) + [manager["id"]]
+        if employee_id in update_data["ancestors"]:
+            raise HTTPException(status_code=400, detail="An employee cannot report to someone in their own team")
     if update_data:
-        await db.employees.update_one(
-            {"id": employee_id},
-            {"$set": update_data}
-        )
+        await repos.employees.update(employee_id, update_data)
+    if moved:
+        await repos.employees.move_subtree(employee_id, update_data["ancestors"])
     
-    updated = await db.employees.find_one({"id": employee_id}, {"_id": 0})
+    updated = await repos.employees.get(employee_id)
+    employee_search_index.add_if_built(updated)
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
     return Employee(**updated)
@@ -492,29 +2688,32 @@ async def update_employee(employee_id: str, employee_data: EmployeeUpdate, admin
 @api_router.get("/employees/{employee_id}/org-tree")
 async def get_employee_org_tree(employee_id: str, current_user: User = Depends(get_current_user)):
     """Get organizational tree for an employee showing subordinates"""
-    employee = await db.employees.find_one({"id": employee_id}, {"_id": 0})
+    employee = await repos.employees.get(employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Get all subordinates recursively
-    async def get_subordinates(manager_id):
-        subordinates = await db.employees.find({"reporting_manager_id": manager_id}, {"_id": 0}).to_list(1000)
-        result = []
-        for sub in subordinates:
-            sub_data = {
-                **sub,
-                "subordinates": await get_subordinates(sub["id"])
-            }
-            result.append(sub_data)
-        return result
-    
-    org_tree = {
-        **employee,
-        "subordinates": await get_subordinates(employee_id)
-    }
+    # The whole subtree in one indexed query on `ancestors`; attach shallowest first
+    org_tree = {**employee, "subordinates": []}
+    nodes = {employee_id: org_tree}
+    subordinates = await repos.employees.under(employee_id)
+    for sub in sorted(subordinates, key=lambda e: len(e["ancestors"])):
+        parent = nodes.get(sub.get("reporting_manager_id"))
+        if parent is None:
+            continue
+        node = {**sub, "subordinates": []}
+        parent["subordinates"].append(node)
+        nodes[sub["id"]] = node
     
     return org_tree
 
+@api_router.get("/employees/{employee_id}/headcount")
+async def get_employee_headcount(employee_id: str, current_user: User = Depends(get_current_user)):
+    """Direct reports and everyone under the employee, counted from the index"""
+    if not await repos.employees.get(employee_id):
+        raise HTTPException(status_code=404, detail="Employee not found")
+    direct, total = await repos.employees.count_reports(employee_id)
+    return {"employee_id": employee_id, "direct_reports": direct, "total_reports": total}
+
 # ============= PAYROLL ROUTES =============
 @api_router.delete("/payroll-structures/{structure_id}")
 async def delete_payroll_structure(
@@ -522,19 +2721,14 @@ async def delete_payroll_structure(
     admin: User = Depends(get_admin_user)
 ):
     # 1. Check if any employee is using this payroll structure
-    assigned_employee = await db.payroll.find_one(
-        {"payroll_structure_id": structure_id}
-    )
-
-    if assigned_employee:
+    if await repos.payroll.structure_in_use(structure_id):
         raise HTTPException(
             status_code=400,
             detail="This payroll structure is assigned to employees and cannot be deleted."
         )
 
     # 2. If not assigned, allow deletion
-    result = await db.payroll_structures.delete_one({"id": structure_id})
-    if result.deleted_count == 0:
+    if not await repos.payroll_structures.delete(structure_id):
         raise HTTPException(status_code=404, detail="Structure not found")
 
     return {"message": "Payroll structure deleted successfully"}
@@ -560,12 +2754,7 @@ async def update_payroll_structure(
     if data.print_format_id is not None:
         update_data["print_format_id"] = data.print_format_id
     
-    result = await db.payroll_structures.update_one(
-        {"id": structure_id},
-        {"$set": update_data}
-    )
-
-    if result.matched_count == 0:
+    if not await repos.payroll_structures.update(structure_id, update_data):
         raise HTTPException(status_code=404, detail="Structure not found")
 
     return {"message": "Payroll structure updated"}
@@ -591,41 +2780,37 @@ async def create_payroll_structure(
     structure_dict["salary_types"] = [s.model_dump() for s in structure.salary_types]
     structure_dict["created_at"] = structure_dict["created_at"].isoformat()
 
-    await db.payroll_structures.insert_one(structure_dict)
+    await repos.payroll_structures.insert(structure_dict)
     return structure
 
 
-@api_router.get("/payroll-structures", response_model=List[PayrollStructure])
+@api_router.get("/payroll-structures", response_model=List[PayrollStructure],
+                dependencies=[collection_etag("payroll_structures", "payroll", auth=get_admin_user)])
 async def list_payroll_structures(admin: User = Depends(get_admin_user)):
-    structures = await db.payroll_structures.find({}, {"_id": 0}).to_list(1000)
+    structures = await repos.payroll_structures.list_all()
+    count_by_structure = await repos.payroll.counts_by_structure()
     for struct in structures:
-        count = await db.payroll.count_documents(
-            {"payroll_structure_id": struct["id"]}
-        )
-        struct["employee_count"] = count
+        struct["employee_count"] = count_by_structure.get(struct["id"], 0)
     return structures
 
 @api_router.post("/payroll", response_model=Payroll)
 async def assign_payroll(payroll_data: PayrollCreate, admin: User = Depends(get_admin_user)):
     # Check if employee exists
-    employee = await db.employees.find_one({"id": payroll_data.employee_id}, {"_id": 0})
+    employee = await repos.employees.get(payroll_data.employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
     # Check if payroll structure exists
-    structure = await db.payroll_structures.find_one({"id": payroll_data.payroll_structure_id}, {"_id": 0})
+    structure = await repos.payroll_structures.get(payroll_data.payroll_structure_id)
     if not structure:
         raise HTTPException(status_code=404, detail="Payroll structure not found")
     
     # Check if payroll already exists for this employee
-    existing = await db.payroll.find_one({"employee_id": payroll_data.employee_id}, {"_id": 0})
+    existing = await repos.payroll.for_employee(payroll_data.employee_id)
     if existing:
         # Update existing payroll
-        await db.payroll.update_one(
-            {"employee_id": payroll_data.employee_id},
-            {"$set": {"payroll_structure_id": payroll_data.payroll_structure_id}}
-        )
-        updated = await db.payroll.find_one({"employee_id": payroll_data.employee_id}, {"_id": 0})
+        await repos.payroll.set_structure(payroll_data.employee_id, payroll_data.payroll_structure_id)
+        updated = await repos.payroll.for_employee(payroll_data.employee_id)
         if isinstance(updated.get("created_at"), str):
             updated["created_at"] = datetime.fromisoformat(updated["created_at"])
         return Payroll(**updated)
@@ -634,19 +2819,19 @@ async def assign_payroll(payroll_data: PayrollCreate, admin: User = Depends(get_
     payroll_dict = payroll.model_dump()
     payroll_dict["created_at"] = payroll_dict["created_at"].isoformat()
     
-    await db.payroll.insert_one(payroll_dict)
+    await repos.payroll.insert(payroll_dict)
     return payroll
 
 @api_router.get("/payroll/{employee_id}")
 async def get_payroll(employee_id: str, admin: User = Depends(get_admin_user)):
-    payroll = await db.payroll.find_one({"employee_id": employee_id}, {"_id": 0})
+    payroll = await repos.payroll.for_employee(employee_id)
     if not payroll:
         return None
     if isinstance(payroll.get("created_at"), str):
         payroll["created_at"] = datetime.fromisoformat(payroll["created_at"])
     
     # Get payroll structure details
-    structure = await db.payroll_structures.find_one({"id": payroll["payroll_structure_id"]}, {"_id": 0})
+    structure = await repos.payroll_structures.get(payroll["payroll_structure_id"])
     if structure:
         return {
             **payroll,
@@ -654,42 +2839,156 @@ async def get_payroll(employee_id: str, admin: User = Depends(get_admin_user)):
         }
     return payroll
 
+# ============= PRINT FORMAT RENDERING =============
+# Print formats are admin-authored Jinja templates. They render in a sandbox on a
+# small thread pool, never on the event loop. A render stops once it runs past
+# the time limit or its output passes the size cap. Threads can't be killed, so
+# the sandbox checks the deadline itself: on every call, every range() step and
+# every chunk of output.
+
+TEMPLATE_RENDER_WORKERS = int(os.environ.get("TEMPLATE_RENDER_WORKERS", "4"))
+TEMPLATE_RENDER_TIMEOUT = float(os.environ.get("TEMPLATE_RENDER_TIMEOUT", "2"))
+TEMPLATE_RENDER_MAX_CHARS = int(os.environ.get("TEMPLATE_RENDER_MAX_CHARS", str(2_000_000)))
+
+# Labelled by format id: formats are few and admin-created, and the point is to find the heavy ones
+PRINT_FORMAT_RENDER_LATENCY = Histogram(
+    "print_format_render_duration_seconds", "Print format render time by format id",
+    ["format_id"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+class TemplateLimitExceeded(TemplateError):
+    """A print format ran past the render time limit or the output size cap"""
+
+_render_deadline = threading.local()
+
+def check_render_deadline():
+    deadline = getattr(_render_deadline, "at", None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise TemplateLimitExceeded(f"Template took longer than {TEMPLATE_RENDER_TIMEOUT:g}s to render")
+
+class DeadlineRange:
+    """range() for templates: the sandbox's length cap, plus a deadline check per step"""
+
+    def __init__(self, *args):
+        self._range = safe_range(*args)
+
+    def __iter__(self):
+        for i in self._range:
+            check_render_deadline()
+            yield i
+
+    def __len__(self):
+        return len(self._range)
+
+    def __getitem__(self, index):
+        return self._range[index]
+
+class PrintFormatEnvironment(SandboxedEnvironment):
+    intercepted_binops = frozenset(["*", "**"])
+
+    def __init__(self):
+        super().__init__(loader=BaseLoader())
+        self.globals["range"] = DeadlineRange
+
+    def call(__self, __context, __obj, *args, **kwargs):
+        check_render_deadline()
+        return super().call(__context, __obj, *args, **kwargs)
+
+    def call_binop(self, context, operator, left, right):
+        # Refuse results that alone would blow the output cap ("x" * 10**9) or the CPU (7 ** 10**7)
+        if operator == "*":
+            for seq, times in ((left, right), (right, left)):
+                if isinstance(seq, (str, list, tuple)) and isinstance(times, int):
+                    if len(seq) * times > TEMPLATE_RENDER_MAX_CHARS:
+                        raise TemplateLimitExceeded("Template output is too large")
+        elif operator == "**" and isinstance(right, (int, float)) and abs(right) > 1000:
+            raise TemplateLimitExceeded("Exponent too large in template")
+        return super().call_binop(context, operator, left, right)
+
+print_format_env = PrintFormatEnvironment()
+render_pool = ThreadPoolExecutor(max_workers=TEMPLATE_RENDER_WORKERS, thread_name_prefix="print-format")
+
+@lru_cache(maxsize=128)
+def compile_print_format(source: str):
+    return print_format_env.from_string(source)
+
+def render_bounded(source: str, context: dict) -> str:
+    """Compile (cached) and render `source`, enforcing the deadline and size cap; runs on the pool"""
+    _render_deadline.at = time.monotonic() + TEMPLATE_RENDER_TIMEOUT
+    try:
+        parts, size = [], 0
+        for part in compile_print_format(source).generate(**context):
+            size += len(part)
+            if size > TEMPLATE_RENDER_MAX_CHARS:
+                raise TemplateLimitExceeded("Template output is too large")
+            check_render_deadline()
+            parts.append(part)
+        return "".join(parts)
+    except OverflowError as exc:
+        raise TemplateLimitExceeded(str(exc))
+    finally:
+        _render_deadline.at = None
+
+async def render_print_format(source: str, context: dict, format_id: str = "new") -> str:
+    """Render a print format off the event loop. Raises TemplateError for bad or runaway templates."""
+    started = time.perf_counter()
+    try:
+        # The render stops itself at the deadline; the extra second only covers a stuck pool
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(render_pool, render_bounded, source, context),
+            TEMPLATE_RENDER_TIMEOUT + 1,
+        )
+    except asyncio.TimeoutError:
+        raise TemplateLimitExceeded(f"Template took longer than {TEMPLATE_RENDER_TIMEOUT:g}s to render")
+    finally:
+        PRINT_FORMAT_RENDER_LATENCY.labels(format_id).observe(time.perf_counter() - started)
+
+def sample_payslip_context() -> dict:
+    """Sample data for previews and for test-rendering a format before it is saved"""
+    return {
+        "employee_name": "John Doe",
+        "employee_id": "EMP12AB34CD",
+        "employee_email": "john@company.com",
+        "department": "Engineering",
+        "month": "January 2025",
+        "basic_salary": 50000.00,
+        "allowances": 5000.00,
+        "deductions": 2000.00,
+        "net_pay": 53000.00,
+        "salary_types": [
+            {"type": "Basic Salary", "amount": 50000.00, "category": "earnings"},
+            {"type": "HRA", "amount": 5000.00, "category": "earnings"},
+            {"type": "Provident Fund", "amount": 2000.00, "category": "deductions"},
+        ],
+        "generated_date": datetime.now(timezone.utc).strftime("%B %d, %Y"),
+    }
+
 # ============= PRINT FORMAT ROUTES =============
 
 @api_router.post("/print-formats", response_model=PrintFormat)
 async def create_print_format(format_data: PrintFormatCreate, admin: User = Depends(get_admin_user)):
     # Validate Jinja2 template
     try:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(format_data.template_html)
-        # Test render with dummy data
-        template.render(
-            employee_name="Test Employee",
-            employee_id="EMP123",
-            month="2025-01",
-            basic_salary=5000,
-            allowances=500,
-            deductions=200,
-            net_pay=5300,
-            generated_date="2025-01-15"
-        )
+        await render_print_format(format_data.template_html, sample_payslip_context())
     except TemplateError as e:
         raise HTTPException(status_code=400, detail=f"Invalid Jinja2 template: {str(e)}")
     
     # If this is set as default, unset other defaults
     if format_data.is_default:
-        await db.print_formats.update_many({}, {"$set": {"is_default": False}})
+        await repos.print_formats.clear_default()
     
     print_format = PrintFormat(**format_data.model_dump())
     format_dict = print_format.model_dump()
     format_dict["created_at"] = format_dict["created_at"].isoformat()
     
-    await db.print_formats.insert_one(format_dict)
+    await repos.print_formats.insert(format_dict)
     return print_format
 
-@api_router.get("/print-formats", response_model=List[PrintFormat])
+@api_router.get("/print-formats", response_model=List[PrintFormat],
+                dependencies=[collection_etag("print_formats", auth=get_admin_user)])
 async def list_print_formats(admin: User = Depends(get_admin_user)):
-    formats = await db.print_formats.find({}, {"_id": 0}).to_list(1000)
+    formats = await repos.print_formats.list_all()
     for fmt in formats:
         if isinstance(fmt.get("created_at"), str):
             fmt["created_at"] = datetime.fromisoformat(fmt["created_at"])
@@ -697,7 +2996,7 @@ async def list_print_formats(admin: User = Depends(get_admin_user)):
 
 @api_router.get("/print-formats/{format_id}", response_model=PrintFormat)
 async def get_print_format(format_id: str, admin: User = Depends(get_admin_user)):
-    fmt = await db.print_formats.find_one({"id": format_id}, {"_id": 0})
+    fmt = await repos.print_formats.get(format_id)
     if not fmt:
         raise HTTPException(status_code=404, detail="Print format not found")
     if isinstance(fmt.get("created_at"), str):
@@ -708,42 +3007,25 @@ async def get_print_format(format_id: str, admin: User = Depends(get_admin_user)
 async def update_print_format(format_id: str, format_data: PrintFormatCreate, admin: User = Depends(get_admin_user)):
     # Validate Jinja2 template
     try:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(format_data.template_html)
-        template.render(
-            employee_name="Test",
-            employee_id="EMP123",
-            month="2025-01",
-            basic_salary=5000,
-            allowances=500,
-            deductions=200,
-            net_pay=5300,
-            generated_date="2025-01-15"
-        )
+        await render_print_format(format_data.template_html, sample_payslip_context(), format_id)
     except TemplateError as e:
         raise HTTPException(status_code=400, detail=f"Invalid Jinja2 template: {str(e)}")
     
     # If this is set as default, unset other defaults
     if format_data.is_default:
-        await db.print_formats.update_many({}, {"$set": {"is_default": False}})
+        await repos.print_formats.clear_default()
     
-    result = await db.print_formats.update_one(
-        {"id": format_id},
-        {"$set": format_data.model_dump()}
-    )
-    
-    if result.matched_count == 0:
+    if not await repos.print_formats.update(format_id, format_data.model_dump()):
         raise HTTPException(status_code=404, detail="Print format not found")
     
-    updated = await db.print_formats.find_one({"id": format_id}, {"_id": 0})
+    updated = await repos.print_formats.get(format_id)
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
     return PrintFormat(**updated)
 
 @api_router.delete("/print-formats/{format_id}")
 async def delete_print_format(format_id: str, admin: User = Depends(get_admin_user)):
-    result = await db.print_formats.delete_one({"id": format_id})
-    if result.deleted_count == 0:
+    if not await repos.print_formats.delete(format_id):
         raise HTTPException(status_code=404, detail="Print format not found")
     return {"message": "Print format deleted successfully"}
 
@@ -752,31 +3034,79 @@ async def preview_print_format(format_id: str, admin: User = Depends(get_admin_u
     """Preview print format with sample data"""
     from fastapi.responses import HTMLResponse
     
-    fmt = await db.print_formats.find_one({"id": format_id}, {"_id": 0})
+    fmt = await repos.print_formats.get(format_id)
     if not fmt:
         raise HTTPException(status_code=404, detail="Print format not found")
     
     try:
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(fmt["template_html"])
-        html_content = template.render(
-            employee_name="John Doe",
-            employee_id="EMP12AB34CD",
-            employee_email="john@company.com",
-            department="Engineering",
-            month="January 2025",
-            basic_salary=50000.00,
-            allowances=5000.00,
-            deductions=2000.00,
-            net_pay=53000.00,
-            generated_date=datetime.now(timezone.utc).strftime("%B %d, %Y")
-        )
-        
+        html_content = await render_print_format(fmt["template_html"], sample_payslip_context(), format_id)
         return HTMLResponse(content=html_content)
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Template rendering error: {str(e)}")
 
+# ============= PAYSLIP ARCHIVE =============
+# Payslips for months before the hot horizon move from `payslips` to compact
+# per-employee-per-year buckets in `payslip_archive`. Lists read only `payslips`
+# unless the requested range reaches back past the horizon.
+
+PAYSLIP_HOT_MONTHS = int(os.environ.get("PAYSLIP_HOT_MONTHS", "24"))
+PAYSLIP_ARCHIVE_BATCH = int(os.environ.get("PAYSLIP_ARCHIVE_BATCH", "1000"))
+
+def payslip_hot_cutoff() -> str:
+    """The oldest month kept in `payslips`; earlier months may be archived"""
+    today = datetime.now(timezone.utc)
+    index = today.year * 12 + today.month - 1 - PAYSLIP_HOT_MONTHS
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+async def find_payslips(
+    employee_ids=None, projection: Optional[dict] = None,
+    from_month: Optional[str] = None, to_month: Optional[str] = None,
+) -> List[dict]:
+    """Newest month first, merging in archived payslips only when `from_month` is past the horizon"""
+    payslips = await repos.payslips.list(employee_ids, projection, from_month, to_month)
+    if from_month is None or from_month >= payslip_hot_cutoff():
+        return payslips
+    archived = await repos.payslip_archive.list(employee_ids, from_month, to_month)
+    if projection:
+        archived = [{k: v for k, v in p.items() if projection.get(k)} for p in archived]
+    return sorted(payslips + archived, key=lambda p: p["month"], reverse=True)
+
+async def archive_payslips(before: str, batch_size: int = PAYSLIP_ARCHIVE_BATCH, on_batch=None) -> int:
+    """Move payslips for months before `before` into the archive; returns how many moved.
+
+    Each batch is bucketed before it is deleted, and bucketing the same payslip
+    twice is a no-op, so a run interrupted between the two just redoes the batch.
+    """
+    moved = 0
+    while True:
+        batch = await repos.payslips.before(before, batch_size)
+        if not batch:
+            return moved
+        await repos.payslip_archive.archive(batch)
+        await repos.payslips.delete_ids([p["id"] for p in batch])
+        moved += len(batch)
+        if on_batch is not None:
+            await on_batch(moved)
+
+@job_handler("archive_payslips")
+async def run_archive_payslips(job: JobContext) -> dict:
+    before = job.params["before"]
+    await job.save(total=await repos.payslips.count_before(before))
+    moved = await archive_payslips(before, on_batch=lambda done: job.save(done=done))
+    return {"before": before, "archived": moved}
+
+@api_router.post("/payslips/archive", response_model=Job, status_code=202)
+async def archive_payslips_job(
+    before: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    admin: User = Depends(get_admin_user)
+):
+    """Queue archiving of payslips older than `before` (default: the hot horizon); poll GET /jobs/{id}"""
+    cutoff = payslip_hot_cutoff()
+    if before and before > cutoff:
+        raise HTTPException(status_code=400, detail=f"Only months before {cutoff} can be archived")
+    return await job_queue.enqueue("archive_payslips", {"before": before or cutoff}, created_by=admin.id)
+
 # ============= PAYSLIP ROUTES =============
 
 async def get_last_working_day_of_month(year: int, month: int) -> datetime:
@@ -790,7 +3120,7 @@ async def get_last_working_day_of_month(year: int, month: int) -> datetime:
         last_day = next_month - timedelta(days=1)
     
     # Get all holidays from database
-    holidays = await db.holidays.find({}, {"_id": 0}).to_list(1000)
+    holidays = await repos.holidays.list_all()
     holiday_dates = {holiday["date"] for holiday in holidays}
     
     # Get first day of the month as safety limit
@@ -822,31 +3152,66 @@ async def get_last_working_day_of_month(year: int, month: int) -> datetime:
     # Fallback: if we couldn't find a working day, return the last day of the month
     return last_day
 
+async def employee_snapshot(employee: dict) -> dict:
+    department_name = "N/A"
+    if employee.get("department_id"):
+        dept = await repos.departments.get(employee["department_id"])
+        if dept:
+            department_name = dept["name"]
+    elif employee.get("department"):
+        department_name = employee["department"]
+    return {
+        "name": employee["name"],
+        "employee_id": employee.get("employee_id", "N/A"),
+        "email": employee["email"],
+        "department": department_name,
+    }
+
+async def resolve_print_format_id(structure: Optional[dict]) -> Optional[str]:
+    """The structure's print format if it still exists, else the default one"""
+    if structure and structure.get("print_format_id"):
+        if await repos.print_formats.get(structure["print_format_id"]):
+            return structure["print_format_id"]
+    default = await repos.print_formats.default()
+    return default["id"] if default else None
+
 @api_router.post("/payslips/generate", response_model=Payslip)
-async def generate_payslip(payslip_data: PayslipCreate, admin: User = Depends(get_admin_user)):
+async def generate_payslip(
+    payslip_data: PayslipCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    admin: User = Depends(get_admin_user)
+):
+    """Generate one employee's payslip for a month.
+
+    With an `Idempotency-Key` header, a retry returns the original response
+    instead of failing with "already generated".
+    """
+    return await run_idempotent(
+        idempotency_key, admin, "generate_payslip", payslip_data.model_dump(), response,
+        lambda: create_payslip(payslip_data),
+    )
+
+async def create_payslip(payslip_data: PayslipCreate) -> Payslip:
     # Get employee
-    employee = await db.employees.find_one({"id": payslip_data.employee_id}, {"_id": 0})
+    employee = await repos.employees.get(payslip_data.employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
+    # The unique index only covers `payslips`; archived months are checked here
+    if payslip_data.month < payslip_hot_cutoff() and await repos.payslip_archive.has(employee["id"], payslip_data.month):
+        raise HTTPException(status_code=400, detail="Payslip already generated for this month")
+    
     # Get payroll
-    payroll = await db.payroll.find_one({"employee_id": payslip_data.employee_id}, {"_id": 0})
+    payroll = await repos.payroll.for_employee(payslip_data.employee_id)
     if not payroll:
         raise HTTPException(status_code=404, detail="Payroll not assigned for this employee")
     
     # Get payroll structure
-    structure = await db.payroll_structures.find_one({"id": payroll["payroll_structure_id"]}, {"_id": 0})
+    structure = await repos.payroll_structures.get(payroll["payroll_structure_id"])
     if not structure:
         raise HTTPException(status_code=404, detail="Payroll structure not found")
     
-    # Check if payslip already exists for this month
-    existing = await db.payslips.find_one(
-        {"employee_id": payslip_data.employee_id, "month": payslip_data.month},
-        {"_id": 0}
-    )
-    if existing:
-        raise HTTPException(status_code=400, detail="Payslip already generated for this month")
-    
     # Calculate basic_salary, allowances, and deductions from salary_types
     salary_types = structure.get("salary_types", [])
     if not salary_types:
@@ -925,70 +3290,82 @@ async def generate_payslip(payslip_data: PayslipCreate, admin: User = Depends(ge
         deductions=deductions,
         net_pay=net_pay,
         salary_types=salary_types_list,
+        employee_snapshot=await employee_snapshot(employee),
+        print_format_id=await resolve_print_format_id(structure),
         generated_at=last_working_day
     )
     payslip_dict = payslip.model_dump()
     payslip_dict["salary_types"] = [st.model_dump() for st in salary_types_list]
     payslip_dict["generated_at"] = payslip_dict["generated_at"].isoformat()
     
-    await db.payslips.insert_one(payslip_dict)
+    # The unique (employee_id, month) index settles concurrent generations
+    try:
+        await repos.payslips.insert(payslip_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Payslip already generated for this month")
     return payslip
 
-@api_router.get("/payslips", response_model=List[Payslip])
-async def list_payslips(current_user: User = Depends(get_current_user)):
-    """Get all payslips - admin can see all, employees see only their own"""
-    if current_user.role == "admin":
-        payslips = await db.payslips.find({}, {"_id": 0}).to_list(1000)
-    else:
+@api_router.get("/payslips", response_model=PayslipRows, response_model_exclude_unset=True)
+async def list_payslips(
+    view: Literal["full", "summary"] = "full",
+    fields: Optional[str] = None,
+    manager_id: Optional[str] = None,
+    from_month: Optional[str] = Query(None, alias="from", pattern=r"^\d{4}-\d{2}$"),
+    to_month: Optional[str] = Query(None, alias="to", pattern=r"^\d{4}-\d{2}$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get all payslips - admin can see all, employees see only their own.
+
+    Admins may pass `manager_id` for the payslips of everyone under that manager.
+    Without `from`, archived months (before the hot horizon) are left out.
+    """
+    projection = build_projection(Payslip, PAYSLIP_SUMMARY_FIELDS, view, fields)
+    employee_id = None
+    if manager_id:
+        if current_user.role != "admin":
+            raise HTTPException(status_code=403, detail="Access denied")
+        employee_id = await repos.employees.ids_under(manager_id)
+    elif current_user.role != "admin":
         # Employee can only view their own payslips
-        employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-        # If not found by user_id, try to find by email and link it
-        if not employee:
-            employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-            if employee:
-                # Link the employee record to the user
-                await db.employees.update_one(
-                    {"id": employee["id"]},
-                    {"$set": {"user_id": current_user.id}}
-                )
-        
+        employee = await repos.employees.for_user(current_user)
         if not employee:
             return []  # No employee profile found
         
-        payslips = await db.payslips.find({"employee_id": employee["id"]}, {"_id": 0}).to_list(1000)
+        employee_id = employee["id"]
+    
+    if projection:
+        return await find_payslips(employee_id, projection, from_month, to_month)
     
+    payslips = await find_payslips(employee_id, from_month=from_month, to_month=to_month)
     for ps in payslips:
         if isinstance(ps.get("generated_at"), str):
             ps["generated_at"] = datetime.fromisoformat(ps["generated_at"])
+        # Payslips from before snapshots still list these keys, as null
+        ps.setdefault("employee_snapshot", None)
+        ps.setdefault("print_format_id", None)
         # Ensure salary_types is a list (handle backward compatibility)
         if "salary_types" not in ps:
             ps["salary_types"] = []
         elif ps["salary_types"] and len(ps["salary_types"]) > 0 and isinstance(ps["salary_types"][0], dict):
             # Convert dicts to SalaryType objects for proper serialization
             ps["salary_types"] = [SalaryType(**st) if isinstance(st, dict) else st for st in ps["salary_types"]]
-    return sorted(payslips, key=lambda x: x["month"], reverse=True)
+    return payslips
 
 @api_router.get("/payslips/employee/{employee_id}", response_model=List[Payslip])
-async def get_employee_payslips(employee_id: str, current_user: User = Depends(get_current_user)):
+async def get_employee_payslips(
+    employee_id: str,
+    from_month: Optional[str] = Query(None, alias="from", pattern=r"^\d{4}-\d{2}$"),
+    to_month: Optional[str] = Query(None, alias="to", pattern=r"^\d{4}-\d{2}$"),
+    current_user: User = Depends(get_current_user)
+):
+    """The employee's payslips, newest first; pass `from` to include archived months"""
     # Employee can only view their own payslips
     if current_user.role == "employee":
-        # Try to find employee by user_id first
-        employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-        
-        # If not found by user_id, try to find by email and link it
-        if not employee:
-            employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-            if employee:
-                # Link the employee record to the user
-                await db.employees.update_one(
-                    {"id": employee["id"]},
-                    {"$set": {"user_id": current_user.id}}
-                )
-        
+        employee = await repos.employees.for_user(current_user)
         if not employee or employee["id"] != employee_id:
             raise HTTPException(status_code=403, detail="Access denied")
     
-    payslips = await db.payslips.find({"employee_id": employee_id}, {"_id": 0}).to_list(1000)
+    payslips = await find_payslips(employee_id, from_month=from_month, to_month=to_month)
     for ps in payslips:
         if isinstance(ps.get("generated_at"), str):
             ps["generated_at"] = datetime.fromisoformat(ps["generated_at"])
@@ -998,14 +3375,12 @@ async def get_employee_payslips(employee_id: str, current_user: User = Depends(g
         elif ps["salary_types"] and len(ps["salary_types"]) > 0 and isinstance(ps["salary_types"][0], dict):
             # Convert dicts to SalaryType objects for proper serialization
             ps["salary_types"] = [SalaryType(**st) if isinstance(st, dict) else st for st in ps["salary_types"]]
-    return sorted(payslips, key=lambda x: x["month"], reverse=True)
+    return payslips
 
 @api_router.delete("/payslips/{payslip_id}")
 async def delete_payslip(payslip_id: str, admin: User = Depends(get_admin_user)):
     """Delete a payslip - only admin can delete payslips"""
-    result = await db.payslips.delete_one({"id": payslip_id})
-    
-    if result.deleted_count == 0:
+    if not await repos.payslips.delete(payslip_id) and not await repos.payslip_archive.delete_payslip(payslip_id):
         raise HTTPException(status_code=404, detail="Payslip not found")
     
     return {"message": "Payslip deleted successfully"}
@@ -1014,76 +3389,66 @@ async def delete_payslip(payslip_id: str, admin: User = Depends(get_admin_user))
 async def download_payslip(payslip_id: str, format_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
     from fastapi.responses import HTMLResponse
     
-    payslip = await db.payslips.find_one({"id": payslip_id}, {"_id": 0})
+    payslip = await repos.payslips.get(payslip_id) or await repos.payslip_archive.get_payslip(payslip_id)
     if not payslip:
         raise HTTPException(status_code=404, detail="Payslip not found")
     
     # Employee can only download their own payslips
     if current_user.role == "employee":
-        # Try to find employee by user_id first
-        employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-        # If not found by user_id, try to find by email and link it
-        if not employee:
-            employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-            if employee:
-                await db.employees.update_one(
-                    {"id": employee["id"]},
-                    {"$set": {"user_id": current_user.id}}
-                )
+        employee = await repos.employees.for_user(current_user)
         if not employee or employee["id"] != payslip["employee_id"]:
             raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get employee details
-    employee = await db.employees.find_one({"id": payslip["employee_id"]}, {"_id": 0})
+    # The employee's payroll structure is only needed for payslips generated before
+    # snapshots and salary breakdowns were stored; fetch it at most once
+    structure_lookup = {}
+    async def get_structure():
+        if "structure" not in structure_lookup:
+            structure_lookup["structure"] = None
+            payroll = await repos.payroll.for_employee(payslip["employee_id"])
+            if payroll:
+                structure_lookup["structure"] = await repos.payroll_structures.get(payroll["payroll_structure_id"])
+        return structure_lookup["structure"]
+    
+    snapshot = payslip.get("employee_snapshot")
+    if snapshot is None:
+        employee = await repos.employees.get(payslip["employee_id"])
+        if not employee:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        snapshot = await employee_snapshot(employee)
     
-    # Get print format - priority: format_id > payroll structure format > default format
+    # Get print format - priority: format_id > format resolved at generation > default format
     print_format = None
     if format_id:
-        print_format = await db.print_formats.find_one({"id": format_id}, {"_id": 0})
+        print_format = await repos.print_formats.get(format_id)
+    elif "print_format_id" in payslip:
+        if payslip["print_format_id"]:
+            print_format = await repos.print_formats.get(payslip["print_format_id"]) or await repos.print_formats.default()
     else:
-        # Try to get format from payroll structure
-        payroll = await db.payroll.find_one({"employee_id": payslip["employee_id"]}, {"_id": 0})
-        if payroll:
-            structure = await db.payroll_structures.find_one({"id": payroll["payroll_structure_id"]}, {"_id": 0})
-            if structure and structure.get("print_format_id"):
-                print_format = await db.print_formats.find_one({"id": structure["print_format_id"]}, {"_id": 0})
-        
-        # If still no format, get default
+        # Generated before the format was stored: the structure's format, else the default
+        structure = await get_structure()
+        if structure and structure.get("print_format_id"):
+            print_format = await repos.print_formats.get(structure["print_format_id"])
         if not print_format:
-            print_format = await db.print_formats.find_one({"is_default": True}, {"_id": 0})
+            print_format = await repos.print_formats.default()
+    
+    # Get salary_types from payslip, fallback to payroll structure if not stored
+    salary_types = payslip.get("salary_types", [])
+    if not salary_types:
+        structure = await get_structure()
+        if structure:
+            salary_types = structure.get("salary_types", [])
     
     html_content = ""
     
     if print_format:
         # Use custom template
         try:
-            env = Environment(loader=BaseLoader())
-            template = env.from_string(print_format["template_html"])
-            
-            # Get department name
-            department_name = "N/A"
-            if employee.get("department_id"):
-                dept = await db.departments.find_one({"id": employee["department_id"]}, {"_id": 0})
-                if dept:
-                    department_name = dept["name"]
-            elif employee.get("department"):
-                department_name = employee["department"]
-            
-            # Get salary_types from payslip, fallback to payroll structure if not stored
-            salary_types = payslip.get("salary_types", [])
-            if not salary_types:
-                # Fallback: get from payroll structure
-                payroll = await db.payroll.find_one({"employee_id": payslip["employee_id"]}, {"_id": 0})
-                if payroll:
-                    structure = await db.payroll_structures.find_one({"id": payroll["payroll_structure_id"]}, {"_id": 0})
-                    if structure:
-                        salary_types = structure.get("salary_types", [])
-            
-            html_content = template.render(
-                employee_name=employee["name"],
-                employee_id=employee.get("employee_id", "N/A"),
-                employee_email=employee["email"],
-                department=department_name,
+            html_content = await render_print_format(print_format["template_html"], dict(
+                employee_name=snapshot["name"],
+                employee_id=snapshot["employee_id"],
+                employee_email=snapshot["email"],
+                department=snapshot["department"],
                 month=payslip["month"],
                 basic_salary=payslip["basic_salary"],
                 allowances=payslip["allowances"],
@@ -1091,22 +3456,12 @@ async def download_payslip(payslip_id: str, format_id: Optional[str] = None, cur
                 net_pay=payslip["net_pay"],
                 salary_types=salary_types,  # Pass individual salary types to template
                 generated_date=datetime.fromisoformat(payslip["generated_at"]).strftime("%B %d, %Y") if isinstance(payslip["generated_at"], str) else payslip["generated_at"].strftime("%B %d, %Y")
-            )
+            ), print_format["id"])
             
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Template rendering error: {str(e)}")
     else:
         # Fallback to simple default format
-        # Get salary_types from payslip, fallback to payroll structure if not stored
-        salary_types = payslip.get("salary_types", [])
-        if not salary_types:
-            # Fallback: get from payroll structure
-            payroll = await db.payroll.find_one({"employee_id": payslip["employee_id"]}, {"_id": 0})
-            if payroll:
-                structure = await db.payroll_structures.find_one({"id": payroll["payroll_structure_id"]}, {"_id": 0})
-                if structure:
-                    salary_types = structure.get("salary_types", [])
-        
         # Build earnings and deductions rows from salary_types
         earnings_rows = ""
         deductions_rows = ""
@@ -1168,15 +3523,15 @@ async def download_payslip(payslip_id: str, format_id: Optional[str] = None, cur
             <div class="info">
                 <div class="info-row">
                     <div class="info-label">Employee Name:</div>
-                    <div class="info-value">{employee["name"]}</div>
+                    <div class="info-value">{snapshot["name"]}</div>
                 </div>
                 <div class="info-row">
                     <div class="info-label">Employee ID:</div>
-                    <div class="info-value">{employee.get("employee_id", "N/A")}</div>
+                    <div class="info-value">{snapshot["employee_id"]}</div>
                 </div>
                 <div class="info-row">
                     <div class="info-label">Email:</div>
-                    <div class="info-value">{employee["email"]}</div>
+                    <div class="info-value">{snapshot["email"]}</div>
                 </div>
                 <div class="info-row">
                     <div class="info-label">Month:</div>
@@ -1212,19 +3567,21 @@ async def create_leave_policy(policy_data: LeavePolicyCreate, admin: User = Depe
     # Convert leave_types list of LeaveType objects to dicts
     policy_dict["leave_types"] = [lt.model_dump() if hasattr(lt, 'model_dump') else lt for lt in policy_dict["leave_types"]]
     
-    await db.leave_policies.insert_one(policy_dict)
+    await repos.leave_policies.insert(policy_dict)
     return policy
 
-@api_router.get("/leave-policies", response_model=List[LeavePolicy])
-async def list_leave_policies(current_user: User = Depends(get_current_user)):
-    policies = await db.leave_policies.find({}, {"_id": 0}).to_list(1000)
-    for policy in policies:
-        if isinstance(policy.get("created_at"), str):
-            policy["created_at"] = datetime.fromisoformat(policy["created_at"])
-        # Convert leave_types dicts back to LeaveType objects
-        if "leave_types" in policy:
-            policy["leave_types"] = [LeaveType(**lt) if isinstance(lt, dict) else lt for lt in policy["leave_types"]]
-    return policies
+@api_router.get("/leave-policies", response_model=List[LeavePolicy], dependencies=[collection_etag("leave_policies")])
+async def list_leave_policies(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    async def body():
+        policies = await repos.leave_policies.list_all()
+        for policy in policies:
+            if isinstance(policy.get("created_at"), str):
+                policy["created_at"] = datetime.fromisoformat(policy["created_at"])
+            # Convert leave_types dicts back to LeaveType objects
+            if "leave_types" in policy:
+                policy["leave_types"] = [LeaveType(**lt) if isinstance(lt, dict) else lt for lt in policy["leave_types"]]
+        return render_json([LeavePolicy(**policy) for policy in policies])
+    return await coalesced_json(request, response, current_user, body)
 
 @api_router.put("/leave-policies/{policy_id}", response_model=LeavePolicy)
 async def update_leave_policy(
@@ -1233,7 +3590,7 @@ async def update_leave_policy(
     admin: User = Depends(get_admin_user)
 ):
     # Check if policy exists
-    existing = await db.leave_policies.find_one({"id": policy_id}, {"_id": 0})
+    existing = await repos.leave_policies.get(policy_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Leave policy not found")
     
@@ -1242,13 +3599,10 @@ async def update_leave_policy(
     # Convert leave_types list of LeaveType objects to dicts
     policy_dict["leave_types"] = [lt.model_dump() if hasattr(lt, 'model_dump') else lt for lt in policy_dict["leave_types"]]
     
-    await db.leave_policies.update_one(
-        {"id": policy_id},
-        {"$set": policy_dict}
-    )
+    await repos.leave_policies.update(policy_id, policy_dict)
     
     # Return updated policy
-    updated = await db.leave_policies.find_one({"id": policy_id}, {"_id": 0})
+    updated = await repos.leave_policies.get(policy_id)
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
     if "leave_types" in updated:
@@ -1258,52 +3612,40 @@ async def update_leave_policy(
 @api_router.delete("/leave-policies/{policy_id}")
 async def delete_leave_policy(policy_id: str, admin: User = Depends(get_admin_user)):
     # Check if policy exists
-    existing = await db.leave_policies.find_one({"id": policy_id}, {"_id": 0})
+    existing = await repos.leave_policies.get(policy_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Leave policy not found")
     
     # Check if any employee is assigned to this policy
-    assigned_employee = await db.employee_policy_assignments.find_one(
-        {"leave_policy_id": policy_id}
-    )
-    
-    if assigned_employee:
+    if await repos.policy_assignments.policy_in_use(policy_id):
         raise HTTPException(
             status_code=400,
             detail="This leave policy is assigned to employees and cannot be deleted."
         )
     
-    result = await db.leave_policies.delete_one({"id": policy_id})
-    if result.deleted_count == 0:
+    if not await repos.leave_policies.delete(policy_id):
         raise HTTPException(status_code=404, detail="Leave policy not found")
     return {"message": "Leave policy deleted successfully"}
 
 @api_router.post("/employee-policy-assignments", response_model=EmployeePolicyAssignment)
 async def assign_policy_to_employee(assignment_data: EmployeePolicyAssignmentCreate, admin: User = Depends(get_admin_user)):
     # Check if employee exists
-    employee = await db.employees.find_one({"id": assignment_data.employee_id}, {"_id": 0})
+    employee = await repos.employees.get(assignment_data.employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
     # Check if policy exists
-    policy = await db.leave_policies.find_one({"id": assignment_data.leave_policy_id}, {"_id": 0})
+    policy = await repos.leave_policies.get(assignment_data.leave_policy_id)
     if not policy:
         raise HTTPException(status_code=404, detail="Leave policy not found")
     
     # Check if assignment already exists
-    existing = await db.employee_policy_assignments.find_one({
-        "employee_id": assignment_data.employee_id
-    }, {"_id": 0})
+    existing = await repos.policy_assignments.for_employee(assignment_data.employee_id)
     
     if existing:
         # Update existing assignment
-        await db.employee_policy_assignments.update_one(
-            {"employee_id": assignment_data.employee_id},
-            {"$set": {"leave_policy_id": assignment_data.leave_policy_id}}
-        )
-        updated = await db.employee_policy_assignments.find_one({
-            "employee_id": assignment_data.employee_id
-        }, {"_id": 0})
+        await repos.policy_assignments.set_policy(assignment_data.employee_id, assignment_data.leave_policy_id)
+        updated = await repos.policy_assignments.for_employee(assignment_data.employee_id)
         if isinstance(updated.get("created_at"), str):
             updated["created_at"] = datetime.fromisoformat(updated["created_at"])
         return EmployeePolicyAssignment(**updated)
@@ -1312,7 +3654,7 @@ async def assign_policy_to_employee(assignment_data: EmployeePolicyAssignmentCre
     assignment_dict = assignment.model_dump()
     assignment_dict["created_at"] = assignment_dict["created_at"].isoformat()
     
-    await db.employee_policy_assignments.insert_one(assignment_dict)
+    await repos.policy_assignments.insert(assignment_dict)
     return assignment
 
 @api_router.get("/employee-policy-assignments/me")
@@ -1322,11 +3664,11 @@ async def get_my_policy_assignment(current_user: User = Depends(get_current_user
         raise HTTPException(status_code=403, detail="Only employees can access their own policy")
     
     # Get employee ID from user
-    employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
+    employee = await repos.employees.by_user_id(current_user.id)
     if not employee:
         return None
     
-    assignment = await db.employee_policy_assignments.find_one({"employee_id": employee["id"]}, {"_id": 0})
+    assignment = await repos.policy_assignments.for_employee(employee["id"])
     if not assignment:
         return None
     
@@ -1334,7 +3676,7 @@ async def get_my_policy_assignment(current_user: User = Depends(get_current_user
         assignment["created_at"] = datetime.fromisoformat(assignment["created_at"])
     
     # Get the full policy details
-    policy = await db.leave_policies.find_one({"id": assignment["leave_policy_id"]}, {"_id": 0})
+    policy = await repos.leave_policies.get(assignment["leave_policy_id"])
     if policy:
         if isinstance(policy.get("created_at"), str):
             policy["created_at"] = datetime.fromisoformat(policy["created_at"])
@@ -1349,7 +3691,7 @@ async def get_my_policy_assignment(current_user: User = Depends(get_current_user
 
 @api_router.get("/employee-policy-assignments/employee/{employee_id}")
 async def get_employee_policy_assignment(employee_id: str, current_user: User = Depends(get_current_user)):
-    assignment = await db.employee_policy_assignments.find_one({"employee_id": employee_id}, {"_id": 0})
+    assignment = await repos.policy_assignments.for_employee(employee_id)
     if not assignment:
         return None
     
@@ -1357,7 +3699,7 @@ async def get_employee_policy_assignment(employee_id: str, current_user: User =
         assignment["created_at"] = datetime.fromisoformat(assignment["created_at"])
     
     # Get the full policy details
-    policy = await db.leave_policies.find_one({"id": assignment["leave_policy_id"]}, {"_id": 0})
+    policy = await repos.leave_policies.get(assignment["leave_policy_id"])
     if policy:
         if isinstance(policy.get("created_at"), str):
             policy["created_at"] = datetime.fromisoformat(policy["created_at"])
@@ -1373,7 +3715,10 @@ async def get_employee_policy_assignment(employee_id: str, current_user: User =
 @api_router.get("/employee-policy-assignments")
 async def list_employee_policy_assignments(admin: User = Depends(get_admin_user)):
     """Get all employee policy assignments with policy details"""
-    assignments = await db.employee_policy_assignments.find({}, {"_id": 0}).to_list(1000)
+    assignments = await repos.policy_assignments.list_all()
+    
+    # Fetch every referenced policy in one query
+    policies_by_id = await repos.leave_policies.get_many(a["leave_policy_id"] for a in assignments)
     
     result = []
     for assignment in assignments:
@@ -1381,8 +3726,9 @@ async def list_employee_policy_assignments(admin: User = Depends(get_admin_user)
             assignment["created_at"] = datetime.fromisoformat(assignment["created_at"])
         
         # Get the full policy details
-        policy = await db.leave_policies.find_one({"id": assignment["leave_policy_id"]}, {"_id": 0})
+        policy = policies_by_id.get(assignment["leave_policy_id"])
         if policy:
+            policy = dict(policy)
             if isinstance(policy.get("created_at"), str):
                 policy["created_at"] = datetime.fromisoformat(policy["created_at"])
             if "leave_types" in policy:
@@ -1403,28 +3749,17 @@ async def create_leave_request(request_data: LeaveRequestCreate, current_user: U
     if current_user.role != "employee":
         raise HTTPException(status_code=403, detail="Only employees can apply for leave")
     
-    # Try to find employee by user_id first
-    employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-    
-    # If not found by user_id, try to find by email and link it
-    if not employee:
-        employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-        if employee:
-            # Link the employee record to the user
-            await db.employees.update_one(
-                {"id": employee["id"]},
-                {"$set": {"user_id": current_user.id}}
-            )
+    employee = await repos.employees.for_user(current_user)
     
     if not employee:
         raise HTTPException(status_code=404, detail="Employee profile not found. Please contact your administrator.")
     
     # Verify employee has this leave type in their assigned policy
-    policy_assignment = await db.employee_policy_assignments.find_one({"employee_id": employee["id"]}, {"_id": 0})
+    policy_assignment = await repos.policy_assignments.for_employee(employee["id"])
     if not policy_assignment:
         raise HTTPException(status_code=400, detail="No leave policy assigned to you")
     
-    policy = await db.leave_policies.find_one({"id": policy_assignment["leave_policy_id"]}, {"_id": 0})
+    policy = await repos.leave_policies.get(policy_assignment["leave_policy_id"])
     if not policy:
         raise HTTPException(status_code=404, detail="Leave policy not found")
     
@@ -1443,7 +3778,7 @@ async def create_leave_request(request_data: LeaveRequestCreate, current_user: U
     # Check each date in the range for holidays and weekends
     current_date = start_date
     invalid_dates = []
-    holidays = await db.holidays.find({}, {"_id": 0}).to_list(1000)
+    holidays = await repos.holidays.list_all()
     holiday_dates = {holiday["date"] for holiday in holidays}
     
     while current_date <= end_date:
@@ -1470,46 +3805,126 @@ async def create_leave_request(request_data: LeaveRequestCreate, current_user: U
     request_dict = leave_request.model_dump()
     request_dict["created_at"] = request_dict["created_at"].isoformat()
     
-    await db.leave_requests.insert_one(request_dict)
+    await repos.leave_requests.insert(request_dict)
     return leave_request
 
 @api_router.get("/leave-requests", response_model=List[LeaveRequest])
-async def list_leave_requests(current_user: User = Depends(get_current_user)):
+async def list_leave_requests(
+    response: Response,
+    status: Optional[Literal["pending", "approved", "rejected"]] = None,
+    from_date: Optional[str] = Query(None, alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    to_date: Optional[str] = Query(None, alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    department_id: Optional[str] = None,
+    employee_id: Optional[str] = None,
+    manager_id: Optional[str] = None,
+    leave_type: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=1000),
+    since: Optional[str] = SYNC_CURSOR,
+    current_user: User = Depends(get_current_user)
+):
+    """List leave requests, newest first, a page of `limit` after skipping `skip`.
+
+    Admins may filter by department, employee and manager (everyone under
+    them, at any depth); other users see their own requests, or their team's
+    when they pass their own id as `manager_id`. Everyone may filter by
+    status, leave type and a from/to window (requests overlapping the window).
+
+    With `since`, returns a SyncDelta for the same people instead; the other
+    filters don't apply to deltas, since a request leaving a filter must reach
+    the client too.
+    """
+    if since and (status or leave_type or from_date or to_date):
+        raise HTTPException(status_code=400, detail="since can't be combined with status, leave type or date filters")
+    if since:
+        # The delta and the team it is scoped to both come from the primary
+        route_read_preference.set(None)
+    employee_ids = None
     if current_user.role == "admin":
-        requests = await db.leave_requests.find({}, {"_id": 0}).to_list(1000)
+        if department_id:
+            employee_ids = await repos.employees.ids_in_department(department_id)
+        if manager_id:
+            team = await repos.employees.ids_under(manager_id)
+            employee_ids = team if employee_ids is None else sorted(set(employee_ids) & set(team))
+        if employee_id:
+            employee_ids = employee_id if employee_ids is None else [e for e in employee_ids if e == employee_id]
     else:
-        # Try to find employee by user_id first
-        employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-        
-        # If not found by user_id, try to find by email and link it
-        if not employee:
-            employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-            if employee:
-                # Link the employee record to the user
-                await db.employees.update_one(
-                    {"id": employee["id"]},
-                    {"$set": {"user_id": current_user.id}}
-                )
-        
+        employee = await repos.employees.for_user(current_user)
         if not employee:
             return []  # No employee profile found - return empty array
-        requests = await db.leave_requests.find({"employee_id": employee["id"]}, {"_id": 0}).to_list(1000)
+        if manager_id not in (None, employee["id"]):
+            raise HTTPException(status_code=403, detail="Access denied")
+        employee_ids = await repos.employees.ids_under(employee["id"]) if manager_id else employee["id"]
     
+    if since:
+        scope = None
+        if isinstance(employee_ids, str):
+            scope = {"employee_id": employee_ids}
+        elif employee_ids is not None:
+            scope = {"employee_id": {"$in": list(employee_ids)}}
+        return await sync_delta(repos.leave_requests, since, scope)
+    cursor = list_cursor()
+    requests = await repos.leave_requests.search(
+        status=status, leave_type=leave_type, from_date=from_date, to_date=to_date, employee_ids=employee_ids,
+        skip=skip, limit=limit,
+    )
+    # A cursor only follows a complete list; a page would leave the rows around it out of the baseline
+    if not skip and len(requests) < limit:
+        response.headers["X-Sync-Cursor"] = cursor
     for req in requests:
         if isinstance(req.get("created_at"), str):
             req["created_at"] = datetime.fromisoformat(req["created_at"])
-    return sorted(requests, key=lambda x: x["created_at"], reverse=True)
+    return requests
+
+# Declared before /leave-requests/{request_id} so "bulk" isn't taken for a request id
+@api_router.patch("/leave-requests/bulk", response_model=LeaveRequestBulkResult)
+async def bulk_update_leave_requests(update_data: LeaveRequestBulkUpdate, admin: User = Depends(get_admin_user)):
+    """Approve or reject many leave requests in one read and one write, with an outcome per id.
+
+    A request whose status changed after it was read is reported as a
+    conflict and left alone. Changes in an already closed leave year rewrite
+    the openings that year carried forward.
+    """
+    if update_data.updates and update_data.ids:
+        raise HTTPException(status_code=400, detail="Send either ids with a status, or updates")
+    if update_data.ids:
+        if update_data.status is None:
+            raise HTTPException(status_code=400, detail="status is required with ids")
+        targets = {request_id: update_data.status for request_id in update_data.ids}
+    else:
+        targets = {change.id: change.status for change in update_data.updates}
+
+    current = await repos.leave_requests.statuses(list(targets))
+    changes = {
+        rid: (current[rid]["status"], status)
+        for rid, status in targets.items() if rid in current and current[rid]["status"] != status
+    }
+    conflicts = await repos.leave_requests.set_statuses(changes)
+    await refresh_leave_openings([
+        current[rid] for rid, (before, after) in changes.items()
+        if rid not in conflicts and "approved" in (before, after)
+    ])
+    moved_on = await repos.leave_requests.statuses(list(conflicts)) if conflicts else {}
+
+    results = []
+    for request_id, status in targets.items():
+        if request_id not in current:
+            results.append(LeaveRequestBulkOutcome(id=request_id, outcome="not_found"))
+        elif request_id in conflicts:
+            now = moved_on.get(request_id, {}).get("status")
+            results.append(LeaveRequestBulkOutcome(id=request_id, outcome="conflict", status=now))
+        else:
+            outcome = "updated" if request_id in changes else "unchanged"
+            results.append(LeaveRequestBulkOutcome(id=request_id, outcome=outcome, status=status))
+    return LeaveRequestBulkResult(updated=len(changes) - len(conflicts), results=results)
 
 @api_router.patch("/leave-requests/{request_id}", response_model=LeaveRequest)
 async def update_leave_request(request_id: str, update_data: LeaveRequestUpdate, admin: User = Depends(get_admin_user)):
-    result = await db.leave_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": update_data.status}}
-    )
-    if result.matched_count == 0:
+    updated = await repos.leave_requests.set_status(request_id, update_data.status)
+    if not updated:
         raise HTTPException(status_code=404, detail="Leave request not found")
+    await refresh_leave_openings([updated])
     
-    updated = await db.leave_requests.find_one({"id": request_id}, {"_id": 0})
     if isinstance(updated.get("created_at"), str):
         updated["created_at"] = datetime.fromisoformat(updated["created_at"])
     return LeaveRequest(**updated)
@@ -1519,28 +3934,17 @@ async def get_leave_balance(current_user: User = Depends(get_current_user)):
     if current_user.role != "employee":
         raise HTTPException(status_code=403, detail="Only employees can view leave balance")
     
-    # Try to find employee by user_id first
-    employee = await db.employees.find_one({"user_id": current_user.id}, {"_id": 0})
-    
-    # If not found by user_id, try to find by email and link it
-    if not employee:
-        employee = await db.employees.find_one({"email": current_user.email}, {"_id": 0})
-        if employee:
-            # Link the employee record to the user
-            await db.employees.update_one(
-                {"id": employee["id"]},
-                {"$set": {"user_id": current_user.id}}
-            )
+    employee = await repos.employees.for_user(current_user)
     
     if not employee:
         return []  # No employee profile found - return empty array instead of error
     
     # Get employee's assigned policy
-    policy_assignment = await db.employee_policy_assignments.find_one({"employee_id": employee["id"]}, {"_id": 0})
+    policy_assignment = await repos.policy_assignments.for_employee(employee["id"])
     if not policy_assignment:
         return []  # No policy assigned yet
     
-    policy = await db.leave_policies.find_one({"id": policy_assignment["leave_policy_id"]}, {"_id": 0})
+    policy = await repos.leave_policies.get(policy_assignment["leave_policy_id"])
     if not policy:
         return []
     
@@ -1548,6 +3952,14 @@ async def get_leave_balance(current_user: User = Depends(get_current_user)):
     if "leave_types" not in policy or not isinstance(policy["leave_types"], list):
         return []
     
+    # Balances run per leave year: this year's approved requests against the
+    # policy allocation plus whatever the last year-end closing carried forward
+    year = datetime.now(timezone.utc).year
+    carried = await repos.leave_balances.carried_forward([employee["id"]], year)
+    approved_by_type = defaultdict(list)
+    for req in await repos.leave_requests.approved_for_employee(employee["id"], *leave_year_window(year)):
+        approved_by_type[req.get("leave_type")].append(req)
+    
     balances = []
     
     for leave_type in policy["leave_types"]:
@@ -1563,45 +3975,255 @@ async def get_leave_balance(current_user: User = Depends(get_current_user)):
         if not leave_type_name or allocated_days is None:
             continue  # Skip invalid leave types
         
-        # Calculate used days from approved leave requests for this leave type
-        approved_requests = await db.leave_requests.find({
-            "employee_id": employee["id"],
-            "leave_type": leave_type_name,
-            "status": "approved"
-        }, {"_id": 0}).to_list(1000)
+        carried_forward_days = carried.get((employee["id"], leave_type_name), 0)
+        allocated_days += carried_forward_days
         
-        used_days = 0
-        for req in approved_requests:
-            try:
-                start = datetime.strptime(req["start_date"], "%Y-%m-%d")
-                end = datetime.strptime(req["end_date"], "%Y-%m-%d")
-                used_days += (end - start).days + 1
-            except (ValueError, KeyError):
-                continue  # Skip invalid date formats
+        # Calculate used days from approved leave requests for this leave type
+        used_days = sum(leave_days(req) for req in approved_by_type[leave_type_name])
         
         balances.append(LeaveBalance(
             leave_type=leave_type_name,
             allocated_days=allocated_days,
             used_days=used_days,
-            remaining_days=allocated_days - used_days
+            remaining_days=allocated_days - used_days,
+            carried_forward_days=carried_forward_days
         ))
     
     return balances
 
+LEAVE_CALENDAR_MAX_DAYS = 92
+
+@api_router.get("/leave-calendar", response_model=List[LeaveCalendarDay])
+async def get_leave_calendar(
+    from_date: str = Query(..., alias="from", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    to_date: str = Query(..., alias="to", pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    department_id: Optional[str] = None,
+    manager_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Who is out on each day of the window, with weekends and holidays marked.
+
+    Admins see everyone, or one department or everyone under one manager (at
+    any depth, as in the leave queue); other users see everyone under them.
+    Approved and pending leave both count.
+    """
+    try:
+        start = datetime.strptime(from_date, "%Y-%m-%d").date()
+        end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (end - start).days >= LEAVE_CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"The window is limited to {LEAVE_CALENDAR_MAX_DAYS} days")
+    if department_id and manager_id:
+        raise HTTPException(status_code=400, detail="Filter by department or by manager, not both")
+
+    if current_user.role != "admin":
+        employee = await repos.employees.for_user(current_user)
+        if not employee or department_id or manager_id not in (None, employee["id"]):
+            raise HTTPException(status_code=403, detail="Access denied")
+        manager_id = employee["id"]
+
+    employee_ids = None
+    if department_id:
+        employee_ids = await repos.employees.ids_in_department(department_id)
+    elif manager_id:
+        employee_ids = await repos.employees.ids_under(manager_id)
+    requests = []
+    if employee_ids != []:
+        requests = await repos.leave_requests.overlapping(from_date, to_date, ["approved", "pending"], employee_ids)
+    employees = await repos.employees.get_many({r["employee_id"] for r in requests})
+    holidays = {h["date"]: h["name"] for h in await repos.holidays.list_all()}
+
+    # Sweep: bucket each request's interval, clipped to the window, by the day it
+    # enters and the day after it leaves, then walk the window once
+    entering, leaving = defaultdict(list), defaultdict(list)
+    for req in requests:
+        try:
+            first = max(datetime.strptime(req["start_date"], "%Y-%m-%d").date(), start)
+            last = min(datetime.strptime(req["end_date"], "%Y-%m-%d").date(), end)
+        except (ValueError, KeyError):
+            continue  # Skip invalid date formats
+        if first > last:
+            continue  # Ends before it starts, so covers no day
+        employee = employees.get(req["employee_id"], {})
+        absence = LeaveCalendarAbsence(
+            employee_id=req["employee_id"],
+            employee_name=employee.get("name", "Unknown"),
+            leave_request_id=req["id"],
+            leave_type=req["leave_type"],
+            status=req["status"],
+        )
+        entering[(first - start).days].append(absence)
+        leaving[(last - start).days + 1].append(absence)
+
+    days, active = [], {}
+    for offset in range((end - start).days + 1):
+        for absence in leaving[offset]:
+            del active[absence.leave_request_id]
+        for absence in entering[offset]:
+            active[absence.leave_request_id] = absence
+        day = start + timedelta(days=offset)
+        date_str = day.strftime("%Y-%m-%d")
+        weekend = day.weekday() >= 5
+        holiday = holidays.get(date_str)
+        # Nobody is absent on a day they wouldn't be working anyway
+        absences = [] if weekend or holiday else sorted(active.values(), key=lambda a: (a.employee_name, a.employee_id))
+        days.append(LeaveCalendarDay(date=date_str, weekend=weekend, holiday=holiday, absences=absences))
+    return days
+
+# ============= LEAVE YEAR CLOSING =============
+# Leave years are calendar years. A request counts towards the year it starts in.
+
+LEAVE_YEAR_CLOSE_BATCH = int(os.environ.get("LEAVE_YEAR_CLOSE_BATCH", "1000"))
+
+def leave_year_window(year: int) -> Tuple[str, str]:
+    return f"{year}-01-01", f"{year}-12-31"
+
+def leave_days(req: dict) -> int:
+    """Calendar days covered by a request, both ends included; 0 for malformed dates"""
+    try:
+        start = datetime.strptime(req["start_date"], "%Y-%m-%d")
+        end = datetime.strptime(req["end_date"], "%Y-%m-%d")
+    except (ValueError, KeyError, TypeError):
+        return 0
+    return (end - start).days + 1
+
+async def leave_year_openings(assignments: List[dict], policies: Dict[str, dict], year: int) -> List[dict]:
+    """`year + 1` openings for the assigned employees: one aggregation for usage, one read for carry-forward"""
+    employee_ids = [a["employee_id"] for a in assignments]
+    from_date, to_date = leave_year_window(year)
+    used = await repos.leave_requests.approved_days_by_type(employee_ids, from_date, to_date)
+    carried = await repos.leave_balances.carried_forward(employee_ids, year)
+    openings = []
+    for assignment in assignments:
+        policy = policies.get(assignment["leave_policy_id"]) or {}
+        for leave_type in policy.get("leave_types", []):
+            key = (assignment["employee_id"], leave_type["type"])
+            closing = leave_type["days"] + carried.get(key, 0) - used.get(key, 0)
+            openings.append({
+                "employee_id": assignment["employee_id"],
+                "year": year + 1,
+                "leave_type": leave_type["type"],
+                "closing_days": closing,
+                "carried_forward_days": max(0, min(closing, leave_type.get("carry_forward_cap", 0))),
+            })
+    return openings
+
+async def close_leave_year(
+    year: int, batch_size: int = LEAVE_YEAR_CLOSE_BATCH, restart: bool = False, on_batch: Optional[Callable] = None
+) -> dict:
+    """Write `year + 1` opening balances for every employee with a leave policy.
+
+    Works through policy assignments in employee_id order. Per batch, one
+    aggregation totals approved leave per type, the closing balance (allocation
+    plus this year's carry-forward, minus usage) is capped by the policy's
+    `carry_forward_cap`, and the openings go out in one bulk_write. The last
+    employee_id is checkpointed after each batch so a rerun resumes there; pass
+    `restart` to recompute from the start, e.g. after a policy change (status
+    changes in a closed year refresh their openings themselves).
+    `on_batch(processed)` is awaited after each batch.
+    """
+    state = await repos.leave_year_closings.start(year, restart)
+    if state["status"] == "completed":
+        return state
+    policies = {p["id"]: p for p in await repos.leave_policies.list_all()}
+    after, processed = state["last_employee_id"], state["processed"]
+    while assignments := await repos.policy_assignments.page_after(after, batch_size):
+        await repos.leave_balances.write_openings(await leave_year_openings(assignments, policies, year))
+        after = assignments[-1]["employee_id"]
+        await repos.leave_year_closings.checkpoint(year, after, len(assignments))
+        processed += len(assignments)
+        logger.info(f"Leave year {year}: closed balances up to employee {after}")
+        if on_batch is not None:
+            await on_batch(processed)
+    return await repos.leave_year_closings.complete(year)
+
+async def refresh_leave_openings(requests: List[dict]):
+    """Rewrite the openings closed leave years derived from these requests' employees.
+
+    A request approved, rejected or reverted after its year was closed changes
+    what that year carried forward, and through it every later closed year.
+    Employees a running closing hasn't reached yet are left to it.
+    """
+    employees_by_year: Dict[int, Set[str]] = defaultdict(set)
+    for req in requests:
+        with suppress(KeyError, TypeError, ValueError):
+            employees_by_year[int(req["start_date"][:4])].add(req["employee_id"])
+    if not employees_by_year:
+        return
+    first = min(employees_by_year)
+    closings = await repos.leave_year_closings.since(first)
+    if not closings:
+        return
+    policies = None
+    carried_over: Set[str] = set()
+    for year in range(first, max(max(employees_by_year), max(closings)) + 1):
+        closing = closings.get(year)
+        candidates = carried_over | employees_by_year.get(year, set())
+        if closing is None or not candidates:
+            carried_over = set()
+            continue
+        reached = closing["last_employee_id"] or ""
+        employee_ids = sorted(e for e in candidates if closing["status"] == "completed" or e <= reached)
+        if policies is None:
+            policies = {p["id"]: p for p in await repos.leave_policies.list_all()}
+        assignments = await repos.policy_assignments.for_employees(employee_ids) if employee_ids else []
+        await repos.leave_balances.write_openings(await leave_year_openings(assignments, policies, year))
+        carried_over = set(employee_ids)
+
+@job_handler("close_leave_year")
+async def run_close_leave_year(job: JobContext) -> dict:
+    # `restart` only applies to the first attempt; a retry resumes from the closing's checkpoint
+    restart = job.params.get("restart", False) and job.checkpoint is None
+    await job.save(checkpoint={"restarted": restart}, total=await repos.policy_assignments.count())
+    state = await close_leave_year(job.params["year"], restart=restart, on_batch=lambda done: job.save(done=done))
+    return {"year": state["year"], "processed": state["processed"]}
+
+@api_router.post("/leave-years/{year}/close", response_model=Job, status_code=202)
+async def close_leave_year_job(year: int, restart: bool = False, admin: User = Depends(get_admin_user)):
+    """Queue the year-end closing of `year`; poll GET /jobs/{id} for progress"""
+    return await job_queue.enqueue("close_leave_year", {"year": year, "restart": restart}, created_by=admin.id)
+
+# ============= JOB ROUTES =============
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, admin: User = Depends(get_admin_user)):
+    job = await repos.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # ============= HOLIDAY ROUTES =============
 
-@api_router.get("/holidays", response_model=List[Holiday])
-async def list_holidays(current_user: User = Depends(get_current_user)):
-    holidays = await db.holidays.find({}, {"_id": 0}).sort("date", 1).to_list(1000)
-    for holiday in holidays:
-        if isinstance(holiday.get("created_at"), str):
-            holiday["created_at"] = datetime.fromisoformat(holiday["created_at"])
-    return [Holiday(**h) for h in holidays]
+@api_router.get("/holidays", response_model=List[Holiday], dependencies=[collection_etag("holidays")])
+async def list_holidays(
+    request: Request,
+    response: Response,
+    since: Optional[str] = SYNC_CURSOR,
+    current_user: User = Depends(get_current_user)
+):
+    """All holidays, or with `since` a SyncDelta of holidays changed or deleted after that cursor"""
+    if since:
+        return await sync_delta(repos.holidays, since)
+
+    async def body():
+        cursor = list_cursor()
+        holidays, read_at = await repos.holidays.list_all_as_of()
+        for holiday in holidays:
+            if isinstance(holiday.get("created_at"), str):
+                holiday["created_at"] = datetime.fromisoformat(holiday["created_at"])
+        # A cached list is as old as the read that filled it, not this request
+        if read_at is not None:
+            cursor = sync_cursor(read_at)
+        return render_json([Holiday(**h) for h in holidays]), {"X-Sync-Cursor": cursor}
+    return await coalesced_json(request, response, current_user, body)
 
 @api_router.post("/holidays", response_model=Holiday)
 async def create_holiday(holiday_data: HolidayCreate, admin: User = Depends(get_admin_user)):
     # Check for duplicate date
-    existing = await db.holidays.find_one({"date": holiday_data.date}, {"_id": 0})
+    existing = await repos.holidays.by_date(holiday_data.date)
     if existing:
         raise HTTPException(status_code=400, detail=f"Holiday already exists for date {holiday_data.date}")
     
@@ -1609,60 +4231,342 @@ async def create_holiday(holiday_data: HolidayCreate, admin: User = Depends(get_
     holiday_dict = holiday.model_dump()
     holiday_dict["created_at"] = holiday_dict["created_at"].isoformat()
     
-    await db.holidays.insert_one(holiday_dict)
+    await repos.holidays.insert(holiday_dict)
     return holiday
 
 @api_router.post("/holidays/bulk", response_model=List[Holiday])
 async def create_holidays_bulk(holidays_data: List[HolidayCreate], admin: User = Depends(get_admin_user)):
+    # Skip dates that already have a holiday, including repeats within the batch
+    taken = await repos.holidays.existing_dates([h.date for h in holidays_data])
     created_holidays = []
+    holiday_dicts = []
     for holiday_data in holidays_data:
-        # Check for duplicate date
-        existing = await db.holidays.find_one({"date": holiday_data.date}, {"_id": 0})
-        if not existing:
-            holiday = Holiday(**holiday_data.model_dump())
-            holiday_dict = holiday.model_dump()
-            holiday_dict["created_at"] = holiday_dict["created_at"].isoformat()
-            await db.holidays.insert_one(holiday_dict)
-            created_holidays.append(holiday)
+        if holiday_data.date in taken:
+            continue
+        taken.add(holiday_data.date)
+        holiday = Holiday(**holiday_data.model_dump())
+        holiday_dict = holiday.model_dump()
+        holiday_dict["created_at"] = holiday_dict["created_at"].isoformat()
+        holiday_dicts.append(holiday_dict)
+        created_holidays.append(holiday)
+    await repos.holidays.insert_many(holiday_dicts)
     return created_holidays
 
 @api_router.delete("/holidays/{holiday_id}")
 async def delete_holiday(holiday_id: str, admin: User = Depends(get_admin_user)):
-    result = await db.holidays.delete_one({"id": holiday_id})
-    if result.deleted_count == 0:
+    if not await repos.holidays.delete(holiday_id):
         raise HTTPException(status_code=404, detail="Holiday not found")
     return {"message": "Holiday deleted successfully"}
 
-# Include router
-app.include_router(api_router)
+# ============= REPORT ROUTES =============
 
-# CORS configuration - must be before other middleware
-cors_origins_env = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,https://hrms-nine-delta.vercel.app')
-# Split by comma and strip whitespace from each origin
-cors_origins = [origin.strip() for origin in cors_origins_env.split(',') if origin.strip()]
+# Payslips generated before salary_types were stored only carry these totals
+LEGACY_PAYSLIP_COMPONENTS = [
+    ("earnings", "Basic Salary", "basic_salary"),
+    ("earnings", "Allowances", "allowances"),
+    ("deductions", "Deductions", "deductions"),
+]
+REGISTER_FLUSH_BYTES = 64 * 1024
+REGISTER_XLSX_BATCH = 500
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+def payslip_components(payslip: dict) -> Dict[Tuple[str, str], float]:
+    """Amount per (category, component); deductions are positive"""
+    amounts = defaultdict(float)
+    if payslip.get("salary_types"):
+        for salary_type in payslip["salary_types"]:
+            category = "deductions" if salary_type.get("category") == "deductions" else "earnings"
+            amount = float(salary_type.get("amount", 0))
+            amounts[(category, salary_type.get("type", ""))] += abs(amount) if category == "deductions" else amount
+    else:
+        for category, component, field in LEGACY_PAYSLIP_COMPONENTS:
+            amounts[(category, component)] += abs(float(payslip.get(field) or 0))
+    return amounts
 
-logger.info(f"CORS origins configured: {cors_origins}")
+async def merge_sorted(iterators, key):
+    """Merge async iterators, each already sorted by `key`, into one sorted stream"""
+    iterators = [aiter(iterator) for iterator in iterators]
+    heap = []
+    for index, iterator in enumerate(iterators):
+        item = await anext(iterator, None)
+        if item is not None:
+            heap.append((key(item), index, item))
+    heapq.heapify(heap)
+    while heap:
+        _, index, item = heap[0]
+        yield item
+        following = await anext(iterators[index], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(following), index, following))
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=cors_origins,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def payroll_register_lines(month: str):
+    """Header, one line per payslip, a subtotal after each department and a grand total.
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+    Only the current department's subtotal is held in memory, so the register
+    streams in constant memory however many employees the month covers.
+    """
+    # Months past the hot horizon may be archived, wholly or (mid-archival) in part
+    sources = [repos.payslips]
+    if month < payslip_hot_cutoff():
+        sources.append(repos.payslip_archive)
+    columns = set()
+    for category, component in [c for source in sources for c in await source.components_for_month(month)]:
+        if component is None:
+            columns.update((c, name) for c, name, _ in LEGACY_PAYSLIP_COMPONENTS)
+        else:
+            columns.add(("deductions" if category == "deductions" else "earnings", component))
+    earnings = sorted(name for category, name in columns if category == "earnings")
+    deductions = sorted(name for category, name in columns if category == "deductions")
+
+    def line(department, code, name, amounts):
+        earned = [round(amounts.get(("earnings", c), 0.0), 2) for c in earnings]
+        deducted = [round(amounts.get(("deductions", c), 0.0), 2) for c in deductions]
+        gross, total = round(sum(earned), 2), round(sum(deducted), 2)
+        return [department, code, name, *earned, gross, *deducted, total, round(gross - total, 2)]
+
+    yield ["Department", "Employee ID", "Employee Name", *earnings, "Gross Earnings",
+           *deductions, "Total Deductions", "Net Pay"]
+    department, headcount, subtotal = None, 0, defaultdict(float)
+    grand_headcount, grand_total = 0, defaultdict(float)
+    payslips = merge_sorted(
+        [source.register_for_month(month) for source in sources],
+        key=lambda p: (p["department"], p.get("name") or "", p["employee_id"]),
+    )
+    async for payslip in payslips:
+        if payslip["department"] != department:
+            if department is not None:
+                yield line(department, "", f"Subtotal ({headcount} employees)", subtotal)
+            department, headcount, subtotal = payslip["department"], 0, defaultdict(float)
+        amounts = payslip_components(payslip)
+        for key, amount in amounts.items():
+            subtotal[key] += amount
+            grand_total[key] += amount
+        headcount += 1
+        grand_headcount += 1
+        yield line(department, payslip.get("code") or "", payslip.get("name") or payslip["employee_id"], amounts)
+    if department is not None:
+        yield line(department, "", f"Subtotal ({headcount} employees)", subtotal)
+    yield line("Total", "", f"{grand_headcount} employees", grand_total)
+
+async def stream_register_csv(lines):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    async for line in lines:
+        writer.writerow(line)
+        if buffer.tell() >= REGISTER_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def append_rows(sheet, rows):
+    for row in rows:
+        sheet.append(row)
+
+async def write_register_xlsx(lines, month: str) -> str:
+    """Write the register to a temporary .xlsx and return its path.
+
+    openpyxl's write-only mode spills rows to disk as they are appended; the
+    appends and the final save run in a thread so they don't stall the event loop.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(f"Payroll {month}")
+    fd, path = tempfile.mkstemp(prefix="payroll-register-", suffix=".xlsx")
+    os.close(fd)
+    try:
+        batch = []
+        async for line in lines:
+            batch.append(line)
+            if len(batch) >= REGISTER_XLSX_BATCH:
+                await asyncio.to_thread(append_rows, sheet, batch)
+                batch = []
+        await asyncio.to_thread(append_rows, sheet, batch)
+        await asyncio.to_thread(workbook.save, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+async def stream_file(path: str, chunk_size: int = REGISTER_FLUSH_BYTES):
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+@api_router.get("/reports/payroll-register")
+async def payroll_register_report(
+    month: str = Query(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    format: Literal["csv", "xlsx"] = "csv",
+    admin: User = Depends(get_admin_user)
+):
+    """Every payslip of `month` broken down by salary component, with department subtotals"""
+    filename = f"payroll-register-{month}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "csv":
+        return StreamingResponse(stream_register_csv(payroll_register_lines(month)),
+                                 media_type="text/csv", headers=headers)
+    path = await write_register_xlsx(payroll_register_lines(month), month)
+    return StreamingResponse(
+        stream_file(path),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
+        background=BackgroundTask(os.remove, path),
+    )
+
+# ============= INDEXES =============
+
+# Server error code for a unique index that existing documents violate
+DUPLICATE_KEY = 11000
+# Server error codes for an index that exists on the same keys with other options
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+async def ensure_indexes():
+    """Create the indexes the list/filter endpoints rely on (idempotent)"""
+    # Admin leave queue: equality on status/employee, sorted by created_at, date window on start/end
+    await db.leave_requests.create_index([("status", 1), ("created_at", -1)])
+    await db.leave_requests.create_index([("employee_id", 1), ("status", 1), ("created_at", -1)])
+    await db.leave_requests.create_index([("status", 1), ("start_date", 1), ("end_date", 1)])
+    # Department filter resolves employee ids from the index alone
+    await db.employees.create_index([("department_id", 1), ("id", 1)])
+    # Delta sync: changes by write time, deletions by collection and time; tombstones expire
+    await db.employees.create_index([("updated_at", 1)])
+    await db.holidays.create_index([("updated_at", 1)])
+    await db.leave_requests.create_index([("employee_id", 1), ("updated_at", 1)])
+    await db.leave_requests.create_index([("updated_at", 1)])
+    await db.tombstones.create_index([("collection", 1), ("deleted_at", 1)])
+    await db.tombstones.create_index("deleted_at", expireAfterSeconds=SYNC_TOMBSTONE_TTL)
+    # Manager scopes: everyone under a manager (multikey on the chain) and direct reports
+    await db.employees.create_index([("ancestors", 1), ("id", 1)])
+    await db.employees.create_index([("reporting_manager_id", 1)])
+    # Year-end closing: keyset pages of assignments, one opening per employee/year/type
+    await db.employee_policy_assignments.create_index([("employee_id", 1)])
+    await db.leave_balances.create_index([("employee_id", 1), ("year", 1), ("leave_type", 1)], unique=True)
+    await db.leave_year_closings.create_index([("year", 1)], unique=True)
+    # Job claims: due queued jobs and expired leases
+    await db.jobs.create_index([("status", 1), ("run_after", 1)])
+    await db.jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    try:
+        await db.jobs.create_index([("id", 1)], unique=True)
+    except OperationFailure as exc:
+        if exc.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+            raise
+        # Replace the non-unique index earlier deploys created
+        await db.jobs.drop_index([("id", 1)])
+        await db.jobs.create_index([("id", 1)], unique=True)
+    # At most one queued or running job per type and params, however many enqueues race
+    await db.jobs.create_index(
+        [("type", 1), ("dedupe_key", 1)], unique=True, name="active_job_dedupe",
+        partialFilterExpression={"status": {"$in": ["queued", "running"]}, "dedupe_key": {"$exists": True}},
+    )
+    # Payroll register: month filter, then the per-payslip employee lookup
+    await db.payslips.create_index([("month", 1)])
+    # One payslip per employee and month, however many generate requests race
+    try:
+        await db.payslips.create_index([("employee_id", 1), ("month", 1)], unique=True)
+    except OperationFailure as exc:
+        if exc.code != DUPLICATE_KEY:
+            raise
+        logger.error("Duplicate payslips exist for some employee and month; remove them to enforce uniqueness")
+    # Archive buckets: one per employee and year, found by payslip id for downloads
+    await db.payslip_archive.create_index([("employee_id", 1), ("year", 1)], unique=True)
+    await db.payslip_archive.create_index([("payslips.id", 1)])
+    await db.idempotency_keys.create_index([("user_id", 1), ("key", 1)], unique=True)
+    # created_at is a BSON date here, so the TTL monitor can expire keys
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_KEY_TTL)
+    await db.employees.create_index([("id", 1)])
+
+async def warm_caches():
+    """Load the cached reference collections so the first requests don't pay for it"""
+    for repo in vars(repos).values():
+        if repo.cache is not None:
+            await repo.list_all()
+
+# ============= APP FACTORY =============
+
+async def metrics():
+    """Prometheus scrape endpoint (aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open MongoDB, apply indexes, warm caches, follow invalidations and run jobs; undo on shutdown"""
+    global client, db
+    database = app.state.database
+    if database is None:
+        client = AsyncIOMotorClient(
+            os.environ["MONGO_URL"], event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()]
+        )
+        database = client[os.environ["DB_NAME"]]
+    db = database
+
+    started = time.perf_counter()
+    await ensure_indexes()
+    backfilled = await repos.employees.backfill_ancestors()
+    if backfilled:
+        logger.info(f"Filled in reporting chains for {backfilled} employees")
+    await warm_caches()
+    await invalidation_bus.start()
+    await job_queue.start()
+    logger.info(f"Startup complete in {(time.perf_counter() - started) * 1000:.0f} ms")
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await invalidation_bus.stop()
+        if client is not None:
+            client.close()
+            client = None
+
+def create_app(database=None) -> FastAPI:
+    """Build the API app. Nothing connects to MongoDB until the lifespan runs.
+
+    `database` replaces the Motor client, e.g. an in-memory stand-in for tests.
+    Run several workers with `uvicorn server:create_app --factory --workers N`.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.database = database
+    app.include_router(api_router)
+    app.add_exception_handler(NotModified, not_modified_handler)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
+
+    # Middleware added last runs first. Innermost: each request gets fresh batch loaders
+    app.add_middleware(LoaderScopeMiddleware)
+
+    # CORS configuration - must be before other middleware
+    cors_origins_env = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,https://hrms-nine-delta.vercel.app')
+    # Split by comma and strip whitespace from each origin
+    cors_origins = [origin.strip() for origin in cors_origins_env.split(',') if origin.strip()]
+    logger.info(f"CORS origins configured: {cors_origins}")
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(CompressionMiddleware)
+
+    app.add_middleware(DBQueryCounterMiddleware)
+
+    # Outermost, so latency includes CORS handling and every response is counted
+    app.add_middleware(PrometheusMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+def __getattr__(name):
+    # Keeps `uvicorn server:app` working without building the app at import time
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
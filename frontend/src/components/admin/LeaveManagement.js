@@ -61,7 +61,7 @@ export default function LeaveManagement() {
       const [policiesRes, requestsRes, employeesRes] = await Promise.all([
         api.get('/leave-policies'),
         api.get('/leave-requests'),
-        api.get('/employees'),
+        api.get('/employees', { params: { view: 'summary' } }),
       ]);
       setPolicies(policiesRes.data);
       // Sort requests: pending first, then by date
@@ -15,6 +15,8 @@ export default function MyPayslips() {
   const [payslips, setPayslips] = useState([]);
   const [employeeId, setEmployeeId] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [showingOlder, setShowingOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   useEffect(() => {
     fetchEmployeeAndPayslips();
@@ -28,7 +30,7 @@ export default function MyPayslips() {
       
       // Also get employee ID for reference if needed
       try {
-        const employeesRes = await api.get('/employees');
+        const employeesRes = await api.get('/employees', { params: { view: 'summary' } });
         const user = JSON.parse(localStorage.getItem('user'));
         const employee = employeesRes.data.find((e) => e.email === user.email);
         if (employee) {
@@ -47,6 +49,22 @@ export default function MyPayslips() {
     }
   };
 
+  // The list only covers recent months; archived ones come back once a `from` month is sent
+  const fetchOlderPayslips = async () => {
+    setLoadingOlder(true);
+    try {
+      const payslipsRes = await api.get('/payslips', { params: { from: '1970-01' } });
+      setPayslips(payslipsRes.data || []);
+      setShowingOlder(true);
+    } catch (error) {
+      const errorMessage = error.response?.data?.detail || 'Failed to fetch older payslips';
+      toast.error(errorMessage);
+      console.error('Error fetching older payslips:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleDownload = async (payslipId, month) => {
     try {
       const response = await api.get(`/payslips/${payslipId}/download`, {
@@ -186,6 +204,19 @@ export default function MyPayslips() {
           ))
         )}
       </div>
+
+      {!showingOlder && (
+        <div className="text-center">
+          <Button
+            variant="outline"
+            onClick={fetchOlderPayslips}
+            disabled={loadingOlder}
+            data-testid="show-older-payslips-button"
+          >
+            {loadingOlder ? 'Loading...' : 'Show older payslips'}
+          </Button>
+        </div>
+      )}
     </div>
   );
 }
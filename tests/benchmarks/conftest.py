@@ -0,0 +1,114 @@
+"""Fixtures for the per-route benchmark suite.
+
+The FastAPI app is driven in-process through an ASGI client. By default the
+database is an in-memory mongomock stand-in; set HRMS_BENCH_MONGO_URL to run
+against a local mongod instead (the `hrms_bench` database is dropped first).
+
+Benchmarks only run with ``--benchmark-only`` (or HRMS_BENCHMARKS=1), e.g.:
+
+    pytest tests/benchmarks --benchmark-only
+    HRMS_BENCH_SIZES=1000 pytest tests/benchmarks --benchmark-only --benchmark-json=bench.json
+"""
+import asyncio
+import itertools
+import os
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from tests.benchmarks.seed import seed
+
+BENCH_DIR = Path(__file__).resolve().parent
+SIZES = [int(size) for size in os.environ.get("HRMS_BENCH_SIZES", "1000,10000,100000").split(",")]
+EMPLOYEE_PASSWORD = "EmpPass123!"
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark_only", default=False) or os.environ.get("HRMS_BENCHMARKS"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks run with --benchmark-only or HRMS_BENCHMARKS=1")
+    for item in items:
+        if BENCH_DIR in Path(str(item.fspath)).parents and "benchmark" in item.fixturenames:
+            item.add_marker(skip)
+
+
+class BenchContext:
+    """Seeded app plus helpers for building requests synchronously"""
+
+    def __init__(self, loop, client, database, size, ids):
+        self.loop = loop
+        self.client = client
+        self.database = database
+        self.size = size
+        self.ids = ids
+        self.admin_headers = {}
+        self.employee_headers = {}
+        self.refresh_token = None
+        self.counter = itertools.count()
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def insert(self, collection, doc):
+        self.run(self.database[collection].insert_one(dict(doc)))
+        return doc
+
+    def send(self, request):
+        response = self.run(self.client.request(**request))
+        assert response.status_code < 400, f"{request['method']} {request['url']}: {response.text[:200]}"
+        return response
+
+
+def make_database(loop):
+    mongo_url = os.environ.get("HRMS_BENCH_MONGO_URL")
+    if not mongo_url:
+        return AsyncMongoMockClient()["hrms_bench"]
+    mongo_client = AsyncIOMotorClient(mongo_url)
+    loop.run_until_complete(mongo_client.drop_database("hrms_bench"))
+    return mongo_client["hrms_bench"]
+
+
+@pytest.fixture(scope="session")
+def bench_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session", params=SIZES, ids=lambda size: f"{size}-employees")
+def bench(request, bench_loop):
+    database = make_database(bench_loop)
+    original = server.db, server.employee_search_index, server.repos, server.read_routing
+    server.db = database
+    server.employee_search_index = server.EmployeeSearchIndex()
+    server.repos = server.Repositories()
+    if os.environ.get("HRMS_BENCH_MONGO_URL"):
+        bench_loop.run_until_complete(server.ensure_indexes())
+    else:
+        # The in-memory stand-in has no replica set to route reads to
+        server.read_routing = server.ReadRouting(defaults="")
+
+    ids = bench_loop.run_until_complete(seed(database, request.param))
+    app = server.create_app(database=database)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+    ctx = BenchContext(bench_loop, client, database, request.param, ids)
+
+    admin = ctx.send({"method": "POST", "url": "/api/auth/register", "json": {
+        "email": "bench-admin@example.com", "password": "AdminPass123!", "full_name": "Bench Admin", "role": "admin",
+    }}).json()
+    ctx.admin_headers = {"Authorization": f"Bearer {admin['access_token']}"}
+    employee = ctx.send({"method": "POST", "url": "/api/auth/register", "json": {
+        "email": ids["employee"]["email"], "password": EMPLOYEE_PASSWORD,
+        "full_name": ids["employee"]["name"], "role": "employee",
+    }}).json()
+    ctx.employee_headers = {"Authorization": f"Bearer {employee['access_token']}"}
+    ctx.refresh_token = employee["refresh_token"]
+
+    yield ctx
+
+    bench_loop.run_until_complete(client.aclose())
+    server.db, server.employee_search_index, server.repos, server.read_routing = original
@@ -0,0 +1,25 @@
+"""Seed a benchmark database through the synthetic data generator."""
+from dataclasses import replace
+
+from generate_data import PROFILES, generate
+
+
+async def seed(database, employees_count, seed_value=42):
+    """Generate `employees_count` employees with two months of payslips.
+
+    Returns the generator's sample ids plus a payslip and a pending leave request
+    belonging to the sample employee, which the route cases act on.
+    """
+    profile = replace(PROFILES["small"], employees=employees_count, payslip_months=2)
+    ids = await generate(database, profile, seed=seed_value, log=lambda *args: None)
+    employee_id = ids["employee"]["id"]
+    payslip = await database.payslips.find_one({"employee_id": employee_id}, {"_id": 0, "id": 1})
+    leave_request = await database.leave_requests.find_one(
+        {"employee_id": employee_id, "status": "pending"}, {"_id": 0, "id": 1}
+    )
+    if leave_request is None:
+        # The generator rarely leaves a past request pending; give the sample employee one
+        leave_request = await database.leave_requests.find_one({"employee_id": employee_id}, {"_id": 0})
+        leave_request = {**leave_request, "id": f"{leave_request['id']}-pending", "status": "pending"}
+        await database.leave_requests.insert_one(dict(leave_request))
+    return {**ids, "payslip_id": payslip["id"], "leave_request_id": leave_request["id"]}
@@ -0,0 +1,396 @@
+"""Latency of every route on `api_router` against a seeded in-process app.
+
+Each case builds a request in the (untimed) setup phase of every round, so
+routes that create or delete data get a fresh target each time.
+"""
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+import server
+from tests.benchmarks.conftest import EMPLOYEE_PASSWORD
+
+ROUNDS = int(os.environ.get("HRMS_BENCH_ROUNDS", "20"))
+TEMPLATE = "<h1>{{ employee_name }}</h1><p>{{ net_pay }}</p>"
+# Payloads for the documents cases create in their setup phase
+CREATED_AT = "2024-01-01T00:00:00+00:00"
+LEAVE_TYPES = [{"type": "Casual Leave", "days": 12}, {"type": "Sick Leave", "days": 10}]
+SALARY_TYPES = [
+    {"type": "Basic Salary", "amount": 50000.0, "category": "earnings"},
+    {"type": "HRA", "amount": 20000.0, "category": "earnings"},
+    {"type": "Provident Fund", "amount": 6000.0, "category": "deductions"},
+]
+
+CASES = {}
+
+
+def case(name):
+    def register(build):
+        CASES[name] = build
+        return build
+    return register
+
+
+def admin(ctx, method, url, **kwargs):
+    return {"method": method, "url": url, "headers": ctx.admin_headers, **kwargs}
+
+
+def employee(ctx, method, url, **kwargs):
+    return {"method": method, "url": url, "headers": ctx.employee_headers, **kwargs}
+
+
+def unique_date(ctx):
+    return (date(2030, 1, 1) + timedelta(days=next(ctx.counter))).isoformat()
+
+
+def fresh_employee(ctx):
+    n = next(ctx.counter)
+    return ctx.insert("employees", {
+        "id": str(uuid.uuid4()), "employee_id": f"BENCH{n:06d}", "name": f"Bench {n}",
+        "email": f"bench{n}@example.com", "department_id": ctx.ids["department_id"],
+        "joining_date": "2024-01-01", "invited": False, "created_at": CREATED_AT,
+    })
+
+
+# ---- auth ----
+
+@case("register")
+def _(ctx):
+    return {"method": "POST", "url": "/api/auth/register", "json": {
+        "email": f"bench-user{next(ctx.counter)}@example.com", "password": "x", "full_name": "U", "role": "admin"}}
+
+
+@case("login")
+def _(ctx):
+    return {"method": "POST", "url": "/api/auth/login",
+            "json": {"email": ctx.ids["employee"]["email"], "password": EMPLOYEE_PASSWORD}}
+
+
+@case("refresh_token")
+def _(ctx):
+    return {"method": "POST", "url": "/api/auth/refresh", "json": {"refresh_token": ctx.refresh_token}}
+
+
+@case("get_me")
+def _(ctx):
+    return employee(ctx, "GET", "/api/auth/me")
+
+
+# ---- departments ----
+
+@case("list_departments_with_count")
+def _(ctx):
+    return admin(ctx, "GET", "/api/departments-with-count")
+
+
+@case("create_department")
+def _(ctx):
+    return admin(ctx, "POST", "/api/departments", json={"name": f"Bench {next(ctx.counter)}"})
+
+
+@case("list_departments")
+def _(ctx):
+    return employee(ctx, "GET", "/api/departments")
+
+
+@case("delete_department")
+def _(ctx):
+    department = ctx.insert("departments", {"id": str(uuid.uuid4()), "name": "Temp", "created_at": CREATED_AT})
+    return admin(ctx, "DELETE", f"/api/departments/{department['id']}")
+
+
+# ---- employees ----
+
+@case("delete_employee")
+def _(ctx):
+    return admin(ctx, "DELETE", f"/api/employees/{fresh_employee(ctx)['id']}")
+
+
+@case("create_employee")
+def _(ctx):
+    return admin(ctx, "POST", "/api/employees", json={
+        "name": "New Hire", "email": f"hire{next(ctx.counter)}@example.com",
+        "department_id": ctx.ids["department_id"], "joining_date": "2025-01-01"})
+
+
+@case("list_employees")
+def _(ctx):
+    return admin(ctx, "GET", "/api/employees")
+
+
+@case("search_employees")
+def _(ctx):
+    return admin(ctx, "GET", "/api/employees/search", params={"q": "employee 1"})
+
+
+@case("get_employee")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/employees/{ctx.ids['employee']['id']}")
+
+
+@case("update_employee")
+def _(ctx):
+    return admin(ctx, "PUT", f"/api/employees/{ctx.ids['employee']['id']}", json={"name": ctx.ids["employee"]["name"]})
+
+
+@case("get_employee_org_tree")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/employees/{ctx.ids['manager_id']}/org-tree")
+
+
+@case("get_employee_headcount")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/employees/{ctx.ids['manager_id']}/headcount")
+
+
+# ---- payroll ----
+
+@case("delete_payroll_structure")
+def _(ctx):
+    structure = ctx.insert("payroll_structures", {"id": str(uuid.uuid4()), "name": "Temp", "salary_types": [],
+                                                  "net_salary": 0.0, "created_at": CREATED_AT})
+    return admin(ctx, "DELETE", f"/api/payroll-structures/{structure['id']}")
+
+
+@case("update_payroll_structure")
+def _(ctx):
+    return admin(ctx, "PUT", f"/api/payroll-structures/{ctx.ids['structure_id']}",
+                 json={"name": "Structure 0", "salary_types": SALARY_TYPES, "print_format_id": ctx.ids["format_id"]})
+
+
+@case("create_payroll_structure")
+def _(ctx):
+    return admin(ctx, "POST", "/api/payroll-structures", json={"name": "New", "salary_types": SALARY_TYPES})
+
+
+@case("list_payroll_structures")
+def _(ctx):
+    return admin(ctx, "GET", "/api/payroll-structures")
+
+
+@case("assign_payroll")
+def _(ctx):
+    return admin(ctx, "POST", "/api/payroll", json={
+        "employee_id": ctx.ids["employee"]["id"], "payroll_structure_id": ctx.ids["structure_id"]})
+
+
+@case("get_payroll")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/payroll/{ctx.ids['employee']['id']}")
+
+
+# ---- print formats ----
+
+@case("create_print_format")
+def _(ctx):
+    return admin(ctx, "POST", "/api/print-formats", json={"name": "New", "template_html": TEMPLATE})
+
+
+@case("list_print_formats")
+def _(ctx):
+    return admin(ctx, "GET", "/api/print-formats")
+
+
+@case("get_print_format")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/print-formats/{ctx.ids['format_id']}")
+
+
+@case("update_print_format")
+def _(ctx):
+    return admin(ctx, "PUT", f"/api/print-formats/{ctx.ids['format_id']}",
+                 json={"name": "Format 0", "template_html": TEMPLATE, "is_default": True})
+
+
+@case("delete_print_format")
+def _(ctx):
+    fmt = ctx.insert("print_formats", {"id": str(uuid.uuid4()), "name": "Temp", "template_html": TEMPLATE,
+                                       "is_default": False, "created_at": CREATED_AT})
+    return admin(ctx, "DELETE", f"/api/print-formats/{fmt['id']}")
+
+
+@case("preview_print_format")
+def _(ctx):
+    return admin(ctx, "POST", f"/api/print-formats/{ctx.ids['format_id']}/preview")
+
+
+# ---- payslips ----
+
+@case("generate_payslip")
+def _(ctx):
+    payee = fresh_employee(ctx)
+    ctx.insert("payroll", {"id": str(uuid.uuid4()), "employee_id": payee["id"],
+                           "payroll_structure_id": ctx.ids["structure_id"], "created_at": CREATED_AT})
+    return admin(ctx, "POST", "/api/payslips/generate", json={"employee_id": payee["id"], "month": "2025-03"})
+
+
+@case("list_payslips")
+def _(ctx):
+    return admin(ctx, "GET", "/api/payslips")
+
+
+@case("get_employee_payslips")
+def _(ctx):
+    return employee(ctx, "GET", f"/api/payslips/employee/{ctx.ids['employee']['id']}")
+
+
+@case("delete_payslip")
+def _(ctx):
+    payslip = ctx.insert("payslips", {
+        "id": str(uuid.uuid4()), "employee_id": ctx.ids["employee"]["id"], "month": "2020-01",
+        "basic_salary": 1.0, "allowances": 0.0, "deductions": 0.0, "net_pay": 1.0, "salary_types": [],
+        "generated_at": "2020-01-31T00:00:00+00:00"})
+    return admin(ctx, "DELETE", f"/api/payslips/{payslip['id']}")
+
+
+@case("download_payslip")
+def _(ctx):
+    return employee(ctx, "GET", f"/api/payslips/{ctx.ids['payslip_id']}/download")
+
+
+# ---- leave policies ----
+
+@case("create_leave_policy")
+def _(ctx):
+    return admin(ctx, "POST", "/api/leave-policies", json={"name": "New", "leave_types": LEAVE_TYPES})
+
+
+@case("list_leave_policies")
+def _(ctx):
+    return employee(ctx, "GET", "/api/leave-policies")
+
+
+@case("update_leave_policy")
+def _(ctx):
+    return admin(ctx, "PUT", f"/api/leave-policies/{ctx.ids['policy_id']}",
+                 json={"name": "Policy 0", "leave_types": LEAVE_TYPES})
+
+
+@case("delete_leave_policy")
+def _(ctx):
+    policy = ctx.insert("leave_policies", {"id": str(uuid.uuid4()), "name": "Temp", "leave_types": LEAVE_TYPES,
+                                           "created_at": CREATED_AT})
+    return admin(ctx, "DELETE", f"/api/leave-policies/{policy['id']}")
+
+
+@case("assign_policy_to_employee")
+def _(ctx):
+    return admin(ctx, "POST", "/api/employee-policy-assignments", json={
+        "employee_id": ctx.ids["employee"]["id"], "leave_policy_id": ctx.ids["policy_id"]})
+
+
+@case("get_my_policy_assignment")
+def _(ctx):
+    return employee(ctx, "GET", "/api/employee-policy-assignments/me")
+
+
+@case("get_employee_policy_assignment")
+def _(ctx):
+    return admin(ctx, "GET", f"/api/employee-policy-assignments/employee/{ctx.ids['employee']['id']}")
+
+
+@case("list_employee_policy_assignments")
+def _(ctx):
+    return admin(ctx, "GET", "/api/employee-policy-assignments")
+
+
+# ---- leave requests ----
+
+@case("create_leave_request")
+def _(ctx):
+    return employee(ctx, "POST", "/api/leave-requests", json={
+        "leave_type": "Casual Leave", "start_date": "2025-03-04", "end_date": "2025-03-05", "reason": "Bench"})
+
+
+@case("list_leave_requests")
+def _(ctx):
+    return admin(ctx, "GET", "/api/leave-requests", params={"status": "pending"})
+
+
+@case("update_leave_request")
+def _(ctx):
+    return admin(ctx, "PATCH", f"/api/leave-requests/{ctx.ids['leave_request_id']}", json={"status": "approved"})
+
+
+@case("bulk_update_leave_requests")
+def _(ctx):
+    return admin(ctx, "PATCH", "/api/leave-requests/bulk", json={"ids": [ctx.ids["leave_request_id"]], "status": "approved"})
+
+
+@case("get_leave_balance")
+def _(ctx):
+    return employee(ctx, "GET", "/api/leave-requests/balance")
+
+
+@case("get_leave_calendar")
+def _(ctx):
+    return admin(ctx, "GET", "/api/leave-calendar", params={"from": "2025-12-01", "to": "2025-12-31"})
+
+
+@case("close_leave_year_job")
+def _(ctx):
+    # No queue runs in the benchmark app, so this measures enqueueing (deduplicated after the first)
+    return admin(ctx, "POST", "/api/leave-years/2025/close")
+
+
+@case("archive_payslips_job")
+def _(ctx):
+    return admin(ctx, "POST", "/api/payslips/archive")
+
+
+# ---- jobs ----
+
+@case("get_job")
+def _(ctx):
+    job = ctx.insert("jobs", {"id": str(uuid.uuid4()), "type": "close_leave_year", "params": {"year": 2025},
+                              "status": "running", "attempts": 1, "done": 10, "total": 100,
+                              "created_at": CREATED_AT, "updated_at": CREATED_AT})
+    return admin(ctx, "GET", f"/api/jobs/{job['id']}")
+
+
+# ---- holidays ----
+
+@case("list_holidays")
+def _(ctx):
+    return employee(ctx, "GET", "/api/holidays")
+
+
+@case("create_holiday")
+def _(ctx):
+    return admin(ctx, "POST", "/api/holidays", json={"date": unique_date(ctx), "name": "Bench"})
+
+
+@case("create_holidays_bulk")
+def _(ctx):
+    return admin(ctx, "POST", "/api/holidays/bulk", json=[
+        {"date": unique_date(ctx), "name": "Bench"}, {"date": unique_date(ctx), "name": "Bench"}])
+
+
+@case("delete_holiday")
+def _(ctx):
+    holiday = ctx.insert("holidays", {"id": str(uuid.uuid4()), "date": unique_date(ctx), "name": "Temp",
+                                      "created_at": CREATED_AT})
+    return admin(ctx, "DELETE", f"/api/holidays/{holiday['id']}")
+
+
+# ---- reports ----
+
+@case("payroll_register_report")
+def _(ctx):
+    return admin(ctx, "GET", "/api/reports/payroll-register", params={"month": "2025-12"})
+
+
+def test_every_route_has_a_case():
+    route_names = {route.name for route in server.api_router.routes}
+    assert route_names - set(CASES) == set(), "add a benchmark case for each new route"
+    assert set(CASES) - route_names == set(), "remove benchmark cases for deleted routes"
+
+
+@pytest.mark.parametrize("route_name", sorted(CASES))
+def test_route_latency(benchmark, bench, route_name):
+    build = CASES[route_name]
+    benchmark.group = f"{bench.size} employees"
+    benchmark.extra_info["employees"] = bench.size
+    benchmark.pedantic(bench.send, setup=lambda: ((build(bench),), {}), rounds=ROUNDS, warmup_rounds=1)
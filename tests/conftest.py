@@ -0,0 +1,59 @@
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "hrms_test")
+os.environ.setdefault("CACHE_INVALIDATION_MODE", "poll")
+
+import server  # noqa: E402
+from tests.db_queries import CountingDatabase  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """In-memory Mongo stand-in that reports each command to the per-request counter"""
+    database = CountingDatabase(AsyncMongoMockClient()["hrms_test"])
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "employee_search_index", server.EmployeeSearchIndex())
+    # Tests write fixtures straight to the database, so reference caching stays off
+    monkeypatch.setattr(server, "repos", server.Repositories(cache_ttl=0))
+    return database
+
+
+@pytest.fixture
+async def app(database):
+    # ASGITransport doesn't send lifespan events, so run startup/shutdown here
+    app = server.create_app(database=database)
+    async with app.router.lifespan_context(app):
+        yield app
+
+
+@pytest.fixture
+async def client(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+
+
+@pytest.fixture
+async def admin_headers(client):
+    response = await client.post("/api/auth/register", json={
+        "email": "admin@example.com",
+        "password": "AdminPass123!",
+        "full_name": "Test Admin",
+        "role": "admin",
+    })
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
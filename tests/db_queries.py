@@ -0,0 +1,74 @@
+"""Helpers for asserting how many Mongo commands an endpoint issues.
+
+The server counts commands per request through a pymongo CommandListener and
+reports them in the ``X-DB-Queries`` response header. The in-memory stand-in
+used by the tests never talks to a server, so ``CountingDatabase`` reports each
+collection call to the same counter instead.
+"""
+import server
+
+CURSOR_METHODS = {"find", "aggregate"}
+COMMAND_METHODS = {
+    "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "count_documents", "estimated_document_count",
+    "distinct", "bulk_write", "create_index",
+}
+
+
+class CountingCollection:
+    def __init__(self, collection, read_preferences=None):
+        self._collection = collection
+        self._read_preferences = read_preferences if read_preferences is not None else []
+
+    def with_options(self, read_preference=None, **kwargs):
+        # The stand-in has no replica set; record the preference so tests can assert routing
+        self._read_preferences.append((self._collection.name, read_preference))
+        return self
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in CURSOR_METHODS:
+            def open_cursor(*args, **kwargs):
+                server.record_db_command(0.0)
+                return attr(*args, **kwargs)
+            return open_cursor
+        if name in COMMAND_METHODS:
+            async def command(*args, **kwargs):
+                server.record_db_command(0.0)
+                return await attr(*args, **kwargs)
+            return command
+        return attr
+
+
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+        self.read_preferences = []
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = CountingCollection(self._database[name], self.read_preferences)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+async def assert_query_count_constant(client, method, url, grow, sizes=(3, 30), **kwargs):
+    """Fail if the number of DB queries `url` issues changes as the data grows.
+
+    ``grow(size)`` is awaited before each call and should bring the dataset up to
+    ``size`` items of whatever the endpoint iterates over.
+    """
+    counts = {}
+    for size in sizes:
+        await grow(size)
+        response = await client.request(method, url, **kwargs)
+        assert response.status_code < 400, response.text
+        counts[size] = int(response.headers["x-db-queries"])
+    assert len(set(counts.values())) == 1, f"{method} {url} query count grows with data size: {counts}"
+    return counts
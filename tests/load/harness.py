@@ -0,0 +1,340 @@
+"""Scenario-based concurrency load harness for the in-process app.
+
+Models the traffic mixes that hurt in production: payroll day (employees
+opening their payslips while admins generate the month's payslips) and the
+morning leave rush (employees logging in, checking balances and applying for
+leave while admins work the approval queue). Each stream of a scenario is an
+open-model Poisson arrival process, so slow responses pile up the way they do
+with real users instead of throttling the load.
+
+    python -m tests.load.harness --scenario leave-rush --duration 30 --employees 5000
+    python -m tests.load.harness --scenario payroll-day --rate employee=40 --rate admin=2 --output run.json
+
+Per route it reports p50/p95/p99 latency and the event-loop lag observed while
+those requests were in flight, and writes everything as JSON so runs can be
+compared. The client shares the event loop with the app, so lag caused by one
+route (e.g. bcrypt on login) shows up in the latency of every route.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "hrms_load")
+
+import httpx  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import server  # noqa: E402
+from tests.benchmarks.seed import seed  # noqa: E402
+
+PASSWORD = "LoadPass123!"
+LAG_INTERVAL = 0.01
+LEAVE_DATES = ["2025-03-04", "2025-03-05", "2025-03-06", "2025-03-11", "2025-03-12", "2025-03-13"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class Sample:
+    route: str
+    start: float
+    end: float
+    status: int
+
+
+@dataclass
+class Actor:
+    headers: dict
+    employee_id: str = None
+    email: str = None
+    payslip_ids: List[str] = field(default_factory=list)
+
+
+class LoadContext:
+    """Seeded app, user pool and the samples collected during a run"""
+
+    def __init__(self, client, rng):
+        self.client = client
+        self.rng = rng
+        self.employees: List[Actor] = []
+        self.admins: List[Actor] = []
+        self.samples: List[Sample] = []
+        self.payroll_targets = None
+
+    async def call(self, actor: Actor, method: str, route: str, json_body=None, params=None, **path_params):
+        """Send one timed request; returns the response, or None if it never completed"""
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(
+                method, route.format(**path_params), json=json_body, params=params, headers=actor.headers
+            )
+            status = response.status_code
+        except Exception:
+            status = 599
+        self.samples.append(Sample(f"{method} {route}", start, time.perf_counter(), status))
+        return response
+
+
+# ---- journeys ----
+
+async def employee_opens_payslips(ctx: LoadContext):
+    actor = ctx.rng.choice(ctx.employees)
+    await ctx.call(actor, "GET", "/api/payslips")
+    await ctx.call(actor, "GET", "/api/employees", params={"view": "summary"})
+    if actor.payslip_ids:
+        await ctx.call(actor, "GET", "/api/payslips/{payslip_id}/download", payslip_id=ctx.rng.choice(actor.payslip_ids))
+
+
+async def employee_logs_in_and_applies(ctx: LoadContext):
+    actor = ctx.rng.choice(ctx.employees)
+    await ctx.call(actor, "POST", "/api/auth/login", json_body={"email": actor.email, "password": PASSWORD})
+    await ctx.call(actor, "GET", "/api/leave-requests")
+    await ctx.call(actor, "GET", "/api/leave-requests/balance")
+    await ctx.call(actor, "GET", "/api/holidays")
+    await ctx.call(actor, "GET", "/api/employee-policy-assignments/me")
+    day = ctx.rng.choice(LEAVE_DATES)
+    await ctx.call(actor, "POST", "/api/leave-requests", json_body={
+        "leave_type": "Casual Leave", "start_date": day, "end_date": day, "reason": "Load test",
+    })
+
+
+async def admin_generates_payslips(ctx: LoadContext):
+    actor = ctx.rng.choice(ctx.admins)
+    employee_id, month = next(ctx.payroll_targets)
+    await ctx.call(actor, "POST", "/api/payslips/generate", json_body={"employee_id": employee_id, "month": month})
+    await ctx.call(actor, "GET", "/api/payslips", params={"view": "summary"})
+
+
+async def admin_reviews_leave(ctx: LoadContext):
+    actor = ctx.rng.choice(ctx.admins)
+    response = await ctx.call(actor, "GET", "/api/leave-requests", params={"status": "pending"})
+    if response is not None and response.status_code == 200:
+        pending = response.json()
+        if pending:
+            await ctx.call(actor, "PATCH", "/api/leave-requests/{request_id}",
+                           json_body={"status": ctx.rng.choice(["approved", "rejected"])},
+                           request_id=ctx.rng.choice(pending)["id"])
+
+
+@dataclass
+class Stream:
+    journey: Callable
+    rate: float  # arrivals per second
+
+
+SCENARIOS: Dict[str, Dict[str, Stream]] = {
+    "payroll-day": {
+        "employee": Stream(employee_opens_payslips, rate=20.0),
+        "admin": Stream(admin_generates_payslips, rate=5.0),
+    },
+    "leave-rush": {
+        "employee": Stream(employee_logs_in_and_applies, rate=10.0),
+        "admin": Stream(admin_reviews_leave, rate=1.0),
+    },
+}
+
+
+# ---- setup ----
+
+async def prepare(database, employees: int, users: int, admins: int, rng: random.Random) -> LoadContext:
+    await seed(database, employees, rng.randrange(2 ** 32))
+
+    hashed = server.get_password_hash(PASSWORD)
+    now = datetime.now(timezone.utc).isoformat()
+    app = server.create_app(database=database)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver", timeout=None)
+    ctx = LoadContext(client, rng)
+
+    staff = await database.employees.find({}, {"_id": 0, "id": 1, "email": 1, "name": 1}).to_list(users)
+    payslips = await database.payslips.find(
+        {"employee_id": {"$in": [e["id"] for e in staff]}}, {"_id": 0, "id": 1, "employee_id": 1}
+    ).to_list(None)
+    payslips_by_employee = defaultdict(list)
+    for payslip in payslips:
+        payslips_by_employee[payslip["employee_id"]].append(payslip["id"])
+
+    user_docs = []
+    for employee in staff:
+        user_id = f"user-{employee['id']}"
+        user_docs.append({"id": user_id, "email": employee["email"], "full_name": employee["name"],
+                          "role": "employee", "hashed_password": hashed, "created_at": now})
+        await database.employees.update_one({"id": employee["id"]}, {"$set": {"user_id": user_id}})
+        token = server.create_access_token({"sub": user_id, "role": "employee"})
+        ctx.employees.append(Actor({"Authorization": f"Bearer {token}"}, employee["id"], employee["email"],
+                                   payslips_by_employee[employee["id"]]))
+    for i in range(admins):
+        user_id = f"admin-{i}"
+        user_docs.append({"id": user_id, "email": f"load-admin{i}@example.com", "full_name": f"Admin {i}",
+                          "role": "admin", "hashed_password": hashed, "created_at": now})
+        token = server.create_access_token({"sub": user_id, "role": "admin"})
+        ctx.admins.append(Actor({"Authorization": f"Bearer {token}"}))
+    await database.users.insert_many(user_docs)
+
+    all_ids = [e["id"] for e in await database.employees.find({}, {"_id": 0, "id": 1}).to_list(None)]
+    ctx.payroll_targets = ((employee_id, f"{2026 + cycle}-{month:02d}")
+                           for cycle in itertools.count()
+                           for month in range(1, 13)
+                           for employee_id in all_ids)
+    return ctx
+
+
+# ---- run ----
+
+async def monitor_loop_lag(samples: List, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        now = time.perf_counter()
+        samples.append((now, max(0.0, now - expected)))
+
+
+async def arrivals(ctx: LoadContext, stream: Stream, deadline: float, tasks: set):
+    while True:
+        await asyncio.sleep(ctx.rng.expovariate(stream.rate))
+        if time.perf_counter() >= deadline:
+            return
+        task = asyncio.create_task(stream.journey(ctx))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+def summarize(ctx: LoadContext, lag_samples: List, wall_seconds: float) -> dict:
+    # A lag sample taken at t with lag L means the loop stalled from about t - L onwards;
+    # it is attributed to the requests that were in flight when the stall began.
+    lag_times = [t for t, _ in lag_samples]
+    max_lag = max((lag for _, lag in lag_samples), default=0.0)
+    routes = {}
+    by_route = defaultdict(list)
+    for sample in ctx.samples:
+        by_route[sample.route].append(sample)
+    for route, samples in sorted(by_route.items()):
+        latencies = [(s.end - s.start) * 1000 for s in samples]
+        lags = []
+        for s in samples:
+            lo = bisect.bisect_left(lag_times, s.start - LAG_INTERVAL)
+            hi = bisect.bisect_right(lag_times, s.end + max_lag)
+            stalls = (lag for t, lag in lag_samples[lo:hi] if s.start - LAG_INTERVAL <= t - lag <= s.end)
+            lags.append(max(stalls, default=0.0) * 1000)
+        routes[route] = {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if s.status >= 400),
+            "throughput_rps": round(len(samples) / wall_seconds, 2),
+            "latency_ms": {p: round(percentile(latencies, q), 2)
+                           for p, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+            "loop_lag_ms": {p: round(percentile(lags, q), 2) for p, q in (("p50", 50), ("p95", 95), ("max", 100))},
+        }
+    lags = [lag * 1000 for _, lag in lag_samples]
+    return {
+        "routes": routes,
+        "loop_lag_ms": {p: round(percentile(lags, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+    }
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    mongo_url = os.environ.get("HRMS_LOAD_MONGO_URL")
+    if mongo_url:
+        mongo_client = AsyncIOMotorClient(mongo_url)
+        await mongo_client.drop_database("hrms_load")
+        database = mongo_client["hrms_load"]
+    else:
+        database = AsyncMongoMockClient()["hrms_load"]
+    server.db = database
+    server.employee_search_index = server.EmployeeSearchIndex()
+    if mongo_url:
+        await server.ensure_indexes()
+    else:
+        # The in-memory stand-in has no replica set to route reads to
+        server.read_routing = server.ReadRouting(defaults="")
+
+    ctx = await prepare(database, args.employees, args.users, args.admins, rng)
+    streams = {name: Stream(s.journey, args.rates.get(name, s.rate) * args.rate_scale)
+               for name, s in SCENARIOS[args.scenario].items()}
+
+    lag_samples, stop, tasks = [], asyncio.Event(), set()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(arrivals(ctx, stream, deadline, tasks) for stream in streams.values()))
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=args.drain_timeout)
+    wall_seconds = time.perf_counter() - started
+    stop.set()
+    await monitor
+    await ctx.client.aclose()
+
+    return {
+        "scenario": args.scenario,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "duration_s": args.duration, "employees": args.employees, "users": args.users, "admins": args.admins,
+            "seed": args.seed, "rates": {name: s.rate for name, s in streams.items()},
+            "database": "mongod" if mongo_url else "mongomock",
+        },
+        "wall_seconds": round(wall_seconds, 2),
+        **summarize(ctx, lag_samples, wall_seconds),
+    }
+
+
+def print_report(result: dict):
+    print(f"\nScenario {result['scenario']} — {result['wall_seconds']}s, rates {result['config']['rates']}")
+    print(f"{'route':<52} {'reqs':>6} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'lag p95':>8}")
+    for route, stats in result["routes"].items():
+        latency = stats["latency_ms"]
+        print(f"{route:<52} {stats['requests']:>6} {stats['errors']:>5} {latency['p50']:>8} "
+              f"{latency['p95']:>8} {latency['p99']:>8} {stats['loop_lag_ms']['p95']:>8}")
+    print(f"event loop lag (ms): {result['loop_lag_ms']}")
+
+
+def parse_rate(value: str):
+    name, _, rate = value.partition("=")
+    return name, float(rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="leave-rush")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--employees", type=int, default=1000, help="seeded headcount")
+    parser.add_argument("--users", type=int, default=300, help="employees with a login")
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--rate", dest="rates", action="append", type=parse_rate, default=[],
+                        metavar="STREAM=RPS", help="override a stream's arrival rate (journeys per second)")
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="multiply every stream's rate")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON result here")
+    args = parser.parse_args(argv)
+    args.rates = dict(args.rates)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
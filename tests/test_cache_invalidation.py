@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def make_worker():
+    bus = server.InvalidationBus(mode="poll", poll_interval=0.01)
+    return bus, server.Repositories(cache_ttl=3600, bus=bus)
+
+
+async def test_write_on_one_worker_clears_cache_on_another(database):
+    await database.departments.insert_one({"id": "d1", "name": "Ops"})
+    bus_a, repos_a = make_worker()
+    bus_b, repos_b = make_worker()
+    await bus_a.start()
+    await bus_b.start()
+    try:
+        assert [d["name"] for d in await repos_b.departments.list_all()] == ["Ops"]
+
+        await repos_a.departments.update("d1", {"name": "Operations"})
+        for _ in range(100):
+            if [d["name"] for d in await repos_b.departments.list_all()] == ["Operations"]:
+                break
+            await asyncio.sleep(0.01)
+        else:
+            pytest.fail("worker B kept serving the stale department")
+    finally:
+        await bus_a.stop()
+        await bus_b.stop()
+
+
+async def test_own_writes_do_not_trigger_remote_invalidation(database):
+    bus, repos = make_worker()
+    cleared = []
+    bus.subscribe(["holidays"], cleared.append)
+    await bus._sync()
+
+    await repos.holidays.insert({"id": "h1", "date": "2025-01-26", "name": "Republic Day"})
+    await bus._sync()
+    assert cleared == []
+
+    other, other_repos = make_worker()
+    await other_repos.holidays.insert({"id": "h2", "date": "2025-08-15", "name": "Independence Day"})
+    await bus._sync()
+    assert cleared == ["holidays"]
+
+
+async def test_unwatched_collections_are_not_published(database):
+    bus, repos = make_worker()
+    await repos.leave_requests.insert({"id": "r1", "status": "pending"})
+    assert await database.cache_versions.count_documents({}) == 0
+
+
+async def test_remote_invalidation_during_a_fetch_discards_its_result(database, monkeypatch):
+    await database.departments.insert_one({"id": "d1", "name": "Ops"})
+    bus_a, repos_a = make_worker()
+    bus_b, repos_b = make_worker()
+    await bus_b._sync()
+    find = repos_b.departments._find
+    fetched, resume = asyncio.Event(), asyncio.Event()
+
+    async def slow_find(*args, **kwargs):
+        docs = await find(*args, **kwargs)
+        fetched.set()
+        await resume.wait()
+        return docs
+
+    monkeypatch.setattr(repos_b.departments, "_find", slow_find)
+    pending = asyncio.ensure_future(repos_b.departments.list_all())
+    await fetched.wait()
+    await repos_a.departments.update("d1", {"name": "Operations"})
+    await bus_b._sync()
+    resume.set()
+    assert [d["name"] for d in await pending] == ["Ops"]
+
+    monkeypatch.setattr(repos_b.departments, "_find", find)
+    assert [d["name"] for d in await repos_b.departments.list_all()] == ["Operations"]
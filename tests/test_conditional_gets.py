@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def published(monkeypatch):
+    # The default test repositories skip the invalidation bus, so writes bump no versions
+    monkeypatch.setattr(server, "repos", server.Repositories(cache_ttl=0, bus=server.invalidation_bus))
+
+
+async def test_unchanged_list_is_answered_with_304(client, admin_headers, database, published):
+    await client.post("/api/holidays", json={"date": "2025-01-26", "name": "Republic Day"}, headers=admin_headers)
+    first = await client.get("/api/holidays", headers=admin_headers)
+    etag = first.headers["etag"]
+
+    again = await client.get("/api/holidays", headers={**admin_headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    # Only authentication and the version lookup; the holidays themselves are not read
+    assert again.headers["x-db-queries"] == "2"
+
+    await client.post("/api/holidays", json={"date": "2025-08-15", "name": "Independence Day"}, headers=admin_headers)
+    changed = await client.get("/api/holidays", headers={**admin_headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
+
+
+async def test_payroll_structure_etag_follows_assignments(client, admin_headers, database, published):
+    first = await client.get("/api/payroll-structures", headers=admin_headers)
+    await server.repos.payroll.insert({"id": "p1", "employee_id": "e1", "payroll_structure_id": "s1"})
+    second = await client.get("/api/payroll-structures", headers={**admin_headers, "If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+
+
+async def test_large_responses_are_compressed(client, admin_headers, database):
+    await database.departments.insert_many([{"id": f"d{i}", "name": f"Department {i}"} for i in range(50)])
+    response = await client.get("/api/departments", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 50
+
+    raw = await client.get("/api/departments", headers={**admin_headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+
+
+async def test_etag_matches_body_when_a_write_lands_mid_read(client, admin_headers, database, monkeypatch):
+    monkeypatch.setattr(server, "repos", server.Repositories(cache_ttl=3600, bus=server.invalidation_bus))
+    await client.post("/api/holidays", json={"date": "2025-01-26", "name": "Republic Day"}, headers=admin_headers)
+    find = server.repos.holidays._find
+    fetched, resume = asyncio.Event(), asyncio.Event()
+
+    async def slow_find(*args, **kwargs):
+        docs = await find(*args, **kwargs)
+        fetched.set()
+        await resume.wait()
+        return docs
+
+    monkeypatch.setattr(server.repos.holidays, "_find", slow_find)
+    racing = asyncio.ensure_future(client.get("/api/holidays", headers=admin_headers))
+    await fetched.wait()
+    await client.post("/api/holidays", json={"date": "2025-08-15", "name": "Independence Day"}, headers=admin_headers)
+    resume.set()
+    before = await racing
+    monkeypatch.setattr(server.repos.holidays, "_find", find)
+    assert len(before.json()) == 1
+
+    after = await client.get("/api/holidays", headers=admin_headers)
+    assert after.headers["etag"] != before.headers["etag"]
+    assert len(after.json()) == 2
+    again = await client.get("/api/holidays", headers={**admin_headers, "If-None-Match": before.headers["etag"]})
+    assert again.status_code == 200
+    assert len(again.json()) == 2
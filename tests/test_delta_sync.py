@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from tests.db_queries import CountingCollection
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_holiday_delta_has_changes_and_deletions(client, admin_headers):
+    first = await client.post("/api/holidays", json={"date": "2025-01-26", "name": "Republic Day"}, headers=admin_headers)
+    listing = await client.get("/api/holidays", headers=admin_headers)
+    cursor = listing.headers["x-sync-cursor"]
+
+    empty = (await client.get("/api/holidays", params={"since": cursor}, headers=admin_headers)).json()
+    # Recent writes are repeated within the overlap window, never dropped
+    assert [h["name"] for h in empty["changed"]] == ["Republic Day"] and empty["deleted"] == []
+
+    await client.post("/api/holidays", json={"date": "2025-08-15", "name": "Independence Day"}, headers=admin_headers)
+    await client.delete(f"/api/holidays/{first.json()['id']}", headers=admin_headers)
+    delta = (await client.get("/api/holidays", params={"since": cursor}, headers=admin_headers)).json()
+    assert [h["name"] for h in delta["changed"]] == ["Independence Day"]
+    assert delta["deleted"] == [first.json()["id"]]
+    assert int(delta["cursor"]) >= int(cursor)
+
+
+async def test_leave_request_delta_is_scoped_like_the_list(client, admin_headers, database):
+    response = await client.post("/api/auth/register", json={
+        "email": "asha@example.com", "password": "AshaPass123!", "full_name": "Asha", "role": "employee",
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await database.employees.insert_many([
+        {"id": "e1", "name": "Asha", "email": "asha@example.com", "user_id": response.json()["user"]["id"]},
+        {"id": "e2", "name": "Bo", "email": "bo@example.com"},
+    ])
+    await database.leave_requests.insert_many([
+        {"id": f"r-{e}", "employee_id": e, "leave_type": "Annual", "reason": "Rest", "status": "pending",
+         "start_date": "2025-03-03", "end_date": "2025-03-03", "created_at": "2025-01-01T00:00:00+00:00"}
+        for e in ("e1", "e2")
+    ])
+    cursor = (await client.get("/api/leave-requests", headers=headers)).headers["x-sync-cursor"]
+    await client.patch("/api/leave-requests/bulk", json={"ids": ["r-e1", "r-e2"], "status": "approved"},
+                       headers=admin_headers)
+
+    mine = (await client.get("/api/leave-requests", params={"since": cursor}, headers=headers)).json()
+    assert [(r["id"], r["status"]) for r in mine["changed"]] == [("r-e1", "approved")]
+    everyone = (await client.get("/api/leave-requests", params={"since": cursor}, headers=admin_headers)).json()
+    assert sorted(r["id"] for r in everyone["changed"]) == ["r-e1", "r-e2"]
+
+    filtered = await client.get("/api/leave-requests", params={"since": cursor, "status": "approved"}, headers=headers)
+    assert filtered.status_code == 400
+    expired = await client.get("/api/leave-requests", params={"since": "1000"}, headers=headers)
+    assert expired.status_code == 410
+
+
+class LaggingReplica:
+    """A secondary whose snapshot is `lag` behind: finds skip anything written since"""
+
+    def __init__(self, collection, lag):
+        self._collection = collection
+        self._lag = lag
+
+    def find(self, query=None, *args, **kwargs):
+        snapshot = datetime.now(timezone.utc) - self._lag
+        return self._collection.find({"$and": [query or {}, {"updated_at": {"$lte": snapshot}}]}, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+async def test_writes_a_lagging_secondary_missed_reach_the_next_delta(client, admin_headers, database, monkeypatch):
+    def with_options(self, read_preference=None, **kwargs):
+        if read_preference is not None and read_preference.mongos_mode != "primary":
+            return LaggingReplica(self, timedelta(seconds=30))
+        return self
+
+    monkeypatch.setattr(CountingCollection, "with_options", with_options)
+    now = datetime.now(timezone.utc)
+    await database.employees.insert_many([
+        {"id": f"e{n}", "name": name, "email": f"{name.lower()}@example.com", "joining_date": "2024-01-01",
+         "updated_at": now - timedelta(seconds=age)}
+        for n, (name, age) in enumerate([("Old", 600), ("Recent", 20)])
+    ])
+
+    listing = await client.get("/api/employees", headers=admin_headers)
+    assert [e["name"] for e in listing.json()] == ["Old"]  # the secondary hasn't seen Recent yet
+
+    # Lands inside the overlap window, after the secondary's snapshot
+    await database.employees.insert_one({"id": "e2", "name": "Latest", "email": "latest@example.com",
+                                         "joining_date": "2024-01-01", "updated_at": datetime.now(timezone.utc)})
+    delta = await client.get("/api/employees", params={"since": listing.headers["x-sync-cursor"]}, headers=admin_headers)
+    assert sorted(e["name"] for e in delta.json()["changed"]) == ["Latest", "Recent"]
+
+
+async def test_cursor_only_follows_a_complete_list(client, admin_headers, database):
+    await database.employees.insert_many([{"id": f"e{i}", "name": f"Staff {i}"} for i in range(1001)])
+    employees = await client.get("/api/employees", params={"view": "summary"}, headers=admin_headers)
+    assert len(employees.json()) == 1001
+    assert "x-sync-cursor" in employees.headers
+
+    await database.leave_requests.insert_many([
+        {"id": f"r{i}", "employee_id": "e1", "leave_type": "Annual", "reason": "Rest", "status": "pending",
+         "start_date": "2025-03-03", "end_date": "2025-03-03", "created_at": f"2025-01-0{i + 1}T00:00:00+00:00"}
+        for i in range(3)
+    ])
+    for params in ({"limit": 2}, {"skip": 1}):
+        page = await client.get("/api/leave-requests", params=params, headers=admin_headers)
+        assert "x-sync-cursor" not in page.headers
+    whole = await client.get("/api/leave-requests", params={"limit": 4}, headers=admin_headers)
+    assert len(whole.json()) == 3 and "x-sync-cursor" in whole.headers
+
+
+async def test_cached_holidays_carry_the_cursor_of_their_read(client, admin_headers, database, monkeypatch):
+    # No bus: another worker's write leaves this worker's cache stale until the TTL
+    monkeypatch.setattr(server, "repos", server.Repositories(cache_ttl=3600))
+    monkeypatch.setattr(server, "SYNC_OVERLAP", timedelta(0))
+    await client.post("/api/holidays", json={"date": "2025-01-26", "name": "Republic Day"}, headers=admin_headers)
+    await client.get("/api/holidays", headers=admin_headers)
+
+    await asyncio.sleep(0.01)
+    await database.holidays.insert_one({"id": "h2", "date": "2025-08-15", "name": "Independence Day",
+                                        "updated_at": datetime.now(timezone.utc)})
+    await asyncio.sleep(0.01)
+    stale = await client.get("/api/holidays", headers=admin_headers)
+    assert [h["name"] for h in stale.json()] == ["Republic Day"]
+
+    delta = await client.get("/api/holidays", params={"since": stale.headers["x-sync-cursor"]}, headers=admin_headers)
+    assert [h["name"] for h in delta.json()["changed"]] == ["Independence Day"]
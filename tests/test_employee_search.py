@@ -0,0 +1,65 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def hire(client, headers, name, email):
+    response = await client.post("/api/employees", headers=headers, json={
+        "name": name, "email": email, "department_id": "d1", "joining_date": "2024-01-01",
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+async def search(client, headers, q):
+    response = await client.get("/api/employees/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200
+    return [e["name"] for e in response.json()]
+
+
+async def test_search_ranks_exact_then_prefix_then_substring(client, admin_headers):
+    for i, name in enumerate(["Joanne", "Joe Annan", "Anna Smith", "Ann", "Bob"]):
+        await hire(client, admin_headers, name, f"staff{i}@corp.io")
+
+    assert await search(client, admin_headers, "ann") == ["Ann", "Anna Smith", "Joe Annan", "Joanne"]
+    assert await search(client, admin_headers, "nna") == ["Anna Smith", "Joe Annan"]
+    assert await search(client, admin_headers, "staff4") == ["Bob"]
+    assert await search(client, admin_headers, "xyz") == []
+
+
+async def test_index_follows_employee_writes(client, admin_headers):
+    await hire(client, admin_headers, "Ann", "ann@corp.io")
+    assert await search(client, admin_headers, "zed") == []
+
+    zed = await hire(client, admin_headers, "Zed", "zed@corp.io")
+    assert await search(client, admin_headers, "zed") == ["Zed"]
+
+    await client.put(f"/api/employees/{zed}", headers=admin_headers, json={"name": "Zack"})
+    assert await search(client, admin_headers, "zack") == ["Zack"]
+    assert await search(client, admin_headers, "zed") == ["Zack"]  # still matches the email
+
+    await client.delete(f"/api/employees/{zed}", headers=admin_headers)
+    assert await search(client, admin_headers, "za") == []
+
+
+async def test_writes_during_a_build_are_not_lost(database, monkeypatch):
+    await database.employees.insert_one({"id": "e1", "name": "Ann", "email": "ann@corp.io"})
+    index = server.EmployeeSearchIndex()
+    iter_all = server.repos.employees.iter_all
+    raced = []
+
+    async def racing(projection):
+        async for employee in iter_all(projection):
+            yield employee
+        if not raced:
+            # Hired after the build read its snapshot but before it finished
+            raced.append(True)
+            zed = {"id": "e2", "name": "Zed", "email": "zed@corp.io"}
+            await database.employees.insert_one(dict(zed))
+            index.add_if_built(zed)
+
+    monkeypatch.setattr(server.repos.employees, "iter_all", racing)
+    await index.ensure_built()
+    assert index.search("zed") == ["e2"]
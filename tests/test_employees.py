@@ -0,0 +1,74 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def hire(client, headers, name, manager=None):
+    response = await client.post("/api/employees", headers=headers, json={
+        "name": name, "email": f"{name.lower()}@example.com", "department_id": "d1",
+        "joining_date": "2024-01-01", "reporting_manager_id": manager,
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+async def chains(database):
+    return {doc["name"]: doc["ancestors"] async for doc in database.employees.find({})}
+
+
+async def test_moving_a_manager_re_roots_their_team(client, admin_headers, database):
+    ceo = await hire(client, admin_headers, "Ceo")
+    vp = await hire(client, admin_headers, "Vp", ceo)
+    lead = await hire(client, admin_headers, "Lead", ceo)
+    dev = await hire(client, admin_headers, "Dev", lead)
+    await hire(client, admin_headers, "Intern", dev)
+
+    response = await client.put(f"/api/employees/{lead}", headers=admin_headers, json={"reporting_manager_id": vp})
+    assert response.json()["ancestors"] == [ceo, vp]
+    assert await chains(database) == {
+        "Ceo": [], "Vp": [ceo], "Lead": [ceo, vp], "Dev": [ceo, vp, lead], "Intern": [ceo, vp, lead, dev],
+    }
+    tree = (await client.get(f"/api/employees/{vp}/org-tree", headers=admin_headers)).json()
+    assert tree["subordinates"][0]["subordinates"][0]["subordinates"][0]["name"] == "Intern"
+    headcount = (await client.get(f"/api/employees/{ceo}/headcount", headers=admin_headers)).json()
+    assert (headcount["direct_reports"], headcount["total_reports"]) == (1, 4)
+
+    cycle = await client.put(f"/api/employees/{lead}", headers=admin_headers, json={"reporting_manager_id": dev})
+    assert cycle.status_code == 400
+
+
+async def test_managers_see_their_teams_leave_requests(client, admin_headers, database):
+    lead = await hire(client, admin_headers, "Lead")
+    dev = await hire(client, admin_headers, "Dev", lead)
+    intern = await hire(client, admin_headers, "Intern", dev)
+    other = await hire(client, admin_headers, "Other")
+    for employee_id in (dev, intern, other):
+        await database.leave_requests.insert_one({
+            "id": f"r-{employee_id}", "employee_id": employee_id, "leave_type": "Annual", "reason": "Rest", "status": "pending",
+            "start_date": "2025-03-03", "end_date": "2025-03-03", "created_at": "2025-01-01T00:00:00+00:00",
+        })
+    response = await client.post("/api/auth/register", json={
+        "email": "lead@example.com", "password": "LeadPass123!", "full_name": "Lead", "role": "employee",
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    team = await client.get("/api/leave-requests", params={"manager_id": lead}, headers=headers)
+    assert sorted(r["employee_id"] for r in team.json()) == sorted([dev, intern])
+    assert (await client.get("/api/leave-requests", headers=headers)).json() == []
+    forbidden = await client.get("/api/leave-requests", params={"manager_id": other}, headers=headers)
+    assert forbidden.status_code == 403
+
+
+async def test_backfill_fills_in_missing_chains(database):
+    await database.employees.insert_many([
+        {"id": "a", "name": "A"},
+        {"id": "b", "name": "B", "reporting_manager_id": "a"},
+        {"id": "c", "name": "C", "reporting_manager_id": "b"},
+        {"id": "x", "name": "X", "reporting_manager_id": "y"},
+        {"id": "y", "name": "Y", "reporting_manager_id": "x"},
+    ])
+    assert await server.repos.employees.backfill_ancestors() == 5
+    assert await chains(database) == {"A": [], "B": ["a"], "C": ["a", "b"], "X": ["y"], "Y": ["x"]}
+    assert await server.repos.employees.backfill_ancestors() == 0
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def wait_for_job(job_id, status="succeeded"):
+    for _ in range(200):
+        job = await server.repos.jobs.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    pytest.fail(f"job {job_id} stuck in {job['status']}")
+
+
+@pytest.fixture
+async def queue(database, monkeypatch):
+    monkeypatch.setattr(server, "JOB_RETRY_DELAY", 0)
+    queue = server.JobQueue(workers=2, lease_seconds=1, poll_interval=0.01, max_attempts=2)
+    await queue.start()
+    yield queue
+    await queue.stop()
+
+
+async def test_leave_year_closing_runs_as_a_job(client, admin_headers, database):
+    await database.leave_policies.insert_one({"id": "p1", "name": "P", "leave_types": [{"type": "Casual Leave", "days": 12}]})
+    await database.employee_policy_assignments.insert_many(
+        [{"id": f"a{n}", "employee_id": f"e{n}", "leave_policy_id": "p1"} for n in range(3)])
+
+    response = await client.post("/api/leave-years/2025/close", headers=admin_headers)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    await wait_for_job(job_id)
+
+    job = (await client.get(f"/api/jobs/{job_id}", headers=admin_headers)).json()
+    assert (job["status"], job["done"], job["total"]) == ("succeeded", 3, 3)
+    assert job["result"] == {"year": 2025, "processed": 3}
+    assert await database.leave_balances.count_documents({"year": 2026}) == 3
+
+
+async def test_failed_job_is_retried(queue, monkeypatch):
+    calls = []
+
+    async def flaky(job):
+        calls.append(job.params["n"])
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return {"ok": True}
+
+    monkeypatch.setitem(server.JOB_HANDLERS, "flaky", flaky)
+    job = await queue.enqueue("flaky", {"n": 1})
+    assert (await queue.enqueue("flaky", {"n": 1}))["id"] == job["id"]  # Still queued: not queued twice
+
+    job = await wait_for_job(job["id"])
+    assert (job["attempts"], job["result"], job["error"]) == (2, {"ok": True}, None)
+
+
+async def test_expired_lease_resumes_from_checkpoint(queue, monkeypatch):
+    seen = []
+
+    async def resumable(job):
+        seen.append(job.checkpoint)
+        await job.save(checkpoint={"next": 4}, done=4)
+
+    monkeypatch.setitem(server.JOB_HANDLERS, "resumable", resumable)
+    # A job whose worker died mid-run: still "running", but the lease ran out
+    await server.repos.jobs.insert({
+        "id": "j1", "type": "resumable", "params": {}, "status": "running", "attempts": 1, "max_attempts": 2,
+        "done": 3, "total": 10, "checkpoint": {"next": 3}, "lease_owner": "dead-worker",
+        "lease_expires_at": "2000-01-01T00:00:00+00:00", "run_after": "2000-01-01T00:00:00+00:00",
+        "created_at": "2000-01-01T00:00:00+00:00", "updated_at": "2000-01-01T00:00:00+00:00",
+    })
+
+    job = await wait_for_job("j1")
+    assert seen == [{"next": 3}]
+    assert (job["attempts"], job["done"], job["checkpoint"]) == (2, 4, {"next": 4})
+
+
+async def test_racing_enqueues_share_one_job(database, monkeypatch):
+    await server.ensure_indexes()
+    queue = server.JobQueue(workers=0)
+    first = await queue.enqueue("close_leave_year", {"year": 2025})
+
+    # The second request checked for an active job before the first one inserted
+    active = server.repos.jobs.active
+    checks = []
+
+    async def stale_check(*args):
+        checks.append(args)
+        return None if len(checks) == 1 else await active(*args)
+
+    monkeypatch.setattr(server.repos.jobs, "active", stale_check)
+    second = await queue.enqueue("close_leave_year", {"year": 2025})
+    assert second["id"] == first["id"]
+    assert await database.jobs.count_documents({"type": "close_leave_year"}) == 1
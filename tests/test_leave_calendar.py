@@ -0,0 +1,81 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed(database):
+    await database.employees.insert_many([
+        {"id": "m1", "name": "Manager", "email": "manager@example.com", "department_id": "d1"},
+        {"id": "e1", "name": "Asha", "email": "asha@example.com", "department_id": "d1", "reporting_manager_id": "m1",
+         "ancestors": ["m1"]},
+        {"id": "e2", "name": "Bo", "email": "bo@example.com", "department_id": "d2", "reporting_manager_id": "m1",
+         "ancestors": ["m1"]},
+        {"id": "e3", "name": "Cy", "email": "cy@example.com", "department_id": "d2"},
+    ])
+    await database.holidays.insert_one({"id": "h1", "date": "2025-01-14", "name": "Pongal"})
+    await database.leave_requests.insert_many([
+        {"id": "r1", "employee_id": "e1", "leave_type": "Casual Leave", "status": "approved",
+         "start_date": "2025-01-09", "end_date": "2025-01-15", "created_at": "2025-01-01T00:00:00+00:00"},
+        {"id": "r2", "employee_id": "e2", "leave_type": "Sick Leave", "status": "pending",
+         "start_date": "2025-01-10", "end_date": "2025-01-10", "created_at": "2025-01-01T00:00:00+00:00"},
+        {"id": "r3", "employee_id": "e3", "leave_type": "Sick Leave", "status": "rejected",
+         "start_date": "2025-01-10", "end_date": "2025-01-10", "created_at": "2025-01-01T00:00:00+00:00"},
+        {"id": "r4", "employee_id": "e3", "leave_type": "Casual Leave", "status": "approved",
+         "start_date": "2025-01-20", "end_date": "2025-01-21", "created_at": "2025-01-01T00:00:00+00:00"},
+    ])
+
+
+def absent(day):
+    return [(a["employee_name"], a["status"]) for a in day["absences"]]
+
+
+async def test_calendar_sweeps_requests_over_the_window(client, admin_headers, database):
+    await seed(database)
+    response = await client.get("/api/leave-calendar", params={"from": "2025-01-10", "to": "2025-01-15"},
+                                headers=admin_headers)
+    assert response.status_code == 200
+    days = {day["date"]: day for day in response.json()}
+    assert list(days) == [f"2025-01-{d}" for d in range(10, 16)]
+    assert absent(days["2025-01-10"]) == [("Asha", "approved"), ("Bo", "pending")]
+    assert days["2025-01-11"]["weekend"] and absent(days["2025-01-11"]) == []
+    assert absent(days["2025-01-13"]) == [("Asha", "approved")]
+    assert days["2025-01-14"]["holiday"] == "Pongal" and absent(days["2025-01-14"]) == []
+    assert absent(days["2025-01-15"]) == [("Asha", "approved")]
+
+
+async def test_calendar_filters_by_department_and_manager(client, admin_headers, database):
+    await seed(database)
+    window = {"from": "2025-01-10", "to": "2025-01-10"}
+    response = await client.get("/api/leave-calendar", params={**window, "department_id": "d2"}, headers=admin_headers)
+    assert absent(response.json()[0]) == [("Bo", "pending")]
+    response = await client.get("/api/leave-calendar", params={**window, "manager_id": "m1"}, headers=admin_headers)
+    assert absent(response.json()[0]) == [("Asha", "approved"), ("Bo", "pending")]
+
+    # manager_id covers the whole team under the manager, as it does on the leave queue
+    await database.employees.insert_one({"id": "e4", "name": "Dev", "email": "dev@example.com",
+                                         "reporting_manager_id": "e1", "ancestors": ["m1", "e1"]})
+    await database.leave_requests.insert_one({
+        "id": "r5", "employee_id": "e4", "leave_type": "Casual Leave", "status": "approved",
+        "start_date": "2025-01-10", "end_date": "2025-01-10", "created_at": "2025-01-01T00:00:00+00:00"})
+    response = await client.get("/api/leave-calendar", params={**window, "manager_id": "m1"}, headers=admin_headers)
+    assert [name for name, _ in absent(response.json()[0])] == ["Asha", "Bo", "Dev"]
+    response = await client.get("/api/leave-calendar", params={**window, "manager_id": "e1"}, headers=admin_headers)
+    assert absent(response.json()[0]) == [("Dev", "approved")]
+
+
+async def test_calendar_rejects_long_windows(client, admin_headers):
+    response = await client.get("/api/leave-calendar", params={"from": "2025-01-01", "to": "2025-06-30"},
+                                headers=admin_headers)
+    assert response.status_code == 400
+
+
+async def test_calendar_skips_requests_that_end_before_they_start(client, admin_headers, database):
+    await seed(database)
+    await database.leave_requests.insert_one({
+        "id": "r6", "employee_id": "e2", "leave_type": "Casual Leave", "status": "approved",
+        "start_date": "2025-01-13", "end_date": "2025-01-11", "created_at": "2025-01-01T00:00:00+00:00"})
+    response = await client.get("/api/leave-calendar", params={"from": "2025-01-10", "to": "2025-01-15"},
+                                headers=admin_headers)
+    assert response.status_code == 200
+    days = {day["date"]: day for day in response.json()}
+    assert absent(days["2025-01-13"]) == [("Asha", "approved")]
@@ -0,0 +1,134 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def requests(database):
+    for i, status in enumerate(["pending", "pending", "approved"]):
+        await database.leave_requests.insert_one({
+            "id": f"r{i}", "employee_id": "e1", "leave_type": "Annual",
+            "start_date": "2025-03-03", "end_date": "2025-03-04", "status": status,
+        })
+
+
+async def test_bulk_update_reports_an_outcome_per_id(client, admin_headers, database, requests):
+    response = await client.patch("/api/leave-requests/bulk", headers=admin_headers,
+                                  json={"ids": ["r0", "r2", "missing"], "status": "approved"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["updated"] == 1
+    assert [(r["id"], r["outcome"]) for r in body["results"]] == [
+        ("r0", "updated"), ("r2", "unchanged"), ("missing", "not_found"),
+    ]
+    assert (await database.leave_requests.find_one({"id": "r1"}))["status"] == "pending"
+
+
+async def test_bulk_update_with_mixed_statuses(client, admin_headers, database, requests):
+    response = await client.patch("/api/leave-requests/bulk", headers=admin_headers, json={"updates": [
+        {"id": "r0", "status": "approved"}, {"id": "r1", "status": "rejected"}, {"id": "r2", "status": "rejected"},
+    ]})
+    assert response.json()["updated"] == 3
+    statuses = {doc["id"]: doc["status"] async for doc in database.leave_requests.find({})}
+    assert statuses == {"r0": "approved", "r1": "rejected", "r2": "rejected"}
+
+
+async def test_bulk_update_needs_exactly_one_form(client, admin_headers, requests):
+    missing_status = await client.patch("/api/leave-requests/bulk", headers=admin_headers, json={"ids": ["r0"]})
+    both = await client.patch("/api/leave-requests/bulk", headers=admin_headers, json={
+        "ids": ["r0"], "status": "approved", "updates": [{"id": "r1", "status": "approved"}],
+    })
+    assert missing_status.status_code == both.status_code == 400
+
+
+@pytest.fixture
+async def queue(database):
+    await database.employees.insert_many([
+        {"id": "e1", "name": "Asha", "department_id": "eng"},
+        {"id": "e2", "name": "Ravi", "department_id": "eng"},
+        {"id": "e3", "name": "Meera", "department_id": "ops"},
+    ])
+    rows = [
+        ("q0", "e1", "Annual", "pending", "2025-03-03", "2025-03-04"),
+        ("q1", "e2", "Sick", "pending", "2025-03-10", "2025-03-10"),
+        ("q2", "e3", "Annual", "pending", "2025-03-28", "2025-04-02"),
+        ("q3", "e1", "Annual", "approved", "2025-04-07", "2025-04-08"),
+        ("q4", "e3", "Sick", "rejected", "2025-02-20", "2025-02-21"),
+    ]
+    await database.leave_requests.insert_many([
+        {"id": rid, "employee_id": emp, "leave_type": kind, "reason": "Rest", "status": status,
+         "start_date": start, "end_date": end, "created_at": f"2025-01-0{i + 1}T00:00:00+00:00"}
+        for i, (rid, emp, kind, status, start, end) in enumerate(rows)
+    ])
+
+
+async def queue_ids(client, headers, **params):
+    response = await client.get("/api/leave-requests", params=params, headers=headers)
+    assert response.status_code == 200
+    return [r["id"] for r in response.json()]
+
+
+async def test_queue_filters_combine_and_sort_newest_first(client, admin_headers, queue):
+    assert await queue_ids(client, admin_headers) == ["q4", "q3", "q2", "q1", "q0"]
+    assert await queue_ids(client, admin_headers, status="pending") == ["q2", "q1", "q0"]
+    assert await queue_ids(client, admin_headers, status="pending", department_id="eng") == ["q1", "q0"]
+    assert await queue_ids(client, admin_headers, department_id="eng", employee_id="e3") == []
+    assert await queue_ids(client, admin_headers, employee_id="e1", leave_type="Annual") == ["q3", "q0"]
+    # Overlapping the window: q2 starts before the end of March and runs into April
+    assert await queue_ids(client, admin_headers, **{"from": "2025-03-05", "to": "2025-03-31"}) == ["q2", "q1"]
+
+
+async def test_queue_pages_with_skip_and_limit(client, admin_headers, queue):
+    assert await queue_ids(client, admin_headers, limit=2) == ["q4", "q3"]
+    assert await queue_ids(client, admin_headers, skip=2, limit=2) == ["q2", "q1"]
+    assert await queue_ids(client, admin_headers, skip=4, limit=2) == ["q0"]
+    assert await queue_ids(client, admin_headers, status="pending", skip=1, limit=1) == ["q1"]
+    too_big = await client.get("/api/leave-requests", params={"limit": 5000}, headers=admin_headers)
+    assert too_big.status_code == 422
+
+
+async def test_bulk_update_reports_requests_decided_underneath(client, admin_headers, database, requests, monkeypatch):
+    statuses = server.repos.leave_requests.statuses
+
+    async def read_then_race(request_ids):
+        current = await statuses(request_ids)
+        # Another approver rejects r0 between this read and the write
+        await database.leave_requests.update_one({"id": "r0"}, {"$set": {"status": "rejected"}})
+        return current
+
+    monkeypatch.setattr(server.repos.leave_requests, "statuses", read_then_race)
+    response = await client.patch("/api/leave-requests/bulk", headers=admin_headers,
+                                  json={"ids": ["r0", "r1"], "status": "approved"})
+    body = response.json()
+    assert body["updated"] == 1
+    assert [(r["id"], r["outcome"], r["status"]) for r in body["results"]] == [
+        ("r0", "conflict", "rejected"), ("r1", "updated", "approved"),
+    ]
+    assert (await database.leave_requests.find_one({"id": "r0"}))["status"] == "rejected"
+
+
+async def test_bulk_update_loses_to_an_approver_setting_the_same_status(client, admin_headers, database, requests,
+                                                                        monkeypatch):
+    statuses = server.repos.leave_requests.statuses
+    refreshed = []
+
+    async def read_then_race(request_ids):
+        current = await statuses(request_ids)
+        await database.leave_requests.update_one({"id": "r0"}, {"$set": {"status": "approved"}})
+        return current
+
+    async def refresh(changed):
+        refreshed.extend(req["id"] for req in changed)
+
+    monkeypatch.setattr(server.repos.leave_requests, "statuses", read_then_race)
+    monkeypatch.setattr(server, "refresh_leave_openings", refresh)
+    response = await client.patch("/api/leave-requests/bulk", headers=admin_headers,
+                                  json={"ids": ["r0", "r1"], "status": "approved"})
+    body = response.json()
+    assert body["updated"] == 1
+    assert [(r["id"], r["outcome"], r["status"]) for r in body["results"]] == [
+        ("r0", "conflict", "approved"), ("r1", "updated", "approved"),
+    ]
+    assert refreshed == ["r1"]
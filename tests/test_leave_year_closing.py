@@ -0,0 +1,86 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed(database):
+    await database.leave_policies.insert_one({"id": "p1", "name": "Standard", "leave_types": [
+        {"type": "Casual Leave", "days": 12, "carry_forward_cap": 5},
+        {"type": "Sick Leave", "days": 10},
+    ]})
+    for n in range(5):
+        await database.employee_policy_assignments.insert_one(
+            {"id": f"a{n}", "employee_id": f"e{n}", "leave_policy_id": "p1"})
+    await database.leave_balances.insert_one(
+        {"id": "b1", "employee_id": "e0", "year": 2025, "leave_type": "Casual Leave", "carried_forward_days": 3})
+    await database.leave_requests.insert_many([
+        {"id": "r1", "employee_id": "e0", "leave_type": "Casual Leave", "status": "approved",
+         "start_date": "2025-03-03", "end_date": "2025-03-07"},
+        {"id": "r2", "employee_id": "e1", "leave_type": "Casual Leave", "status": "approved",
+         "start_date": "2025-06-02", "end_date": "2025-06-11"},
+        {"id": "r3", "employee_id": "e1", "leave_type": "Casual Leave", "status": "pending",
+         "start_date": "2025-07-01", "end_date": "2025-07-01"},
+        {"id": "r4", "employee_id": "e2", "leave_type": "Casual Leave", "status": "approved",
+         "start_date": "2024-12-30", "end_date": "2024-12-31"},
+    ])
+
+
+async def openings(database):
+    docs = await database.leave_balances.find({"year": 2026}, {"_id": 0}).to_list(None)
+    return {(d["employee_id"], d["leave_type"]): (d["closing_days"], d["carried_forward_days"]) for d in docs}
+
+
+async def test_closing_caps_carry_forward(database):
+    await seed(database)
+    state = await server.close_leave_year(2025, batch_size=2)
+    assert (state["status"], state["processed"]) == ("completed", 5)
+
+    result = await openings(database)
+    assert result[("e0", "Casual Leave")] == (10, 5)   # 12 + 3 carried - 5 used, capped at 5
+    assert result[("e1", "Casual Leave")] == (2, 2)    # pending leave doesn't count
+    assert result[("e2", "Casual Leave")] == (12, 5)   # last year's leave belongs to last year
+    assert result[("e0", "Sick Leave")] == (10, 0)     # no cap, nothing carried
+    assert len(result) == 10
+
+
+async def test_closing_resumes_from_checkpoint_and_is_idempotent(database):
+    await seed(database)
+    await server.repos.leave_year_closings.start(2025)
+    await server.repos.leave_year_closings.checkpoint(2025, "e2", 3)
+
+    state = await server.close_leave_year(2025, batch_size=2)
+    assert state["processed"] == 5
+    assert {employee for employee, _ in await openings(database)} == {"e3", "e4"}
+
+    await server.close_leave_year(2025, restart=True)
+    await server.close_leave_year(2025, restart=True)
+    assert len(await openings(database)) == 10
+    assert await database.leave_balances.count_documents({"year": 2026}) == 10
+
+
+async def test_late_approval_rewrites_closed_openings(client, admin_headers, database):
+    await seed(database)
+    await server.close_leave_year(2025)
+    await server.close_leave_year(2026)
+    await database.leave_requests.insert_one(
+        {"id": "r5", "employee_id": "e1", "leave_type": "Casual Leave", "status": "pending",
+         "start_date": "2025-09-01", "end_date": "2025-09-01"})
+    await database.leave_requests.update_many({}, {"$set": {"reason": "Rest"}})
+
+    # e1: 12 - 10 approved = 2 carried into 2026; approving one more day leaves 1
+    response = await client.patch("/api/leave-requests/r3", headers=admin_headers, json={"status": "approved"})
+    assert response.status_code == 200
+    assert (await openings(database))[("e1", "Casual Leave")] == (1, 1)
+    # 2026's closing carried that balance into 2027: 12 + 1
+    opening_2027 = await database.leave_balances.find_one({"employee_id": "e1", "year": 2027, "leave_type": "Casual Leave"})
+    assert opening_2027["closing_days"] == 13
+
+    # Reverting the original approval in bulk puts ten days back, capped at 5
+    response = await client.patch("/api/leave-requests/bulk", headers=admin_headers,
+                                  json={"updates": [{"id": "r2", "status": "rejected"}, {"id": "r5", "status": "rejected"}]})
+    assert response.json()["updated"] == 2
+    assert (await openings(database))[("e1", "Casual Leave")] == (11, 5)
+    assert (await database.leave_balances.find_one(
+        {"employee_id": "e1", "year": 2027, "leave_type": "Casual Leave"}))["closing_days"] == 17
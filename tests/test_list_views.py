@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+SALARY_TYPES = [{"type": "Basic Salary", "amount": 1000.0, "category": "earnings"}]
+
+
+@pytest.fixture
+async def staff(database):
+    await database.employees.insert_one({
+        "id": "e1", "employee_id": "EMP001", "name": "Asha", "email": "asha@example.com",
+        "department_id": "d1", "department": None, "joining_date": "2024-01-01", "reporting_manager_id": None,
+        "ancestors": [], "invited": False, "user_id": None, "created_at": "2024-01-01T00:00:00+00:00",
+    })
+    await database.payslips.insert_one({
+        "id": "p1", "employee_id": "e1", "month": datetime.now(timezone.utc).strftime("%Y-%m"),
+        "basic_salary": 1000.0, "allowances": 0.0, "deductions": 0.0, "net_pay": 1000.0,
+        "salary_types": SALARY_TYPES, "generated_at": "2025-01-31T00:00:00+00:00",
+    })
+
+
+async def get(client, headers, path, **params):
+    response = await client.get(path, params=params, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_employee_summary_holds_only_summary_columns(client, admin_headers, staff):
+    [row] = await get(client, admin_headers, "/api/employees", view="summary")
+    assert row == {
+        "id": "e1", "employee_id": "EMP001", "name": "Asha", "email": "asha@example.com", "department_id": "d1",
+    }
+    [row] = await get(client, admin_headers, "/api/employees", fields="name,joining_date")
+    assert row == {"id": "e1", "name": "Asha", "joining_date": "2024-01-01"}
+
+    [full] = await get(client, admin_headers, "/api/employees")
+    assert {"joining_date", "ancestors", "invited", "created_at"} <= set(full)
+
+
+async def test_payslip_summary_drops_the_breakdown(client, admin_headers, staff):
+    [row] = await get(client, admin_headers, "/api/payslips", view="summary")
+    assert set(row) == {
+        "id", "employee_id", "month", "basic_salary", "allowances", "deductions", "net_pay", "generated_at",
+    }
+    [row] = await get(client, admin_headers, "/api/payslips", fields="net_pay")
+    assert row == {"id": "p1", "net_pay": 1000.0}
+
+    [full] = await get(client, admin_headers, "/api/payslips")
+    assert full["salary_types"] == SALARY_TYPES
+    assert (full["employee_snapshot"], full["print_format_id"]) == (None, None)
+
+
+async def test_unknown_fields_are_rejected(client, admin_headers, staff):
+    response = await client.get("/api/employees", params={"fields": "name,salary"}, headers=admin_headers)
+    assert response.status_code == 400
@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metrics_label_requests_by_route_template(client, admin_headers):
+    for employee_id in ("raw-id-1", "raw-id-2"):
+        response = await client.get(f"/api/employees/{employee_id}", headers=admin_headers)
+        assert response.status_code == 404
+    await client.get("/api/no-such-route/raw-id-3")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    route = 'method="GET",route="/api/employees/{employee_id}"'
+    buckets = [line for line in body.splitlines() if line.startswith("http_request_duration_seconds_bucket{")]
+    assert any('route="/api/employees/{employee_id}"' in line for line in buckets)
+    assert f"http_request_duration_seconds_count{{{route}}}" in body
+    assert f'http_requests_total{{{route},status="404"}}' in body
+    assert f"http_requests_in_flight{{{route}}} 0.0" in body
+    assert 'route="unmatched"' in body
+    assert "raw-id" not in body
+
+
+def test_db_stats_keep_every_command_recorded_from_threads():
+    stats = server.DBRequestStats()
+
+    def record_many():
+        for _ in range(10000):
+            stats.record(0.001)
+
+    threads = [threading.Thread(target=record_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.queries == 80000
+    assert stats.seconds == pytest.approx(80.0)
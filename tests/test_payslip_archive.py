@@ -0,0 +1,71 @@
+import csv
+import io
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SALARY_TYPES = [{"type": "Basic Salary", "amount": 1000.0, "category": "earnings"}]
+
+
+def payslip(payslip_id, employee_id, month):
+    return {"id": payslip_id, "employee_id": employee_id, "month": month, "basic_salary": 1000.0,
+            "allowances": 0.0, "deductions": 0.0, "net_pay": 1000.0, "salary_types": SALARY_TYPES,
+            "generated_at": f"{month}-28T00:00:00+00:00"}
+
+
+@pytest.fixture
+async def history(database):
+    recent = server.payslip_hot_cutoff()
+    await database.departments.insert_one({"id": "d1", "name": "Operations"})
+    await database.employees.insert_many([
+        {"id": "e1", "employee_id": "EMP001", "name": "Asha", "email": "asha@example.com", "department_id": "d1"},
+        {"id": "e2", "employee_id": "EMP002", "name": "Bo", "email": "bo@example.com", "department_id": "d1"},
+    ])
+    await database.payslips.insert_many([
+        payslip("p1", "e1", "2019-01"), payslip("p2", "e1", "2019-02"),
+        payslip("p3", "e2", "2019-01"), payslip("p4", "e1", recent),
+    ])
+    return recent
+
+
+async def test_archiving_buckets_old_payslips_and_reads_merge_on_request(client, admin_headers, database, history):
+    assert await server.archive_payslips(history, batch_size=2) == 3
+    assert [p["id"] async for p in database.payslips.find({})] == ["p4"]
+    bucket = await database.payslip_archive.find_one({"employee_id": "e1", "year": 2019})
+    assert [p["month"] for p in bucket["payslips"]] == ["2019-01", "2019-02"]
+    assert "employee_id" not in bucket["payslips"][0]
+
+    recent = await client.get("/api/payslips", headers=admin_headers)
+    assert [p["id"] for p in recent.json()] == ["p4"]
+    everything = await client.get("/api/payslips/employee/e1", params={"from": "2019-01"}, headers=admin_headers)
+    assert [(p["id"], p["employee_id"]) for p in everything.json()] == [("p4", "e1"), ("p2", "e1"), ("p1", "e1")]
+    window = await client.get("/api/payslips", params={"from": "2019-02", "to": "2019-12", "view": "summary"},
+                              headers=admin_headers)
+    assert [p["id"] for p in window.json()] == ["p2"]
+
+    assert (await client.delete("/api/payslips/p2", headers=admin_headers)).status_code == 200
+    assert (await client.delete("/api/payslips/p2", headers=admin_headers)).status_code == 404
+
+
+async def test_archiving_again_after_an_interruption_changes_nothing(database, history):
+    batch = await server.repos.payslips.before(history, 10)
+    await server.repos.payslip_archive.archive(batch)  # Copied, then interrupted before the delete
+    await server.archive_payslips(history)
+    buckets = await database.payslip_archive.find({}, {"_id": 0}).to_list(None)
+    assert sorted(len(b["payslips"]) for b in buckets) == [1, 2]
+
+
+async def test_register_merges_archived_and_hot_payslips_of_a_month(client, admin_headers, database, history):
+    await server.repos.payslip_archive.archive([payslip("p1", "e1", "2019-01")])
+    await database.payslips.delete_one({"id": "p1"})
+    response = await client.get("/api/reports/payroll-register", params={"month": "2019-01"}, headers=admin_headers)
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert [row[:3] for row in rows[1:]] == [
+        ["Operations", "EMP001", "Asha"],
+        ["Operations", "EMP002", "Bo"],
+        ["Operations", "", "Subtotal (2 employees)"],
+        ["Total", "", "2 employees"],
+    ]
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+SALARY_TYPES = [{"type": "Basic Salary", "amount": 1000.0, "category": "earnings"}]
+
+
+@pytest.fixture
+async def payee(database):
+    await database.employees.insert_one({"id": "e1", "employee_id": "EMP001", "name": "Asha", "email": "a@example.com"})
+    await database.payroll_structures.insert_one({"id": "s1", "name": "S", "salary_types": SALARY_TYPES})
+    await database.payroll.insert_one({"id": "p1", "employee_id": "e1", "payroll_structure_id": "s1"})
+    return {"employee_id": "e1", "month": "2025-01"}
+
+
+async def test_concurrent_generation_creates_one_payslip(client, admin_headers, database, payee):
+    responses = await asyncio.gather(*[
+        client.post("/api/payslips/generate", json=payee, headers=admin_headers) for _ in range(5)
+    ])
+    assert sorted(r.status_code for r in responses) == [200, 400, 400, 400, 400]
+    assert await database.payslips.count_documents({"employee_id": "e1", "month": "2025-01"}) == 1
+
+
+async def test_idempotency_key_replays_the_first_response(client, admin_headers, database, payee):
+    headers = {**admin_headers, "Idempotency-Key": "generate-e1-2025-01"}
+    first = await client.post("/api/payslips/generate", json=payee, headers=headers)
+    retry = await client.post("/api/payslips/generate", json=payee, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers["idempotent-replayed"] == "true"
+
+    other_month = await client.post("/api/payslips/generate", json={**payee, "month": "2025-02"}, headers=headers)
+    assert other_month.status_code == 422
+
+
+async def test_failed_request_frees_its_idempotency_key(client, admin_headers, database, payee):
+    headers = {**admin_headers, "Idempotency-Key": "k1"}
+    await database.payroll.delete_many({})
+    assert (await client.post("/api/payslips/generate", json=payee, headers=headers)).status_code == 404
+
+    await database.payroll.insert_one({"id": "p1", "employee_id": "e1", "payroll_structure_id": "s1"})
+    assert (await client.post("/api/payslips/generate", json=payee, headers=headers)).status_code == 200
+
+
+async def test_download_renders_the_snapshot_taken_at_generation(client, admin_headers, database, payee):
+    await database.departments.insert_one({"id": "d1", "name": "Operations"})
+    await database.employees.update_one({"id": "e1"}, {"$set": {"department_id": "d1"}})
+    payslip = (await client.post("/api/payslips/generate", json=payee, headers=admin_headers)).json()
+    assert payslip["employee_snapshot"] == {
+        "name": "Asha", "employee_id": "EMP001", "email": "a@example.com", "department": "Operations",
+    }
+
+    await database.employees.update_one({"id": "e1"}, {"$set": {"name": "Asha Rao", "department_id": None}})
+    response = await client.get(f"/api/payslips/{payslip['id']}/download", headers=admin_headers)
+    assert "Asha" in response.text and "Asha Rao" not in response.text
+    # Authentication and the payslip; no employee, department, payroll or structure reads
+    assert response.headers["x-db-queries"] == "2"
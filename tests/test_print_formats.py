@@ -0,0 +1,43 @@
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def create(client, headers, template_html):
+    return await client.post("/api/print-formats", json={"name": "F", "template_html": template_html}, headers=headers)
+
+
+async def test_runaway_template_is_stopped(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(server, "TEMPLATE_RENDER_TIMEOUT", 0.2)
+    started = time.monotonic()
+    response = await create(client, admin_headers,
+                            "{% for i in range(100000) %}{% for j in range(100000) %}{% endfor %}{% endfor %}")
+    assert response.status_code == 400
+    assert "longer than" in response.json()["detail"]
+    assert time.monotonic() - started < 2
+
+
+@pytest.mark.parametrize("template_html", [
+    '{{ "x" * 100000000 }}',
+    "{% for i in range(100000) %}{{ 'x' * 100 }}{% endfor %}",
+    "{{ 7 ** 10000000 }}",
+    "{{ ''.__class__.__mro__[1].__subclasses__() }}",
+])
+async def test_oversized_or_unsafe_templates_are_rejected(client, admin_headers, template_html):
+    response = await create(client, admin_headers, template_html)
+    assert response.status_code == 400
+
+
+async def test_render_time_is_recorded_per_format(client, admin_headers):
+    response = await create(client, admin_headers, "<h1>{{ employee_name }}</h1>{% for s in salary_types %}{{ s.type }}{% endfor %}")
+    format_id = response.json()["id"]
+
+    preview = await client.post(f"/api/print-formats/{format_id}/preview", headers=admin_headers)
+    assert preview.status_code == 200
+    assert preview.text.startswith("<h1>John Doe</h1>Basic Salary")
+    assert REGISTRY.get_sample_value("print_format_render_duration_seconds_count", {"format_id": format_id}) == 1
@@ -0,0 +1,107 @@
+import uuid
+
+import pytest
+
+from tests.db_queries import assert_query_count_constant
+
+pytestmark = pytest.mark.anyio
+
+
+def new_id():
+    return str(uuid.uuid4())
+
+
+async def insert_employee(database, **fields):
+    employee = {
+        "id": new_id(),
+        "employee_id": f"EMP{uuid.uuid4().hex[:8].upper()}",
+        "name": "Employee",
+        "email": f"{uuid.uuid4().hex[:10]}@example.com",
+        "joining_date": "2024-01-01",
+        "invited": False,
+        "created_at": "2024-01-01T00:00:00+00:00",
+        **fields,
+    }
+    await database.employees.insert_one(employee)
+    return employee
+
+
+async def test_departments_with_count(client, admin_headers, database):
+    async def grow(size):
+        while await database.departments.count_documents({}) < size:
+            department = {"id": new_id(), "name": "Dept", "created_at": "2024-01-01T00:00:00+00:00"}
+            await database.departments.insert_one(department)
+            await insert_employee(database, department_id=department["id"])
+
+    await assert_query_count_constant(client, "GET", "/api/departments-with-count", grow, headers=admin_headers)
+
+
+async def test_payroll_structures(client, admin_headers, database):
+    async def grow(size):
+        while await database.payroll_structures.count_documents({}) < size:
+            structure = {"id": new_id(), "name": "S", "salary_types": [], "net_salary": 0.0,
+                         "created_at": "2024-01-01T00:00:00+00:00"}
+            await database.payroll_structures.insert_one(structure)
+            employee = await insert_employee(database)
+            await database.payroll.insert_one({"id": new_id(), "employee_id": employee["id"],
+                                               "payroll_structure_id": structure["id"]})
+
+    await assert_query_count_constant(client, "GET", "/api/payroll-structures", grow, headers=admin_headers)
+
+
+async def test_employee_policy_assignments(client, admin_headers, database):
+    async def grow(size):
+        while await database.employee_policy_assignments.count_documents({}) < size:
+            policy = {"id": new_id(), "name": "P", "leave_types": [{"type": "Casual Leave", "days": 12}],
+                      "created_at": "2024-01-01T00:00:00+00:00"}
+            await database.leave_policies.insert_one(policy)
+            employee = await insert_employee(database)
+            await database.employee_policy_assignments.insert_one({
+                "id": new_id(), "employee_id": employee["id"], "leave_policy_id": policy["id"],
+                "created_at": "2024-01-01T00:00:00+00:00",
+            })
+
+    await assert_query_count_constant(client, "GET", "/api/employee-policy-assignments", grow,
+                                      headers=admin_headers)
+
+
+async def test_org_tree_scales_with_depth_not_headcount(client, admin_headers, database):
+    root = await insert_employee(database, name="Root")
+    middle = await insert_employee(database, name="Middle", reporting_manager_id=root["id"], ancestors=[root["id"]])
+
+    async def grow(size):
+        while await database.employees.count_documents({"reporting_manager_id": middle["id"]}) < size:
+            await insert_employee(database, reporting_manager_id=middle["id"], ancestors=[root["id"], middle["id"]])
+
+    await assert_query_count_constant(client, "GET", f"/api/employees/{root['id']}/org-tree", grow,
+                                      headers=admin_headers)
+
+
+async def test_download_payslip(client, admin_headers, database):
+    employee = await insert_employee(database, name="Payee")
+    payslip_id = new_id()
+    await database.payslips.insert_one({
+        "id": payslip_id, "employee_id": employee["id"], "month": "2025-01",
+        "basic_salary": 1000.0, "allowances": 0.0, "deductions": 0.0, "net_pay": 1000.0,
+        "salary_types": [], "generated_at": "2025-01-31T00:00:00+00:00",
+    })
+
+    async def grow(size):
+        while await database.payslips.count_documents({}) < size:
+            other = await insert_employee(database)
+            await database.payslips.insert_one({
+                "id": new_id(), "employee_id": other["id"], "month": "2025-01",
+                "basic_salary": 1.0, "allowances": 0.0, "deductions": 0.0, "net_pay": 1.0,
+                "salary_types": [], "generated_at": "2025-01-31T00:00:00+00:00",
+            })
+
+    await assert_query_count_constant(client, "GET", f"/api/payslips/{payslip_id}/download", grow,
+                                      headers=admin_headers)
+
+
+async def test_query_count_headers(client, admin_headers):
+    response = await client.get("/api/departments", headers=admin_headers)
+    assert response.status_code == 200
+    # Users lookup for authentication, the cache_versions lookup for the ETag, the departments query
+    assert response.headers["x-db-queries"] == "3"
+    assert response.headers["server-timing"].startswith("db;dur=")
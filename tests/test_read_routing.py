@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_endpoint_entries_override_route_classes():
+    routing = server.ReadRouting("listing=nearest:120,list_payslips=primary")
+    assert routing.for_endpoint("list_employees").mongos_mode == "nearest"
+    assert routing.for_endpoint("list_employees").max_staleness == 120
+    assert routing.for_endpoint("list_payslips").mongos_mode == "primary"
+    assert routing.for_endpoint("create_leave_request") is None
+
+
+@pytest.mark.parametrize("spec", ["listing=fastest", "listing=secondary:30"])
+def test_invalid_routing_is_rejected(spec):
+    with pytest.raises(ValueError):
+        server.ReadRouting(spec)
+
+
+async def test_listing_reads_go_to_secondaries(client, admin_headers, database):
+    database.read_preferences.clear()
+    response = await client.get("/api/employees", headers=admin_headers)
+    assert response.status_code == 200
+    assert [(name, pref.mongos_mode) for name, pref in database.read_preferences] == [
+        ("employees", "secondaryPreferred"),
+    ]
+
+
+async def test_writer_reads_own_writes_from_primary(client, admin_headers, database):
+    response = await client.post("/api/departments", json={"name": "Ops"}, headers=admin_headers)
+    assert response.status_code == 200
+
+    database.read_preferences.clear()
+    response = await client.get("/api/employees", headers=admin_headers)
+    assert response.status_code == 200
+    assert database.read_preferences == []
+
+
+async def test_write_stamp_is_refreshed_once_per_window(client, admin_headers, database):
+    await client.post("/api/departments", json={"name": "Ops"}, headers=admin_headers)
+    stamp = (await database.users.find_one({"email": "admin@example.com"}))["last_write_at"]
+    await client.post("/api/departments", json={"name": "Sales"}, headers=admin_headers)
+    assert (await database.users.find_one({"email": "admin@example.com"}))["last_write_at"] == stamp
+
+    # A stamp a window old is refreshed by the next write, and still pins reads until then
+    window = server.read_your_writes_window()
+    old = (datetime.now(timezone.utc) - window - timedelta(seconds=5)).isoformat()
+    await database.users.update_one({"email": "admin@example.com"}, {"$set": {"last_write_at": old}})
+    database.read_preferences.clear()
+    await client.get("/api/employees", headers=admin_headers)
+    assert database.read_preferences == []
+
+    await client.post("/api/departments", json={"name": "Legal"}, headers=admin_headers)
+    assert (await database.users.find_one({"email": "admin@example.com"}))["last_write_at"] > old
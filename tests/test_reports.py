@@ -0,0 +1,66 @@
+import csv
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_month(database):
+    await database.departments.insert_many([{"id": "d1", "name": "Operations"}, {"id": "d2", "name": "Engineering"}])
+    await database.employees.insert_many([
+        {"id": "e1", "employee_id": "EMP001", "name": "Asha", "department_id": "d1"},
+        {"id": "e2", "employee_id": "EMP002", "name": "Bo", "department_id": "d2"},
+        {"id": "e3", "employee_id": "EMP003", "name": "Cy", "department_id": "d2"},
+    ])
+    salary_types = [
+        {"type": "Basic Salary", "amount": 1000.0, "category": "earnings"},
+        {"type": "HRA", "amount": 400.0, "category": "earnings"},
+        {"type": "Provident Fund", "amount": 120.0, "category": "deductions"},
+    ]
+    await database.payslips.insert_many([
+        {"id": "p1", "employee_id": "e1", "month": "2025-01", "salary_types": salary_types},
+        {"id": "p2", "employee_id": "e2", "month": "2025-01", "salary_types": salary_types},
+        # Older payslip without a breakdown falls back to its stored totals
+        {"id": "p3", "employee_id": "e3", "month": "2025-01", "salary_types": [],
+         "basic_salary": 500.0, "allowances": 0.0, "deductions": 50.0},
+        {"id": "p4", "employee_id": "e1", "month": "2024-12", "salary_types": salary_types},
+    ])
+
+
+async def test_payroll_register_csv(client, admin_headers, database):
+    await seed_month(database)
+    response = await client.get("/api/reports/payroll-register", params={"month": "2025-01"}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["Department", "Employee ID", "Employee Name", "Allowances", "Basic Salary", "HRA",
+                       "Gross Earnings", "Deductions", "Provident Fund", "Total Deductions", "Net Pay"]
+    assert [row[:3] for row in rows[1:]] == [
+        ["Engineering", "EMP002", "Bo"],
+        ["Engineering", "EMP003", "Cy"],
+        ["Engineering", "", "Subtotal (2 employees)"],
+        ["Operations", "EMP001", "Asha"],
+        ["Operations", "", "Subtotal (1 employees)"],
+        ["Total", "", "3 employees"],
+    ]
+    assert rows[3][3:] == ["0.0", "1500.0", "400.0", "1900.0", "50.0", "120.0", "170.0", "1730.0"]
+    assert rows[-1][-1] == str(1280.0 * 2 + 450.0)
+
+
+async def test_payroll_register_xlsx(client, admin_headers, database):
+    await seed_month(database)
+    response = await client.get("/api/reports/payroll-register", params={"month": "2025-01", "format": "xlsx"},
+                                headers=admin_headers)
+    assert response.status_code == 200
+    sheet = load_workbook(io.BytesIO(response.content)).active
+    rows = list(sheet.values)
+    assert rows[0][:3] == ("Department", "Employee ID", "Employee Name")
+    assert rows[-1][0] == "Total" and rows[-1][-1] == 3010.0
+
+
+async def test_payroll_register_rejects_bad_month(client, admin_headers):
+    response = await client.get("/api/reports/payroll-register", params={"month": "2025-13"}, headers=admin_headers)
+    assert response.status_code == 422
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def count_queries(coro):
+    stats = server.DBRequestStats()
+    token = server.db_request_stats.set(stats)
+    try:
+        result = await coro
+    finally:
+        server.db_request_stats.reset(token)
+    return result, stats.queries
+
+
+async def test_concurrent_gets_share_one_query(database):
+    for i in range(3):
+        await database.departments.insert_one({"id": f"d{i}", "name": f"Dept {i}"})
+    repos = server.Repositories(cache_ttl=0)
+
+    async def load():
+        with server.loader_scope():
+            return await asyncio.gather(
+                repos.departments.get("d0"), repos.departments.get("d1"),
+                repos.departments.get("missing"), repos.departments.get_many(["d1", "d2"]),
+            )
+
+    (d0, d1, missing, many), queries = await count_queries(load())
+    assert (d0["name"], d1["name"], missing) == ("Dept 0", "Dept 1", None)
+    assert sorted(many) == ["d1", "d2"]
+    assert queries == 1
+
+
+async def test_loader_forgets_after_write(database):
+    await database.employees.insert_one({"id": "e1", "name": "Before"})
+    repos = server.Repositories(cache_ttl=0)
+    with server.loader_scope():
+        assert (await repos.employees.get("e1"))["name"] == "Before"
+        await repos.employees.update("e1", {"name": "After"})
+        assert (await repos.employees.get("e1"))["name"] == "After"
+
+
+async def test_reference_cache_reads_through_and_clears_on_write(database):
+    await database.holidays.insert_one({"id": "h1", "date": "2025-01-26", "name": "Republic Day"})
+    repos = server.Repositories(cache_ttl=60)
+
+    first, queries = await count_queries(repos.holidays.list_all())
+    assert queries == 1
+    first[0]["name"] = "mutated by caller"
+    second, queries = await count_queries(repos.holidays.list_all())
+    assert queries == 0
+    assert second[0]["name"] == "Republic Day"
+
+    await repos.holidays.insert({"id": "h2", "date": "2025-08-15", "name": "Independence Day"})
+    third, queries = await count_queries(repos.holidays.list_all())
+    assert queries == 1
+    assert [h["date"] for h in third] == ["2025-01-26", "2025-08-15"]
+
+
+async def test_for_user_links_profile_by_email(database):
+    await database.employees.insert_one({"id": "e1", "email": "asha@example.com", "user_id": None})
+    user = server.User(id="u1", email="asha@example.com", full_name="Asha", role="employee")
+
+    employee = await server.repos.employees.for_user(user)
+    assert employee["id"] == "e1"
+    assert (await database.employees.find_one({"id": "e1"}))["user_id"] == "u1"
+
+
+async def test_fetch_in_flight_across_a_write_is_not_cached(database, monkeypatch):
+    await database.departments.insert_one({"id": "d1", "name": "Old"})
+    repos = server.Repositories(cache_ttl=3600)
+    find = repos.departments._find
+    fetched, resume = asyncio.Event(), asyncio.Event()
+
+    async def slow_find(*args, **kwargs):
+        docs = await find(*args, **kwargs)
+        fetched.set()
+        await resume.wait()
+        return docs
+
+    async def list_names():
+        return [d["name"] for d in await repos.departments.list_all()]
+
+    async def get_name():
+        return [(await repos.departments.get("d1"))["name"]]
+
+    for read, name in ((list_names, "New"), (get_name, "Newer")):
+        fetched.clear()
+        resume.clear()
+        monkeypatch.setattr(repos.departments, "_find", slow_find)
+        stale = asyncio.ensure_future(read())
+        await fetched.wait()
+        await repos.departments.update("d1", {"name": name})
+        resume.set()
+        await stale
+        monkeypatch.setattr(repos.departments, "_find", find)
+        assert await read() == [name]
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+from prometheus_client import REGISTRY
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def flights(outcome):
+    return REGISTRY.get_sample_value("single_flight_requests_total", {"route": "test", "outcome": outcome}) or 0
+
+
+async def test_concurrent_identical_calls_share_one_flight():
+    flight = server.SingleFlight()
+    release = asyncio.Event()
+    calls = 0
+
+    async def produce():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return b"[]"
+
+    leaders, shared = flights("leader"), flights("shared")
+    waiting = [asyncio.ensure_future(flight.run(("k",), produce, "test")) for _ in range(5)]
+    other = asyncio.ensure_future(flight.run(("other",), produce, "test"))
+    await asyncio.sleep(0)
+    waiting[0].cancel()  # A leader's client going away doesn't cancel the flight for the rest
+    release.set()
+    assert await asyncio.gather(*waiting[1:], other) == [b"[]"] * 5
+    assert calls == 2
+    assert (flights("leader") - leaders, flights("shared") - shared) == (2, 4)
+
+    # Landed flights are forgotten: the next call fetches again
+    assert await flight.run(("k",), produce, "test") == b"[]"
+    assert calls == 3
+
+
+
+async def test_a_write_starts_a_fresh_flight(database, monkeypatch):
+    flight = server.SingleFlight()
+    monkeypatch.setattr(server, "single_flight", flight)
+    release = asyncio.Event()
+
+    async def produce():
+        seen = await database.holidays.count_documents({})
+        await release.wait()
+        return seen
+
+    before = asyncio.ensure_future(flight.run(("k",), produce, "test", ("holidays",)))
+    await asyncio.sleep(0.01)
+    await server.repos.holidays.insert({"id": "h1", "date": "2025-01-26", "name": "Republic Day"})
+    after = asyncio.ensure_future(flight.run(("k",), produce, "test", ("holidays",)))
+    await asyncio.sleep(0.01)
+    release.set()
+    assert (await before, await after) == (0, 1)
+
+async def test_coalesced_lists_keep_their_shape_and_headers(client, admin_headers, database):
+    await database.leave_policies.insert_one({
+        "id": "p1", "name": "Standard", "leave_types": [{"type": "Casual Leave", "days": 12}],
+        "created_at": "2025-01-01T00:00:00+00:00", "internal": "not in the model",
+    })
+    response = await client.get("/api/leave-policies", headers=admin_headers)
+    assert response.status_code == 200
+    assert "etag" in response.headers
+    assert json.loads(response.content) == [{
+        "id": "p1", "name": "Standard", "description": None, "created_at": "2025-01-01T00:00:00Z",
+        "leave_types": [{"type": "Casual Leave", "days": 12, "carry_forward_cap": 0}],
+    }]